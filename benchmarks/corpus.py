@@ -0,0 +1,135 @@
+"""
+Synthetic but realistic corpora for benchmarks: YouTube video items with the
+kind of names bes.clean has to deal with (tracklisting prefixes, [catalog]
+tags, PREMIERE prefixes, parentheses, auto-generated "- Topic" channels) and
+Spotify track items. Corpora are deterministic for a given seed.
+
+"""
+import random
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ter', 'son', 'de', 'vox', 'ri', 'an', 'ul',
+             'zen', 'bo', 'na', 'tek', 'fi', 'ra', 'dub', 'sol', 'mo', 'ek']
+MIX_NAMES = ['Original Mix', 'Remix', 'Dub', 'Edit', 'Rework', 'Extended Version']
+JUNK = ['Vinyl Only', 'unreleased', 'HD', '2021', 'Official Video']
+LABELS = ['Kalahari Oyster Cult', 'Timeless', 'Semantica', 'Delsin', 'Perlon']
+TITLE_SEPARATORS = [' - ', ' - ', ' - ', ' – ', ' ~ ', ' -- ']
+ARTIST_SEPARATORS = [' & ', ' x ']
+
+
+def _word(rng, n_min=2, n_max=4):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(n_min, n_max))).capitalize()
+
+
+def _artists(rng):
+    return [' '.join(_word(rng) for _ in range(rng.randint(1, 2)))
+            for _ in range(rng.choice([1, 1, 1, 2, 2, 3]))]
+
+
+def _title(rng):
+    title = ' '.join(_word(rng) for _ in range(rng.randint(1, 3)))
+    if rng.random() < 0.3:
+        title += f' ({rng.choice(MIX_NAMES)})'
+    return title
+
+
+def youtube_name(rng, artists, title):
+    """Decorate 'artists - title' the way video names are found in the wild."""
+    name = rng.choice(ARTIST_SEPARATORS).join(artists) + rng.choice(TITLE_SEPARATORS) + title
+    if rng.random() < 0.2:
+        name = f'{rng.choice("ABCD")}{rng.randint(1, 4)}. ' + name
+    if rng.random() < 0.3:
+        catalog = rng.choice([f'{_word(rng).upper()}{rng.randint(1, 999):03}', rng.choice(LABELS)])
+        name += f' [{catalog}]'
+    if rng.random() < 0.1:
+        name = rng.choice(['PREMIERE: ', 'premiere ', 'Premiere: ']) + name
+    if rng.random() < 0.2:
+        name += f' ({rng.choice(JUNK)})'
+    return name
+
+
+def youtube_items(n, seed=0):
+    """
+    Generate `n` YouTube playlistItems JSON items.
+
+    Returns
+    -------
+    items : list of dict
+    """
+    rng = random.Random(seed)
+    items = []
+    for i in range(n):
+        artists, title = _artists(rng), _title(rng)
+        if rng.random() < 0.15:
+            # auto-generated YouTube Music channel
+            channel, name = f'{artists[0]} - Topic', title
+        else:
+            channel, name = _word(rng) + ' Records', youtube_name(rng, artists, title)
+        items.append({
+            'snippet': {'title': name, 'videoOwnerChannelTitle': channel},
+            'contentDetails': {'videoId': f'{i:011d}'},
+        })
+    return items
+
+
+def spotify_items(n, seed=0):
+    """
+    Generate `n` Spotify playlist track JSON items.
+
+    Returns
+    -------
+    items : list of dict
+    """
+    rng = random.Random(seed)
+    items = []
+    for i in range(n):
+        items.append({
+            'added_at': '2021-04-27T00:00:00Z',
+            'track': {
+                'id': f'{i:022d}',
+                'name': _title(rng),
+                'artists': [{'name': artist, 'id': f'{rng.getrandbits(64):022d}'}
+                            for artist in _artists(rng)],
+                'duration_ms': rng.randint(120000, 720000),
+                'popularity': rng.randint(0, 100),
+                'album': {
+                    'name': _word(rng),
+                    'release_date': f'{rng.randint(1985, 2021)}-01-01',
+                },
+            },
+        })
+    return items
+
+
+def catalog(n, seed=0):
+    """
+    Generate a catalog of `n` songs available on both backends, to back
+    simulated services (see benchmarks/simulator.py): each song has a YouTube
+    video (with a decorated name) and a Spotify track.
+
+    Returns
+    -------
+    songs : list of dict
+        Songs with 'video' (id, title and channel of the video) and 'track'
+        (Spotify track JSON) keys.
+    """
+    rng = random.Random(seed)
+    songs = []
+    for i in range(n):
+        artists, title = _artists(rng), _title(rng)
+        if rng.random() < 0.15:
+            channel, name = f'{artists[0]} - Topic', title
+        else:
+            channel, name = _word(rng) + ' Records', youtube_name(rng, artists, title)
+        songs.append({
+            'video': {'id': f'v{i:010d}', 'title': name, 'channel': channel},
+            'track': {
+                'id': f'{i:022d}',
+                'uri': f'spotify:track:{i:022d}',
+                'name': title,
+                'artists': [{'name': artist} for artist in artists],
+                'duration_ms': rng.randint(120000, 720000),
+                'popularity': rng.randint(0, 100),
+                'album': {'name': _word(rng), 'release_date': f'{rng.randint(1985, 2021)}-01-01'},
+            },
+        })
+    return songs
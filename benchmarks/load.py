@@ -0,0 +1,213 @@
+"""
+End-to-end load benchmark: drive the real Channel / PlayList code against
+the simulated services of benchmarks/simulator.py and report throughput
+against concurrency. Scenarios:
+  * fetch: list the playlists of both channels then fetch all their tracks
+    (bes.sync.fetch_playlists).
+  * sync: mirror every YouTube playlist to a Spotify playlist of the same
+    name (bes.sync.sync_playlists), searching and adding tracks.
+
+Each run starts from fresh services, so runs do not influence each other.
+
+    python -m benchmarks.load --concurrency 1,2,4,8,16 --latency 0.05
+    python -m benchmarks.load --scenarios sync --rate_limit 50 --output load.json
+
+"""
+import json
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import fire
+
+import bes.index
+import bes.journal
+from bes import hedging, singleflight
+from bes.channel import SpotifyChannel, YouTubeChannel
+from bes.metrics import METRICS
+from bes.sync import fetch_playlists, sync_playlists
+from benchmarks import simulator
+
+
+def _as_list(value, cast):
+    if isinstance(value, str):
+        return [cast(item) for item in value.split(',')]
+    if isinstance(value, (list, tuple)):
+        return [cast(item) for item in value]
+    return [cast(value)]
+
+
+def _fetch(max_workers):
+    youtube_channel, spotify_channel = YouTubeChannel(), SpotifyChannel()
+    playlists = list(youtube_channel.playlists) + list(spotify_channel.playlists)
+    fetch_playlists(playlists, max_workers=max_workers)
+    return sum(len(playlist) for playlist in playlists)
+
+
+def _sync(max_workers):
+    youtube_channel, spotify_channel = YouTubeChannel(readonly=False), SpotifyChannel()
+    mapping = [(playlist, spotify_channel.get(playlist.name))
+               for playlist in list(youtube_channel.playlists)]
+    return sync_playlists(mapping, resume=False, max_workers=max_workers)['source tracks']
+
+
+SCENARIOS = {
+    'fetch': _fetch,
+    'sync': _sync,
+}
+
+
+def run(scenario, library, max_workers, hedge=None, **kwargs):
+    """
+    Run one scenario against fresh simulated services.
+
+    Parameters
+    ----------
+    scenario : str
+        Name of scenario, see SCENARIOS.
+    library : benchmarks.simulator.Library
+        Library backing the services.
+    max_workers : int
+        Concurrency passed to bes.
+    hedge : dict, optional
+        Enable hedged requests with these arguments, see bes.hedging.
+    kwargs
+        Configuration of the services, see simulator.SimulatedService.
+
+    Returns
+    -------
+    result : dict
+        Wall time, tracks processed and throughput, requests and error
+        responses seen by the services, client side latency and requests
+        coalesced (see bes.singleflight).
+
+    """
+    METRICS.reset()
+    # fresh group, to count the requests coalesced by this run only
+    singleflight.enable()
+    if hedge is not None:
+        hedging.enable(**hedge)
+    with simulator.running(library, **kwargs) as services:
+        simulator.install(*services)
+        start = time.perf_counter()
+        error = None
+        try:
+            tracks = SCENARIOS[scenario](max_workers)
+        except Exception as e:
+            # e.g. quota exceeded, still report how far we got
+            tracks, error = None, repr(e)
+        seconds = time.perf_counter() - start
+        hedges = hedging.HEDGER.stats() if hedging.HEDGER is not None else None
+        hedging.disable()
+
+    requests = sum(sum(service.requests.values()) for service in services)
+    responses = sum((service.responses for service in services), Counter())
+    histograms = METRICS.snapshot()['histograms']
+    calls = sum(histogram['count'] for histogram in histograms.values())
+    latency = sum(histogram['sum'] for histogram in histograms.values())
+    return {
+        'scenario': scenario,
+        'concurrency': max_workers,
+        'seconds': seconds,
+        'tracks': tracks,
+        'tracks per second': tracks / seconds if tracks else 0.,
+        'requests': requests,
+        'requests per second': requests / seconds,
+        'throttled': responses.get(429, 0),
+        'quota exceeded': responses.get(403, 0),
+        'youtube quota': services[1].quota_used,
+        'mean call latency': latency / calls if calls else None,
+        'hedges': hedges,
+        'coalesced': singleflight.GROUP.stats(),
+        'error': error,
+    }
+
+
+def main(songs=20000, playlists=10, playlist_size=500, saved_tracks=0,
+         scenarios='fetch,sync', concurrency='1,2,4,8,16', latency=0.05,
+         distribution='lognormal', sigma=0.5, rate_limit=None, throttle_rate=0.,
+         retry_after=1, quota=None, hedge=False, hedge_percentile=0.95, hedge_budget=0.05,
+         seed=0, output=None, verbosity='WARNING'):
+    """
+    Run load benchmarks against simulated services.
+
+    Parameters
+    ----------
+    songs : int, default=20000
+        Catalog size.
+    playlists : int, default=10
+        Number of YouTube playlists.
+    playlist_size : int, default=500
+        Number of videos per YouTube playlist.
+    saved_tracks : int, default=0
+        Number of Spotify saved tracks.
+    scenarios : str, default='fetch,sync'
+        Comma separated names of scenarios to run, see SCENARIOS.
+    concurrency : str, default='1,2,4,8,16'
+        Comma separated concurrency levels (max_workers) to run each scenario at.
+    latency : float, default=0.05
+        Median latency of requests in seconds.
+    distribution : str, default='lognormal'
+        Latency distribution, see simulator.Latency.
+    sigma : float, default=0.5
+        Shape of the lognormal latency distribution.
+    rate_limit : float, optional
+        Requests per second allowed per service before answering 429.
+    throttle_rate : float, default=0.
+        Fraction of requests answered with 429 at random.
+    retry_after : int, default=1
+        Retry-After of 429 responses, in seconds.
+    quota : int, optional
+        YouTube quota points available.
+    hedge : bool, default=False
+        Hedge lookups, see bes.hedging.
+    hedge_percentile : float, default=0.95
+        Latency percentile after which lookups are hedged.
+    hedge_budget : float, default=0.05
+        Maximum fraction of extra lookup requests.
+    seed : int, default=0
+        Seed of the library and of the fault injection.
+    output : str, optional
+        Path of JSON file to write results to.
+    verbosity : str, default='WARNING'
+        Logging level of bes.
+
+    """
+    bes.set_verbosity(verbosity)
+    # keep journals and indexes of benchmark runs out of the repository
+    state_dir = Path(tempfile.mkdtemp())
+    bes.journal.JOURNAL_DIR = state_dir / 'journals'
+    bes.index.INDEX_DIR = state_dir / 'index'
+    library = simulator.Library(songs=songs, playlists=playlists, playlist_size=playlist_size,
+                                saved_tracks=saved_tracks, seed=seed)
+
+    results = []
+    for scenario in _as_list(scenarios, str):
+        for max_workers in _as_list(concurrency, int):
+            result = run(
+                scenario, library, max_workers,
+                latency=simulator.Latency(latency, distribution, sigma, seed=seed),
+                rate_limit=rate_limit, throttle_rate=throttle_rate,
+                retry_after=retry_after, quota=quota, seed=seed,
+                hedge={'percentile': hedge_percentile, 'budget': hedge_budget} if hedge else None,
+            )
+            results.append(result)
+            print(f'{scenario:8} x{max_workers:<3} {result["seconds"]:8.2f} s '
+                  f'{result["tracks per second"]:10.1f} tracks/s '
+                  f'{result["requests per second"]:8.1f} req/s '
+                  f'{result["throttled"]:6} throttled'
+                  + ''.join(f'  {name}: {stats["wins"]}/{stats["hedges"]} hedges won'
+                            for name, stats in (result['hedges'] or {}).items())
+                  + (f'  {sum(result["coalesced"].values())} coalesced' if result['coalesced'] else '')
+                  + (f'  {result["error"]}' if result['error'] else ''))
+
+    if output is not None:
+        with open(output, 'w') as handle:
+            json.dump({'library': {'songs': songs, 'playlists': playlists,
+                                   'playlist size': playlist_size},
+                       'results': results}, handle, indent=2)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
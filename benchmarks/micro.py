@@ -0,0 +1,147 @@
+"""
+Microbenchmarks of the hot paths of parsing, scoring and track construction,
+over synthetic corpora (see benchmarks/corpus.py). Results are written as JSON
+so that runs can be compared to spot regressions:
+
+    python -m benchmarks.micro --n 100000 --output before.json
+    python -m benchmarks.micro --n 100000 --output after.json --baseline before.json
+
+"""
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+import fire
+
+from bes import REPO_ROOT
+from bes.clean import clean, split_artists, split_artists_from_title
+from bes.score import get_risk_score
+from bes.track import SpotifyTrack, YouTubeTrack
+from benchmarks.corpus import spotify_items, youtube_items
+
+
+def _from_items(cls, items):
+    tracks = []
+    for item in items:
+        try:
+            tracks.append(cls.from_item(item))
+        except ValueError:
+            continue
+    return tracks
+
+
+def _get_benchmarks(n, seed):
+    """Benchmark name -> (function applied to each input, inputs)."""
+    youtube = youtube_items(n, seed=seed)
+    spotify = spotify_items(n, seed=seed)
+    youtube_tracks = _from_items(YouTubeTrack, youtube)
+    spotify_tracks = _from_items(SpotifyTrack, spotify)
+    return {
+        'clean': (clean, [item['snippet']['title'] for item in youtube]),
+        'split_artists_from_title': (
+            split_artists_from_title, youtube_tracks),
+        'split_artists': (
+            split_artists, [' & '.join(track.artists) for track in spotify_tracks]),
+        'get_risk_score': (
+            lambda pair: get_risk_score(*pair), list(zip(youtube_tracks, spotify_tracks))),
+        'YouTubeTrack.from_item': (YouTubeTrack.from_item, youtube),
+        'SpotifyTrack.from_item': (SpotifyTrack.from_item, spotify),
+    }
+
+
+def _time(function, inputs, repeat):
+    """Time one pass of function over inputs, `repeat` times."""
+    timings = []
+    for _ in range(repeat):
+        errors = 0
+        start = time.perf_counter()
+        for value in inputs:
+            try:
+                function(value)
+            except ValueError:
+                # unparsable titles are part of the workload
+                errors += 1
+        timings.append(time.perf_counter() - start)
+    return timings, errors
+
+
+def _get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(n=100000, repeat=5, seed=0, output=None, baseline=None, only=None,
+         tolerance=0.1):
+    """
+    Run microbenchmarks.
+
+    Parameters
+    ----------
+    n : int, default=100000
+        Corpus size.
+    repeat : int, default=5
+        Number of passes over the corpus per benchmark, the best is reported.
+    seed : int, default=0
+        Corpus seed.
+    output : str, optional
+        Path of JSON file to write results to.
+    baseline : str, optional
+        Path of JSON results of a previous run to compare to.
+    only : str, optional
+        Comma separated names of benchmarks to run, all by default.
+    tolerance : float, default=0.1
+        Relative slowdown compared to baseline reported as regression.
+
+    """
+    benchmarks = _get_benchmarks(n, seed)
+    if only is not None:
+        names = only.split(',') if isinstance(only, str) else list(only)
+        benchmarks = {name: benchmarks[name] for name in names}
+
+    results = {
+        'commit': _get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'n': n,
+        'repeat': repeat,
+        'seed': seed,
+        'benchmarks': {},
+    }
+    for name, (function, inputs) in benchmarks.items():
+        timings, errors = _time(function, inputs, repeat)
+        best = min(timings)
+        results['benchmarks'][name] = {
+            'inputs': len(inputs),
+            'errors': errors,
+            'best': best,
+            'median': statistics.median(timings),
+            'ns per item': best / max(len(inputs), 1) * 1e9,
+            'items per second': len(inputs) / best if best else None,
+        }
+        print(f'{name:28} {results["benchmarks"][name]["ns per item"]:10.0f} ns/item '
+              f'({len(inputs)} inputs, {errors} errors)')
+
+    if baseline is not None:
+        with open(baseline, 'r') as handle:
+            previous = json.load(handle)['benchmarks']
+        for name, result in results['benchmarks'].items():
+            if name not in previous:
+                continue
+            ratio = result['ns per item'] / previous[name]['ns per item']
+            result['ratio to baseline'] = ratio
+            flag = '  <- regression' if ratio > 1 + tolerance else ''
+            print(f'{name:28} x{ratio:.2f} vs baseline{flag}')
+
+    if output is not None:
+        with open(output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
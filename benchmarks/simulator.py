@@ -0,0 +1,570 @@
+"""
+Local stand-ins for the Spotify Web API and the YouTube Data API, to exercise
+bes at scale (concurrency, rate limiting, pagination) without touching the
+real services nor spending quota. Only the subset of endpoints used by bes is
+implemented, backed by a synthetic catalog of any size (see
+benchmarks/corpus.py). Each service can be configured with:
+  * a latency distribution (constant, uniform or lognormal),
+  * a rate limit (requests per second) answered with 429 and Retry-After,
+  * random 429 injection,
+  * a YouTube quota (points) answered with 403 quotaExceeded once spent.
+
+The real clients (spotipy and googleapiclient) talk to the simulators over
+HTTP, so everything from bes.api down is exercised as in production.
+
+Example
+-------
+from benchmarks import simulator
+library = simulator.Library(songs=10000, playlists=10, playlist_size=500)
+with simulator.running(library, latency=simulator.Latency(0.05)) as (spotify, youtube):
+    simulator.install(spotify, youtube)
+    channel = YouTubeChannel()
+    ...
+
+"""
+import contextlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import google.oauth2.credentials
+import googleapiclient.discovery
+import spotipy
+
+from bes import api
+from benchmarks.corpus import catalog
+
+SPOTIFY_USER_ID = 'simulated-user'
+
+
+class Latency(object):
+    """
+    Latency distribution of simulated requests.
+
+    Parameters
+    ----------
+    median : float, default=0.
+        Median latency in seconds.
+    distribution : str, default='lognormal'
+        One of 'constant', 'uniform' (between 0 and twice the median) or
+        'lognormal' (heavy tailed, like real services).
+    sigma : float, default=0.5
+        Shape of the lognormal distribution, larger means heavier tail.
+    seed : int, optional
+        Seed of the random generator.
+
+    """
+    def __init__(self, median=0., distribution='lognormal', sigma=0.5, seed=None):
+        if distribution not in ('constant', 'uniform', 'lognormal'):
+            raise ValueError(f'unknown latency distribution {distribution}')
+        self.median = median
+        self.distribution = distribution
+        self.sigma = sigma
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        if self.median <= 0 or self.distribution == 'constant':
+            return self.median
+        with self._lock:
+            if self.distribution == 'uniform':
+                return self._rng.uniform(0, 2 * self.median)
+            return self.median * math.exp(self.sigma * self._rng.gauss(0, 1))
+
+
+class Library(object):
+    """
+    Synthetic music library: a catalog of songs available on both backends,
+    YouTube playlists drawn from the catalog, and Spotify saved tracks.
+
+    Parameters
+    ----------
+    songs : int, default=10000
+        Catalog size.
+    playlists : int, default=10
+        Number of YouTube playlists.
+    playlist_size : int, default=200
+        Number of videos per YouTube playlist.
+    saved_tracks : int, default=0
+        Number of Spotify saved (liked) tracks.
+    overlap : float, default=0.2
+        Fraction of the videos of each playlist drawn from a pool shared by
+        all playlists (the same track appearing in several playlists).
+    seed : int, default=0
+
+    """
+    def __init__(self, songs=10000, playlists=10, playlist_size=200, saved_tracks=0,
+                 overlap=0.2, seed=0):
+        self.songs = catalog(songs, seed=seed)
+        rng = random.Random(seed)
+        shared = rng.sample(range(songs), min(playlist_size, songs))
+        self.playlists = {}
+        for i in range(playlists):
+            n_shared = round(playlist_size * overlap)
+            indices = rng.sample(shared, min(n_shared, len(shared)))
+            indices += rng.sample(range(songs), min(playlist_size - len(indices), songs))
+            self.playlists[f'PL{i:08d}'] = {
+                'name': f'playlist {i}',
+                'videos': [self.songs[index]['video']['id'] for index in dict.fromkeys(indices)],
+            }
+        self.saved_tracks = [song['track']['id'] for song in rng.sample(self.songs, saved_tracks)]
+
+        self.videos = {song['video']['id']: song['video'] for song in self.songs}
+        self.tracks = {song['track']['id']: song['track'] for song in self.songs}
+        # inverted index of lowercase words, for search
+        self._index = {'youtube': defaultdict(list), 'spotify': defaultdict(list)}
+        for i, song in enumerate(self.songs):
+            for word in set(_words(song['video']['title'] + ' ' + song['video']['channel'])):
+                self._index['youtube'][word].append(i)
+            track = song['track']
+            for word in set(_words(' '.join(a['name'] for a in track['artists']) + ' ' + track['name'])):
+                self._index['spotify'][word].append(i)
+
+    def search(self, backend, query, limit):
+        """Songs sharing the most words with the query, best first."""
+        counts = Counter()
+        for word in set(_words(query)):
+            counts.update(self._index[backend].get(word, ()))
+        return [self.songs[i] for i, _ in counts.most_common(limit)]
+
+
+def _words(string):
+    return re.findall(r'\w+', string.lower())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, avoid delayed ACK stalls
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method):
+        service = self.server.service
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        status, headers, response = service.handle(method, url.path, query, body)
+        payload = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class SimulatedService(object):
+    """
+    Base class of simulated services: HTTP server, routing, latency and
+    fault injection. Subclasses define `routes`, a list of (method, path
+    regex, handler method name) and `costs`, the quota cost per handler.
+
+    Parameters
+    ----------
+    library : benchmarks.simulator.Library
+        Library backing the service.
+    latency : benchmarks.simulator.Latency, optional
+        Latency distribution, no latency by default.
+    rate_limit : float, optional
+        Maximum number of requests per second, requests above it are answered
+        with 429 Too Many Requests.
+    throttle_rate : float, default=0.
+        Fraction of requests answered with 429 at random.
+    retry_after : int, default=1
+        Retry-After header (seconds) of 429 responses.
+    quota : int, optional
+        Quota points available, requests are answered with 403 once spent.
+    seed : int, default=0
+
+    Attributes
+    ----------
+    requests : collections.Counter
+        Number of requests per handler.
+    responses : collections.Counter
+        Number of responses per status code.
+    quota_used : int
+        Quota points spent.
+
+    """
+    backend = None
+    routes = []
+    costs = {}
+
+    def __init__(self, library, latency=None, rate_limit=None, throttle_rate=0.,
+                 retry_after=1, quota=None, seed=0):
+        self.library = library
+        self.latency = latency or Latency()
+        self.rate_limit = rate_limit
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.quota = quota
+        self.requests = Counter()
+        self.responses = Counter()
+        self.quota_used = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = []
+        self._routes = [(method, re.compile(path + '$'), name) for method, path, name in self.routes]
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.service = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _throttled(self):
+        """Whether the current request exceeds the rate limit."""
+        with self._lock:
+            if self._rng.random() < self.throttle_rate:
+                return True
+            if self.rate_limit is None:
+                return False
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.]
+            if len(self._window) >= self.rate_limit:
+                return True
+            self._window.append(now)
+            return False
+
+    def _spend(self, name):
+        """Spend quota of request, False if there is not enough left."""
+        cost = self.costs.get(name, 0)
+        with self._lock:
+            if self.quota is not None and self.quota_used + cost > self.quota:
+                return False
+            self.quota_used += cost
+            return True
+
+    def handle(self, method, path, query, body):
+        """Route request, returns status, headers and response JSON."""
+        time.sleep(self.latency.sample())
+        for route_method, regex, name in self._routes:
+            match = regex.match(path)
+            if route_method == method and match:
+                break
+        else:
+            return self._respond(404, {}, self._error(404, f'no route for {method} {path}'))
+        with self._lock:
+            self.requests[name] += 1
+        if self._throttled():
+            return self._respond(429, {'Retry-After': str(self.retry_after)},
+                                 self._error(429, 'rate limit exceeded', 'rateLimitExceeded'))
+        if not self._spend(name):
+            return self._respond(403, {}, self._error(403, 'quota exceeded', 'quotaExceeded'))
+        try:
+            response = getattr(self, name)(*match.groups(), query=query, body=body)
+        except KeyError as e:
+            return self._respond(404, {}, self._error(404, f'not found: {e}'))
+        return self._respond(200, {}, response)
+
+    def _respond(self, status, headers, response):
+        with self._lock:
+            self.responses[status] += 1
+        return status, headers, response
+
+    def _error(self, code, message, reason=None):
+        # understood by both spotipy (reason) and googleapiclient (errors)
+        return {'error': {'code': code, 'message': message, 'reason': reason,
+                          'errors': [{'reason': reason, 'message': message}]}}
+
+
+class SpotifySimulator(SimulatedService):
+    """
+    Simulated Spotify Web API: user playlists, playlist items (list, add,
+    reorder), saved tracks, search, tracks and audio features lookups. See
+    SimulatedService for parameters.
+
+    """
+    backend = 'spotify'
+    routes = [
+        ('GET', r'/v1/users/([^/]+)/playlists', 'user_playlists'),
+        ('POST', r'/v1/users/([^/]+)/playlists', 'user_playlist_create'),
+        ('GET', r'/v1/playlists/([^/]+)/(?:tracks|items)', 'playlist_items'),
+        ('POST', r'/v1/playlists/([^/]+)/(?:tracks|items)', 'playlist_add_items'),
+        ('PUT', r'/v1/playlists/([^/]+)/(?:tracks|items)', 'playlist_reorder_items'),
+        ('GET', r'/v1/me/tracks', 'current_user_saved_tracks'),
+        ('GET', r'/v1/search', 'search'),
+        ('GET', r'/v1/tracks/?', 'tracks'),
+        ('GET', r'/v1/audio-features/?', 'audio_features'),
+    ]
+
+    def __init__(self, library, **kwargs):
+        super().__init__(library, **kwargs)
+        self.playlists = {}
+
+    def _page(self, items, query):
+        limit, offset = int(query.get('limit', 20)), int(query.get('offset', 0))
+        return {'items': items[offset:offset + limit], 'total': len(items),
+                'limit': limit, 'offset': offset}
+
+    def _playlist(self, id):
+        playlist = self.playlists[id]
+        return {'id': id, 'name': playlist['name'], 'tracks': {'total': len(playlist['tracks'])},
+                'snapshot_id': str(playlist['snapshot'])}
+
+    def user_playlists(self, user, query, body):
+        with self._lock:
+            return self._page([self._playlist(id) for id in self.playlists], query)
+
+    def user_playlist_create(self, user, query, body):
+        with self._lock:
+            id = f'SP{len(self.playlists):08d}'
+            self.playlists[id] = {'name': body['name'], 'tracks': [], 'snapshot': 0}
+            return self._playlist(id)
+
+    def playlist_items(self, id, query, body):
+        with self._lock:
+            ids = list(self.playlists[id]['tracks'])
+        return self._page([{'track': self.library.tracks[id]} for id in ids], query)
+
+    def playlist_add_items(self, id, query, body):
+        ids = [uri.rsplit(':', 1)[-1] for uri in body]
+        with self._lock:
+            playlist = self.playlists[id]
+            position = int(query.get('position', len(playlist['tracks'])))
+            playlist['tracks'][position:position] = ids
+            playlist['snapshot'] += 1
+            return {'snapshot_id': str(playlist['snapshot'])}
+
+    def playlist_reorder_items(self, id, query, body):
+        with self._lock:
+            playlist = self.playlists[id]
+            tracks = playlist['tracks']
+            start, length = body['range_start'], body.get('range_length', 1)
+            before = body['insert_before']
+            moved = tracks[start:start + length]
+            del tracks[start:start + length]
+            before -= length if before > start else 0
+            tracks[before:before] = moved
+            playlist['snapshot'] += 1
+            return {'snapshot_id': str(playlist['snapshot'])}
+
+    def current_user_saved_tracks(self, query, body):
+        items = [{'track': self.library.tracks[id]} for id in self.library.saved_tracks]
+        return self._page(items, query)
+
+    def search(self, query, body):
+        limit = int(query.get('limit', 10))
+        songs = self.library.search('spotify', query.get('q', ''), limit)
+        return {'tracks': {'items': [song['track'] for song in songs], 'total': len(songs)}}
+
+    def tracks(self, query, body):
+        return {'tracks': [self.library.tracks.get(id) for id in query['ids'].split(',')]}
+
+    def audio_features(self, query, body):
+        features = []
+        for id in query['ids'].split(','):
+            if id not in self.library.tracks:
+                features.append(None)
+                continue
+            rng = random.Random(id)
+            features.append({
+                'id': id,
+                'tempo': round(rng.uniform(70, 180), 3),
+                'energy': round(rng.random(), 3),
+                'danceability': round(rng.random(), 3),
+                'valence': round(rng.random(), 3),
+                'key': rng.randint(0, 11),
+                'mode': rng.randint(0, 1),
+                'duration_ms': self.library.tracks[id]['duration_ms'],
+            })
+        return {'audio_features': features}
+
+
+class YouTubeSimulator(SimulatedService):
+    """
+    Simulated YouTube Data API: playlists (list, insert), playlist items
+    (list, insert, update) and search, with page tokens and quota costs of
+    the real API (see bes.api.YOUTUBE_QUOTA_COSTS). See SimulatedService for
+    parameters.
+
+    """
+    backend = 'youtube'
+    routes = [
+        ('GET', r'/youtube/v3/playlists', 'playlists_list'),
+        ('POST', r'/youtube/v3/playlists', 'playlists_insert'),
+        ('GET', r'/youtube/v3/playlistItems', 'playlist_items_list'),
+        ('POST', r'/youtube/v3/playlistItems', 'playlist_items_insert'),
+        ('PUT', r'/youtube/v3/playlistItems', 'playlist_items_update'),
+        ('GET', r'/youtube/v3/search', 'search_list'),
+    ]
+    costs = {
+        'playlists_list': api.YOUTUBE_QUOTA_COSTS['playlists.list'],
+        'playlists_insert': api.YOUTUBE_QUOTA_COSTS['playlists.insert'],
+        'playlist_items_list': api.YOUTUBE_QUOTA_COSTS['playlistItems.list'],
+        'playlist_items_insert': api.YOUTUBE_QUOTA_COSTS['playlistItems.insert'],
+        'playlist_items_update': api.YOUTUBE_QUOTA_COSTS['playlistItems.update'],
+        'search_list': api.YOUTUBE_QUOTA_COSTS['search.list'],
+    }
+
+    def __init__(self, library, **kwargs):
+        super().__init__(library, **kwargs)
+        self._n_items = 0
+        # playlist ID -> name and list of (playlist item ID, video ID)
+        self.playlists = {}
+        for id, playlist in library.playlists.items():
+            self.playlists[id] = {'name': playlist['name'],
+                                  'items': [(self._item_id(), video) for video in playlist['videos']]}
+
+    def _item_id(self):
+        self._n_items += 1
+        return f'PLI{self._n_items:010d}'
+
+    def _page(self, items, query):
+        limit = int(query.get('maxResults', 5))
+        offset = int(query.get('pageToken') or 0)
+        response = {'items': items[offset:offset + limit],
+                    'pageInfo': {'totalResults': len(items), 'resultsPerPage': limit}}
+        if offset + limit < len(items):
+            response['nextPageToken'] = str(offset + limit)
+        return response
+
+    def _playlist(self, id):
+        playlist = self.playlists[id]
+        return {'kind': 'youtube#playlist', 'id': id,
+                'snippet': {'title': playlist['name'], 'localized': {'title': playlist['name']}},
+                'contentDetails': {'itemCount': len(playlist['items'])}}
+
+    def _playlist_item(self, playlist_id, position, item_id, video_id):
+        video = self.library.videos[video_id]
+        return {
+            'kind': 'youtube#playlistItem',
+            'id': item_id,
+            'snippet': {
+                'playlistId': playlist_id,
+                'position': position,
+                'title': video['title'],
+                'videoOwnerChannelTitle': video['channel'],
+                'resourceId': {'kind': 'youtube#video', 'videoId': video_id},
+            },
+            'contentDetails': {'videoId': video_id},
+        }
+
+    def playlists_list(self, query, body):
+        with self._lock:
+            return self._page([self._playlist(id) for id in self.playlists], query)
+
+    def playlists_insert(self, query, body):
+        with self._lock:
+            id = f'PL{len(self.playlists):08d}'
+            self.playlists[id] = {'name': body['snippet']['title'], 'items': []}
+            return self._playlist(id)
+
+    def playlist_items_list(self, query, body):
+        id = query['playlistId']
+        with self._lock:
+            items = list(self.playlists[id]['items'])
+        return self._page([self._playlist_item(id, position, *item)
+                           for position, item in enumerate(items)], query)
+
+    def playlist_items_insert(self, query, body):
+        snippet = body['snippet']
+        id, video_id = snippet['playlistId'], snippet['resourceId']['videoId']
+        if video_id not in self.library.videos:
+            raise KeyError(video_id)
+        with self._lock:
+            items = self.playlists[id]['items']
+            position = snippet.get('position', len(items))
+            item = (self._item_id(), video_id)
+            items.insert(position, item)
+            return self._playlist_item(id, position, *item)
+
+    def playlist_items_update(self, query, body):
+        snippet = body['snippet']
+        id = snippet['playlistId']
+        with self._lock:
+            items = self.playlists[id]['items']
+            index = [item_id for item_id, _ in items].index(body['id'])
+            item = items.pop(index)
+            position = snippet.get('position', index)
+            items.insert(position, item)
+            return self._playlist_item(id, position, *item)
+
+    def search_list(self, query, body):
+        limit = int(query.get('maxResults', 5))
+        songs = self.library.search('youtube', query.get('q', ''), limit)
+        return {'items': [{
+            'kind': 'youtube#searchResult',
+            'id': {'kind': 'youtube#video', 'videoId': song['video']['id']},
+            'snippet': {'title': song['video']['title'], 'channelTitle': song['video']['channel']},
+        } for song in songs]}
+
+
+def spotify_client(service):
+    """spotipy client talking to a simulated Spotify service."""
+    client = spotipy.Spotify(auth='simulated-token', retries=10, status_retries=10,
+                             backoff_factor=0.1)
+    client.prefix = service.url + '/v1/'
+    return client
+
+
+def youtube_client(service):
+    """googleapiclient YouTube client talking to a simulated YouTube service."""
+    credentials = google.oauth2.credentials.Credentials('simulated-token')
+    return googleapiclient.discovery.build(
+        api.YOUTUBE_API_SERVICE_NAME, api.YOUTUBE_API_VERSION, credentials=credentials,
+        client_options={'api_endpoint': service.url + '/'}, cache_discovery=False,
+    )
+
+
+def install(spotify, youtube):
+    """Point the module level API endpoints of bes.api to the simulators."""
+    api.SPOTIFY_API = api.InstrumentedSpotify(spotify_client(spotify))
+    client = youtube_client(youtube)
+    api.YOUTUBE_API = {True: client, False: client}
+    api.SPOTIFY_USER_ID = SPOTIFY_USER_ID
+
+
+@contextlib.contextmanager
+def running(library, **kwargs):
+    """
+    Context manager running simulated Spotify and YouTube services backed by
+    `library`, configured with `kwargs` (see SimulatedService).
+
+    Yields
+    ------
+    spotify, youtube : SpotifySimulator, YouTubeSimulator
+    """
+    spotify = SpotifySimulator(library, **kwargs).start()
+    youtube = YouTubeSimulator(library, **kwargs).start()
+    try:
+        yield spotify, youtube
+    finally:
+        spotify.stop()
+        youtube.stop()
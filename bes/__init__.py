@@ -1,3 +1,17 @@
+import logging
 from pathlib import Path
 
 REPO_ROOT = Path(__file__).parent.parent
+# local persistent state (job journals, caches)
+CACHE_DIR = REPO_ROOT / '.bes'
+
+
+def set_verbosity(level='INFO'):
+    """
+    Set logging level of the bes package: 'INFO' reports progress and
+    summaries, 'DEBUG' reports every track searched and every candidate
+    scored, 'WARNING' only reports problems.
+
+    """
+    logging.basicConfig(format='%(message)s')
+    logging.getLogger('bes').setLevel(level)
@@ -1,17 +1,30 @@
 
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
 import os
+import threading
+import time
+import urllib.parse
 
+import google_auth_httplib2
 import google_auth_oauthlib.flow
 import googleapiclient.discovery
 import googleapiclient.errors
+import httplib2
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 
-from bes import REPO_ROOT
+from bes import CACHE_DIR, REPO_ROOT, deadline, hedging, singleflight
+from bes.metrics import METRICS
 
 
 YOUTUBE_API = {}
 SPOTIFY_API = None
+# account of the current context if any, see use_account
+_ACCOUNT = contextvars.ContextVar('account', default=None)
 
 
 ###############################################################################
@@ -28,6 +41,16 @@ YOUTUBE_CLIENT_SECRETS_FILE = REPO_ROOT / f'{os.getenv("YOUTUBE_CLIENT_SECRETS_F
 SCOPES = ["https://www.googleapis.com/auth/youtube.readonly",
           "https://www.googleapis.com/auth/youtube"]
 
+# https://developers.google.com/youtube/v3/determine_quota_cost
+YOUTUBE_QUOTA_COSTS = {
+    'playlists.list': 1,
+    'playlists.insert': 50,
+    'playlistItems.list': 1,
+    'playlistItems.insert': 50,
+    'playlistItems.update': 50,
+    'search.list': 100,
+}
+
 
 def create_youtube_api(readonly=True):
     """
@@ -55,13 +78,91 @@ def create_youtube_api(readonly=True):
 
 
 def get_or_create_youtube_api(readonly=True):
-    """Get existing API endpoint or create one if not."""
+    """
+    Get existing API endpoint or create one if not. Within use_account, the
+    endpoint of the account is returned instead.
+
+    """
     global YOUTUBE_API
+    account = _ACCOUNT.get()
+    if account is not None:
+        return account.get_youtube_api(readonly)
     if readonly not in YOUTUBE_API:
         YOUTUBE_API[readonly] = create_youtube_api(readonly)
     return YOUTUBE_API[readonly]
 
 
+_THREAD_LOCAL = threading.local()
+
+
+def _record_call(_backend, _endpoint, _function, *args, **kwargs):
+    """
+    Call function, recording call count, errors and latency metrics. Own
+    arguments are underscored, so as not to collide with the keyword
+    arguments of the function.
+
+    """
+    start = time.perf_counter()
+    try:
+        return _function(*args, **kwargs)
+    except Exception:
+        METRICS.increment('api_errors', backend=_backend, endpoint=_endpoint)
+        raise
+    finally:
+        METRICS.increment('api_calls', backend=_backend, endpoint=_endpoint)
+        METRICS.observe('api_latency_seconds', time.perf_counter() - start,
+                        backend=_backend, endpoint=_endpoint)
+
+
+def _execute(request, endpoint):
+    """Execute YouTube API request from the calling thread, see `execute`."""
+    METRICS.increment('youtube_quota', YOUTUBE_QUOTA_COSTS.get(endpoint, 1))
+    credentials = getattr(request.http, 'credentials', None)
+    if threading.current_thread() is threading.main_thread() or credentials is None:
+        return _record_call('youtube', endpoint, request.execute)
+    https = _THREAD_LOCAL.__dict__.setdefault('https', {})
+    if id(credentials) not in https:
+        https[id(credentials)] = google_auth_httplib2.AuthorizedHttp(
+            credentials, http=httplib2.Http())
+    return _record_call('youtube', endpoint, request.execute, http=https[id(credentials)])
+
+
+def execute(request):
+    """
+    Execute YouTube API request. The http object the API endpoint was built
+    with (httplib2) is not thread safe, so requests executed outside of the
+    main thread (e.g. when fetching playlists concurrently) go through an
+    authorized http object owned by the calling thread. Calls, latency and
+    quota spent are recorded in bes.metrics. Searches are hedged if hedging
+    is enabled, see bes.hedging, identical reads in flight are coalesced,
+    see bes.singleflight, and requests made under a deadline time out with
+    it, see bes.deadline.
+
+    Parameters
+    ----------
+    request : googleapiclient.http.HttpRequest
+        Request to execute.
+
+    Returns
+    -------
+    response : dict
+        Response JSON.
+
+    """
+    endpoint = getattr(request, 'methodId', 'unknown').replace(f'{YOUTUBE_API_SERVICE_NAME}.', '')
+    function = functools.partial(hedging.call, 'youtube', endpoint, functools.partial(_execute, request, endpoint))
+    return deadline.call(functools.partial(
+        singleflight.call, 'youtube', endpoint, _get_request_key(request), function))
+
+
+def _get_request_key(request):
+    """Key of YouTube API request for coalescing: client, method, sorted query and body."""
+    url = urllib.parse.urlsplit(request.uri)
+    query = sorted(urllib.parse.parse_qsl(url.query))
+    credentials = getattr(request.http, 'credentials', None)
+    return (id(credentials), request.method, url.path, tuple(query), request.body)
+
+
 ###############################################################################
 ################################ Spotify ######################################
 ###############################################################################
@@ -73,16 +174,162 @@ SPOTIFY_USER_ID = os.getenv('SPOTIFY_USER_ID')
 SPOTIFY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
 SPOTIFY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
 
+
+class InstrumentedSpotify(object):
+    """
+    Thin wrapper around spotipy.Spotify recording calls, errors and latency
+    of each public method (one method call being one request) in bes.metrics.
+    Lookups are hedged if hedging is enabled, see bes.hedging, identical
+    reads in flight are coalesced, see bes.singleflight, and requests made
+    under a deadline time out with it, see bes.deadline.
+
+    """
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        return functools.partial(self._call, name, attr)
+
+    def _call(self, _endpoint, _method, *args, **kwargs):
+        function = functools.partial(hedging.call, 'spotify', _endpoint, functools.partial(
+            _record_call, 'spotify', _endpoint, _method, *args, **kwargs))
+        if singleflight.is_coalesced('spotify', _endpoint):
+            function = functools.partial(singleflight.call, 'spotify', _endpoint,
+                                         self._get_key(_method, args, kwargs), function)
+        return deadline.call(function)
+
+    def _get_key(self, method, args, kwargs):
+        """
+        Key of call for coalescing: client and arguments, bound to the
+        signature of the method so that search(q) and search(q=q, limit=10)
+        are the same call.
+
+        """
+        try:
+            arguments = inspect.signature(method).bind(*args, **kwargs)
+            arguments.apply_defaults()
+            arguments = arguments.arguments
+        except TypeError:
+            arguments = {'args': args, 'kwargs': kwargs}
+        return (id(self._client), json.dumps(arguments, sort_keys=True, default=str))
+
+
+def create_spotify_api(cache_path=None):
+    """
+    Create Spotify API endpoint.
+
+    Parameters
+    ----------
+    cache_path : str or pathlib.Path, optional
+        Where to cache the OAuth token, spotipy's default (.cache in the
+        working directory) if None.
+
+    Returns
+    -------
+    api : bes.api.InstrumentedSpotify
+        Spotify API endpoint.
+
+    """
+    return InstrumentedSpotify(spotipy.Spotify(
+        auth_manager=SpotifyOAuth(
+            client_id=SPOTIFY_CLIENT_ID,
+            client_secret=SPOTIFY_CLIENT_SECRET,
+            redirect_uri="http://localhost:8000",
+            scope="playlist-modify-public",
+            cache_path=None if cache_path is None else str(cache_path),
+        )
+    ))
+
+
 def get_or_create_spotify_api():
-    """Get existing API endpoint or create one if not."""
+    """
+    Get existing API endpoint or create one if not. Within use_account, the
+    endpoint of the account is returned instead.
+
+    """
     global SPOTIFY_API
+    account = _ACCOUNT.get()
+    if account is not None:
+        return account.get_spotify_api()
     if SPOTIFY_API is None:
-        SPOTIFY_API = spotipy.Spotify(
-            auth_manager=SpotifyOAuth(
-                client_id=SPOTIFY_CLIENT_ID,
-                client_secret=SPOTIFY_CLIENT_SECRET,
-                redirect_uri="http://localhost:8000",
-                scope="playlist-modify-public",
-            )
-        )
+        SPOTIFY_API = create_spotify_api()
     return SPOTIFY_API
+
+
+def get_account():
+    """Account of the current context, None outside of use_account."""
+    return _ACCOUNT.get()
+
+
+def get_spotify_user_id():
+    """Spotify user ID of the current account, see use_account."""
+    account = _ACCOUNT.get()
+    return SPOTIFY_USER_ID if account is None else account.spotify_user_id
+
+
+###############################################################################
+################################ Accounts #####################################
+###############################################################################
+class Account(object):
+    """
+    Credentials and API endpoints of one user, to work with several users in
+    one process (see bes.tenants). Endpoints not provided are created on
+    first use, the Spotify OAuth token being cached per account under
+    CACHE_DIR/tokens.
+
+    Parameters
+    ----------
+    name : str
+        Account name, unique within the process.
+    spotify_user_id : str, optional
+        Spotify user ID.
+    spotify_api : bes.api.InstrumentedSpotify, optional
+        Spotify API endpoint of the user.
+    youtube_api : dict, optional
+        Readonly (bool) -> YouTube API endpoint of the user. Provide the same
+        endpoint for both if it has both scopes.
+
+    """
+    def __init__(self, name, spotify_user_id=None, spotify_api=None, youtube_api=None):
+        self.name = name
+        self.spotify_user_id = spotify_user_id
+        self.spotify_api = spotify_api
+        self.youtube_api = dict(youtube_api or {})
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'Account({self.name})'
+
+    def get_spotify_api(self):
+        with self._lock:
+            if self.spotify_api is None:
+                (CACHE_DIR / 'tokens').mkdir(parents=True, exist_ok=True)
+                self.spotify_api = create_spotify_api(
+                    cache_path=CACHE_DIR / 'tokens' / f'{self.name}.spotify.json')
+            return self.spotify_api
+
+    def get_youtube_api(self, readonly=True):
+        with self._lock:
+            if readonly not in self.youtube_api:
+                self.youtube_api[readonly] = create_youtube_api(readonly)
+            return self.youtube_api[readonly]
+
+
+@contextlib.contextmanager
+def use_account(account):
+    """
+    Use the API endpoints and user ID of `account` (a bes.api.Account) within
+    the context: channels, playlists and searches created or run in it use
+    them instead of the module level ones. Note that the account is not
+    propagated to threads started in the context, hence playlists and
+    channels keep the endpoints they were created with.
+
+    """
+    token = _ACCOUNT.set(account)
+    try:
+        yield account
+    finally:
+        _ACCOUNT.reset(token)
@@ -0,0 +1,198 @@
+"""
+Memory-bounded caching of the tracks of playlists. Iterating a channel of
+hundreds of playlists otherwise keeps the tracks of every playlist in memory
+for the lifetime of the channel. With a memory budget (see
+bes.channel.Channel, `max_memory`), the tracks of the least recently used
+playlists are evicted once the loaded playlists exceed the budget, and saved
+to a local cache first: the raw REST API JSON of each track, in a JSON lines
+file per playlist under CACHE_DIR/playlists. Accessing the tracks of an
+evicted playlist reloads them from that file, without any request, if the
+file is known to be up to date (see `load`):
+  * the playlist metadata reports a version (Spotify snapshot ID) equal to
+    the version the tracks were saved with, in this session or any later
+    one,
+  * otherwise, only if the tracks were saved in this session (i.e. the
+    playlist was evicted earlier by this process).
+In both cases, the size reported by the playlist metadata must match too.
+
+The memory held by tracks is estimated (see `estimate_size`), from a sample
+of the tracks of each playlist.
+
+Example
+-------
+channel = SpotifyChannel(max_memory=200 * 2 ** 20)
+sizes = {playlist.name: len(playlist) for playlist in channel}
+
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+
+from bes import CACHE_DIR
+from bes.metrics import METRICS
+from bes.store import TrackStore
+
+PLAYLIST_CACHE_DIR = CACHE_DIR / 'playlists'
+# number of tracks sampled to estimate the memory held by a list of tracks
+N_SAMPLES = 20
+# tells the files saved by this process from the ones of earlier sessions
+SESSION = uuid.uuid4().hex
+
+logger = logging.getLogger(__name__)
+
+
+def _get_deep_size(value, seen):
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_get_deep_size(key, seen) + _get_deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_get_deep_size(item, seen) for item in value)
+    elif hasattr(value, '__dict__'):
+        size += _get_deep_size(value.__dict__, seen)
+    return size
+
+
+def estimate_size(tracks):
+    """
+    Estimate the memory held by tracks (list of bes.track.Track or
+    bes.store.TrackStore) in bytes.
+
+    """
+    if isinstance(tracks, TrackStore):
+        return _get_deep_size(tracks, set())
+    if not len(tracks):
+        return sys.getsizeof(tracks)
+    step = max(1, len(tracks) // N_SAMPLES)
+    sample = tracks[::step]
+    return sys.getsizeof(tracks) + len(tracks) * sum(
+        _get_deep_size(track, set()) for track in sample) // len(sample)
+
+
+def _get_path(playlist):
+    name = re.sub(r'[^\w\-]', '_', f'{playlist.backend}-{playlist.id}')
+    return PLAYLIST_CACHE_DIR / f'{name}.jsonl'
+
+
+def save(playlist, tracks):
+    """
+    Save the JSON of tracks of playlist to the local cache. Returns False
+    (and saves nothing) if some tracks have no JSON (e.g. columnar tracks).
+
+    """
+    if isinstance(tracks, TrackStore) or any(track.item is None for track in tracks):
+        return False
+    path = _get_path(playlist)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_suffix('.tmp')
+    with open(temporary_path, 'w') as handle:
+        # version and size according to the metadata, which tell if the cache is outdated
+        header = {'size': playlist.size, 'version': playlist.version, 'session': SESSION}
+        handle.write(json.dumps(header) + '\n')
+        for track in tracks:
+            handle.write(json.dumps(track.item) + '\n')
+    os.replace(temporary_path, path)
+    return True
+
+
+def load(playlist, track_cls):
+    """
+    Load tracks of playlist from the local cache, None if not cached, or if
+    the cache is not known to be up to date: the size of the playlist
+    (according to its metadata) changed since, or is unknown, or the version
+    of the playlist changed since, or, if the version is unknown, the tracks
+    were saved by another session. Playlists changed elsewhere while
+    evicted, with neither their size nor their version changed, are not
+    told apart, as for playlists held in memory.
+
+    """
+    path = _get_path(playlist)
+    if playlist.size is None or not path.exists():
+        return None
+    try:
+        with open(path, 'r') as handle:
+            header = json.loads(handle.readline() or 'null')
+            if header is None or header['size'] != playlist.size:
+                return None
+            if playlist.version is not None and header.get('version') is not None:
+                if header['version'] != playlist.version:
+                    return None
+            elif header.get('session') != SESSION:
+                return None
+            return [track_cls.from_item(json.loads(line)) for line in handle]
+    except (json.JSONDecodeError, KeyError, ValueError) as e:
+        logger.warning('ignoring corrupted cache %s: %r', path, e)
+        return None
+
+
+class MemoryBudget(object):
+    """
+    Least recently used eviction of the tracks of playlists, see module
+    docstring.
+
+    Parameters
+    ----------
+    max_memory : int
+        Memory budget in bytes for the tracks of the loaded playlists. The
+        most recently used playlist is kept even if it exceeds the budget on
+        its own.
+
+    Attributes
+    ----------
+    memory : int
+        Estimated memory held by the tracks of the loaded playlists.
+
+    """
+    def __init__(self, max_memory):
+        self.max_memory = max_memory
+        self.memory = 0
+        # id(playlist) -> (playlist, estimated size), least recently used first
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self, playlist):
+        """Mark playlist as used, record its size if just loaded and evict others if needed."""
+        with self._lock:
+            key = id(playlist)
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                return
+        tracks = playlist._tracks
+        if tracks is None:
+            return
+        size = estimate_size(tracks)
+        with self._lock:
+            # another thread may have recorded it meanwhile
+            _, previous_size = self._loaded.pop(key, (None, 0))
+            self._loaded[key] = (playlist, size)
+            self.memory += size - previous_size
+            evicted = []
+            while self.memory > self.max_memory and len(self._loaded) > 1:
+                _, (victim, victim_size) = self._loaded.popitem(last=False)
+                self.memory -= victim_size
+                evicted.append(victim)
+        for victim in evicted:
+            victim.evict()
+        if evicted:
+            METRICS.increment('playlists_evicted', len(evicted))
+            logger.debug('evicted tracks of %d playlists, %.1f MiB loaded',
+                         len(evicted), self.memory / 2 ** 20)
+
+    def clear(self):
+        """Forget all playlists, without evicting them."""
+        with self._lock:
+            self._loaded.clear()
+            self.memory = 0
+
+    def discard(self, playlist):
+        """Forget playlist, e.g. once its tracks were dropped."""
+        with self._lock:
+            _, size = self._loaded.pop(id(playlist), (None, 0))
+            self.memory -= size
@@ -0,0 +1,248 @@
+"""
+Persisted candidates of searches, to decide matches again at another risk
+threshold without any request. Matching a track (see
+bes.track.SpotifyTrack.from_youtube and bes.track.YouTubeTrack.from_spotify)
+scores every search result, but only keeps the best one if below the
+threshold. While the store is enabled, every scored candidate of each source
+track is kept instead: its ID, risk score, missing artists and title
+deviation (see bes.score.get_risk_score).
+
+Candidates are kept per target backend, in a JSON lines file under
+CACHE_DIR/candidates (appended to, and compacted when mostly made of
+outdated lines), and held in memory in columns (see bes.store for the same
+idea applied to tracks). A source track searched again replaces its
+candidates.
+
+Deciding matches at a new threshold (`CandidateStore.decide`) returns a
+match table, which add_tracks accepts (`matches`) so that nothing is
+searched again, and `CandidateStore.sweep` counts the matches at many
+thresholds at once, to pick one.
+
+Example
+-------
+from bes import candidates
+candidates.enable()
+spotify_playlist.add_tracks(youtube_playlist)
+store = candidates.get_store('spotify')
+store.sweep([0.2, 0.5, 1.0, 1.5], youtube_playlist.track_ids)
+matches = store.decide(youtube_playlist.track_ids, threshold=0.5)
+other_spotify_playlist.add_tracks(youtube_playlist, matches=matches, resume=False)
+
+"""
+import bisect
+import logging
+import re
+import threading
+from array import array
+
+from bes import CACHE_DIR
+from bes.journal import JsonLines
+
+CANDIDATES_DIR = CACHE_DIR / 'candidates'
+
+# target backend -> CandidateStore, None while disabled
+STORES = None
+_LOCK = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+class CandidateStore(object):
+    """
+    Scored candidates of the searches made on one backend, see module
+    docstring. Use `get_store` rather than instantiating it yourself.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path to the JSON lines file backing the store.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self._clear()
+        self._lock = threading.Lock()
+        # a cache: no fsync, a lost line only means searching again
+        self._file = JsonLines(path, fsync=False)
+        self._file.replay(self._apply)
+
+    @classmethod
+    def open(cls, backend):
+        """Open the store of candidates found on backend."""
+        name = re.sub(r'[^\w\-]', '_', backend)
+        return cls(CANDIDATES_DIR / f'{name}.jsonl')
+
+    def _clear(self):
+        # one row per candidate, source track ID -> (start, stop) rows
+        self._rows = {}
+        self._ids = []
+        self._risks = array('d')
+        self._missing_artists = []
+        self._deviations = []
+
+    def _apply(self, entry):
+        start = len(self._ids)
+        self._ids.extend(entry['ids'])
+        self._risks.extend(entry['risks'])
+        self._missing_artists.extend(tuple(artists) for artists in entry['missing_artists'])
+        self._deviations.extend(entry['deviations'])
+        self._rows[entry['source']] = (start, len(self._ids))
+
+    def _compact(self):
+        """Rewrite the file (and the columns) with the latest candidates of each source track only."""
+        entries = [self._get_entry(source_id) for source_id in self._rows]
+        self._file.rewrite(entries)
+        self._clear()
+        for entry in entries:
+            self._apply(entry)
+
+    def _get_entry(self, source_id):
+        start, stop = self._rows[source_id]
+        return {'source': source_id, 'ids': self._ids[start:stop],
+                'risks': self._risks[start:stop].tolist(),
+                'missing_artists': [list(artists) for artists in self._missing_artists[start:stop]],
+                'deviations': self._deviations[start:stop]}
+
+    def record(self, source_id, matches, scores):
+        """
+        Record the candidates of source track.
+
+        Parameters
+        ----------
+        source_id : str
+            ID of the source track.
+        matches : list of bes.track.Track
+            Candidates found on the backend of the store.
+        scores : list of tuple
+            Risk score, missing artists and title deviation of each
+            candidate, see bes.score.get_risk_score.
+
+        """
+        entry = {'source': source_id, 'ids': [match.id for match in matches],
+                 'risks': [risk for risk, _, _ in scores],
+                 'missing_artists': [sorted(missing_artists) for _, missing_artists, _ in scores],
+                 'deviations': [deviation for _, _, deviation in scores]}
+        with self._lock:
+            self._apply(entry)
+            self._file.append(entry)
+            if self._file.should_compact(len(self._rows)):
+                self._compact()
+
+    def get(self, source_id):
+        """
+        Candidates of source track, as a list of dict (ID, risk, missing
+        artists and title deviation), best first. None if never searched.
+
+        """
+        with self._lock:
+            if source_id not in self._rows:
+                return None
+            start, stop = self._rows[source_id]
+            candidates = [{'id': self._ids[i], 'risk': self._risks[i],
+                           'missing_artists': list(self._missing_artists[i]),
+                           'title_deviation': self._deviations[i]} for i in range(start, stop)]
+        return sorted(candidates, key=lambda candidate: candidate['risk'])
+
+    def _get_best(self, source_ids):
+        """ID and risk of the lowest risk candidate of each source track recorded (None if no candidate)."""
+        best = {}
+        with self._lock:
+            for source_id in source_ids:
+                if source_id not in self._rows:
+                    continue
+                start, stop = self._rows[source_id]
+                row = min(range(start, stop), key=self._risks.__getitem__, default=None)
+                best[source_id] = None if row is None else (self._ids[row], self._risks[row])
+        return best
+
+    def decide(self, source_ids, threshold):
+        """
+        Decide matches at threshold, the same way matching does, without
+        any request.
+
+        Parameters
+        ----------
+        source_ids : iterable of str
+            IDs of source tracks, e.g. the track IDs of a playlist.
+        threshold : float
+            Risk score threshold, see bes.track.Track.from_youtube.
+
+        Returns
+        -------
+        matches : dict
+            Source track ID -> matched ID (None if no candidate is below
+            threshold), for source tracks with recorded candidates only. It
+            is a match table, see bes.playlist.PlayList.add_tracks.
+
+        """
+        return {source_id: None if best is None or best[1] >= threshold else best[0]
+                for source_id, best in self._get_best(source_ids).items()}
+
+    def sweep(self, thresholds, source_ids=None):
+        """
+        Number of source tracks matched at each threshold.
+
+        Parameters
+        ----------
+        thresholds : iterable of float
+            Risk score thresholds.
+        source_ids : iterable of str, optional
+            IDs of source tracks, all the source tracks recorded by default.
+
+        Returns
+        -------
+        n_matched : dict
+            Threshold -> number of source tracks matched, out of the source
+            tracks with recorded candidates.
+
+        """
+        if source_ids is None:
+            source_ids = list(self._rows)
+        # sorted best risk of each source track: a track is matched at
+        # threshold if its best risk is below, counted by bisection
+        best_risks = array('d', sorted(best[1] for best in self._get_best(source_ids).values()
+                                       if best is not None))
+        return {threshold: bisect.bisect_left(best_risks, threshold) for threshold in thresholds}
+
+    def __contains__(self, source_id):
+        """Whether candidates of source track are recorded."""
+        return source_id in self._rows
+
+    def __len__(self):
+        """Number of source tracks with recorded candidates."""
+        return len(self._rows)
+
+
+def enable():
+    """Enable recording of candidates."""
+    global STORES
+    with _LOCK:
+        if STORES is None:
+            STORES = {}
+    return STORES
+
+
+def disable():
+    """Disable recording of candidates, recorded ones are kept on disk."""
+    global STORES
+    STORES = None
+
+
+def get_store(backend):
+    """
+    Store of candidates found on backend, kept open while enabled. Reading
+    candidates does not require enabling the store.
+
+    """
+    with _LOCK:
+        stores = {} if STORES is None else STORES
+        if backend not in stores:
+            stores[backend] = CandidateStore.open(backend)
+        return stores[backend]
+
+
+def record(backend, source_id, matches, scores):
+    """Record the candidates of source track found on backend, if enabled."""
+    if STORES is None:
+        return
+    get_store(backend).record(source_id, matches, scores)
@@ -0,0 +1,101 @@
+"""
+Catalog-level caches, shared by all the users of a process (see
+bes.tenants). What a track is on each backend does not depend on who is
+asking, so when many accounts are synced together, they can share:
+  * match tables: source track ID -> matched track ID, one per target
+    backend (see bes.playlist.PlayList.add_tracks),
+  * search responses: backend and query -> response, bounded (least recently
+    used responses are evicted first), for tracks with different IDs but the
+    same search string (e.g. the same song uploaded by several channels).
+
+Search responses are only cached while a catalog is enabled (module level
+CATALOG, the same way bes.hedging keeps its module level HEDGER). Hits and
+misses are recorded in bes.metrics ('search_cache_hits' and
+'search_cache_misses' counters).
+
+Example
+-------
+from bes import catalog
+catalog.enable(max_searches=100000)
+spotify_playlist.add_tracks(youtube_playlist, matches=catalog.CATALOG.get_matches('spotify'))
+
+"""
+import threading
+from collections import OrderedDict
+
+from bes.metrics import METRICS
+
+CATALOG = None
+
+
+class Catalog(object):
+    """
+    Match tables and search responses shared by several users.
+
+    Parameters
+    ----------
+    max_searches : int, default=100000
+        Maximum number of search responses kept.
+
+    Attributes
+    ----------
+    matches : dict
+        Target backend -> match table.
+
+    """
+    def __init__(self, max_searches=100000):
+        self.max_searches = max_searches
+        self.matches = {}
+        self._searches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_matches(self, backend):
+        """Match table of target backend."""
+        with self._lock:
+            return self.matches.setdefault(backend, {})
+
+    def search(self, backend, query, function):
+        """
+        Response to search `query` on backend, from the cache or by calling
+        function (no arguments) if not cached. Errors are not cached.
+
+        """
+        key = (backend, query)
+        with self._lock:
+            if key in self._searches:
+                self._searches.move_to_end(key)
+                METRICS.increment('search_cache_hits', backend=backend)
+                return self._searches[key]
+        METRICS.increment('search_cache_misses', backend=backend)
+        response = function()
+        with self._lock:
+            self._searches[key] = response
+            while len(self._searches) > self.max_searches:
+                self._searches.popitem(last=False)
+        return response
+
+    def stats(self):
+        """Number of cached search responses and matches per backend."""
+        with self._lock:
+            return {'searches': len(self._searches),
+                    'matches': {backend: len(table) for backend, table in self.matches.items()}}
+
+
+def enable(**kwargs):
+    """Share a catalog process wide, see Catalog for arguments."""
+    global CATALOG
+    CATALOG = Catalog(**kwargs)
+    return CATALOG
+
+
+def disable():
+    """Stop sharing the catalog."""
+    global CATALOG
+    CATALOG = None
+
+
+def search(backend, query, function):
+    """Search through the shared catalog if enabled, see Catalog.search."""
+    if CATALOG is None:
+        return function()
+    return CATALOG.search(backend, query, function)
@@ -1,7 +1,16 @@
-from bes import api
-from bes.playlist import SpotifyPlaylist, SpotifySavedTracks, YouTubePlayList
+import functools
+import logging
+
+from bes import api, export
+from bes.cache import MemoryBudget
+from bes.index import TrackIndex
+from bes.pagination import MAX_WORKERS, paginate
+from bes.playlist import PlayList, SpotifyPlaylist, SpotifySavedTracks, YouTubePlayList
+from bes.sync import fetch_playlists
 from bes.track import SpotifyTrack
 
+logger = logging.getLogger(__name__)
+
 
 class Channel(object):
     """
@@ -9,12 +18,30 @@ class Channel(object):
     "Channel" i.e. a YouTube Channel or a Spotify account. A channel has
     playlists associated to it, and allows creation of new playlists.
 
+    Parameters
+    ----------
+    columnar : bool, default=False
+        Store tracks of the playlists in columnar format (see bes.store),
+        recommended for very large libraries.
+    max_memory : int, optional
+        Memory budget in bytes for the tracks of the playlists. Tracks of the
+        least recently used playlists are evicted beyond it, and reloaded
+        from a local cache when needed, see bes.cache. Unbounded if None.
+
     """
     backend = None
     _playlists = None
+    _playlists_by_id = None
+    _track_index = None
 
-    def __init__(self,):
+    def __init__(self, columnar=False, max_memory=None):
         self._playlists = None
+        self._playlists_by_id = None
+        self._track_index = None
+        self.columnar = columnar
+        self.memory = None if max_memory is None else MemoryBudget(max_memory)
+        account = api.get_account()
+        self._account_name = 'mine' if account is None else account.name
 
     @property
     def playlists(self):
@@ -22,14 +49,85 @@ class Channel(object):
         Property which contains the list of all playlists existing for this
         channel. It is a "lazy" attribute, until you access if for the first
         time, the query to retrieve the playlists will not be performed.
+        Playlists are indexed by name and by ID, so that looking up a playlist
+        does not require scanning all of them.
 
         """
         if self._playlists is None:
-            self._playlists = {pl.name: pl for pl in self._get_playlists()}
+            self._playlists = {}
+            self._playlists_by_id = {}
+            for playlist in self._get_playlists():
+                self._index(playlist)
         return self._playlists.values()
 
+    def _index(self, playlist):
+        """Add playlist to the name and ID indexes."""
+        playlist.columnar = self.columnar
+        playlist._track_index = self.track_index
+        playlist._memory = self.memory
+        self._playlists[playlist.name] = playlist
+        self._playlists_by_id[playlist.id] = playlist
+
+    @property
+    def track_index(self):
+        """
+        Reverse index of the tracks of the playlists of this channel, track
+        ID -> playlist IDs, persisted across sessions, see bes.index.
+
+        """
+        if self._track_index is None:
+            self._track_index = TrackIndex.open(self.backend, self._get_index_name())
+        return self._track_index
+
+    def _get_index_name(self):
+        """Name of the channel, unique on its backend, naming its index."""
+        return self._account_name
+
+    def get_playlists_containing(self, track):
+        """
+        Playlists of this channel containing track (or track ID), in O(1)
+        from the reverse index. Playlists never loaded, or changed elsewhere
+        since they were loaded, may be missing or outdated in the index, see
+        refresh_index.
+
+        """
+        self.playlists
+        playlist_ids = self.track_index.get(getattr(track, 'id', track))
+        return [self._playlists_by_id[id] for id in playlist_ids if id in self._playlists_by_id]
+
+    def refresh_index(self, max_workers=MAX_WORKERS):
+        """
+        Load the playlists missing from the reverse index or whose size
+        changed since they were indexed (concurrently, see
+        bes.sync.fetch_playlists), so that the index is up to date. Playlists
+        indexed with their current size are not fetched.
+
+        Returns
+        -------
+        n_loaded : int
+            Number of playlists loaded.
+
+        """
+        outdated = [playlist for playlist in self.playlists if not self.track_index.is_fresh(playlist)]
+        for playlist in outdated:
+            playlist._tracks = None
+        fetch_playlists(outdated, max_workers=max_workers)
+        logger.info('%d playlists (re)indexed, %d tracks indexed', len(outdated), len(self.track_index))
+        return len(outdated)
+
     def add_playlist(self, name):
-        """Add a playlist by name. Backend specific."""
+        """
+        Add a playlist by name. The created playlist is inserted in the
+        indexes in place, no need to refresh the channel.
+
+        """
+        self.playlists
+        playlist = self._create_playlist(name)
+        self._index(playlist)
+        return playlist
+
+    def _create_playlist(self, name):
+        """Backend specific way of creating a playlist, returns the playlist."""
         raise NotImplementedError
 
     def _get_playlists(self):
@@ -38,12 +136,15 @@ class Channel(object):
 
     def refresh(self):
         """
-        After adding a playlist or in general modifying playlists, one could
-        opt to refresh the instance to avoid having unsynced information stored
-        about the playlists.
+        After modifying playlists outside of this instance, one could opt to
+        refresh the instance to avoid having unsynced information stored about
+        the playlists.
 
         """
         self._playlists = None
+        self._playlists_by_id = None
+        if self.memory is not None:
+            self.memory.clear()
 
     def get(self, playlist_name_or_id):
         """
@@ -52,18 +153,21 @@ class Channel(object):
 
         """
         if not playlist_name_or_id in self:
-            self.add_playlist(playlist_name_or_id)
-            self.refresh()
-            print(f'{playlist_name_or_id} did not exist on {self.backend}, created one')
-        playlists = [pl for pl in self if pl.name == playlist_name_or_id]
-        playlists += [pl for pl in self if pl.id == playlist_name_or_id]
-        assert len(playlists) == 1, \
-            f'more than one hit for playlist {playlist_name_or_id} on {self.backend}: {playlists}'
-        return playlists[0]
+            logger.info('%s did not exist on %s, creating one', playlist_name_or_id, self.backend)
+            return self.add_playlist(playlist_name_or_id)
+        by_name = self._playlists.get(playlist_name_or_id)
+        by_id = self._playlists_by_id.get(playlist_name_or_id)
+        assert by_name is None or by_id is None or by_name is by_id, \
+            f'more than one hit for playlist {playlist_name_or_id} on {self.backend}: {[by_name, by_id]}'
+        # careful, empty playlists are falsy
+        return by_name if by_name is not None else by_id
 
     def __contains__(self, other):
-        """Check if a provided playlist is already in channel."""
-        return any(playlist == other for playlist in self)
+        """Check if a provided playlist (or playlist name or ID) is already in channel."""
+        self.playlists
+        if isinstance(other, PlayList):
+            return other.name in self._playlists or other.id in self._playlists_by_id
+        return other in self._playlists or other in self._playlists_by_id
 
     def __iter__(self):
         """
@@ -79,15 +183,37 @@ class Channel(object):
         yield from self.playlists
 
     def __getitem__(self, playlist_name_or_id):
-        if self._playlists is None:
-            self.playlists
-        return self._playlists[playlist_name_or_id]
+        self.playlists
+        if playlist_name_or_id in self._playlists:
+            return self._playlists[playlist_name_or_id]
+        return self._playlists_by_id[playlist_name_or_id]
 
     def items(self):
-        if self._playlists is None:
-            self.playlists
+        self.playlists
         return self._playlists.items()
 
+    def to_dataframe(self, names=None, batch_size=export.BATCH_SIZE):
+        """
+        Export tracks of all playlists (or of the playlists named in `names`)
+        to a pandas DataFrame, one row per track and playlist, see bes.export.
+
+        """
+        return export.to_dataframe(self._select(names), batch_size=batch_size)
+
+    def to_file(self, path, names=None, format='parquet', batch_size=export.BATCH_SIZE):
+        """
+        Write tracks of all playlists (or of the playlists named in `names`)
+        to a Parquet or Arrow file batch by batch, see bes.export.write.
+        Returns the number of rows written.
+
+        """
+        return export.write(self._select(names), path, format=format, batch_size=batch_size)
+
+    def _select(self, names):
+        if names is None:
+            return list(self.playlists)
+        return [self[name] for name in names]
+
 class YouTubeChannel(Channel):
     """
     YouTube channel. Can only wrap your YouTube channel (mine=True).
@@ -99,12 +225,16 @@ class YouTubeChannel(Channel):
         to use readonly when you know you only want to transfer from youtube
         to spotify and only require read operations. Note that read operations
         on Google API use less points than write operations.
+    columnar : bool, default=False
+        See base class docstring.
+    max_memory : int, optional
+        See base class docstring.
 
     """
     backend = 'youtube'
 
-    def __init__(self, readonly=True):
-        super().__init__()
+    def __init__(self, readonly=True, columnar=False, max_memory=None):
+        super().__init__(columnar=columnar, max_memory=max_memory)
         self.api = api.get_or_create_youtube_api(readonly=readonly)
 
     def _get_playlists(self):
@@ -123,11 +253,11 @@ class YouTubeChannel(Channel):
         while True:
             request = self.api.playlists().list(
                 part="snippet,contentDetails",
-                maxResults=25,
+                maxResults=50,
                 mine=True,
                 pageToken=nextPageToken,
             )
-            response = request.execute()
+            response = api.execute(request)
 
             # expand playlist list
             for item in response['items']:
@@ -140,7 +270,7 @@ class YouTubeChannel(Channel):
 
         return playlists
 
-    def add_playlist(self, name):
+    def _create_playlist(self, name):
         """
         YouTube specific way of adding / creating new playlist (by name).
 
@@ -167,7 +297,7 @@ class YouTubeChannel(Channel):
             }
             }
         )
-        response = request.execute()
+        response = api.execute(request)
         return YouTubePlayList.from_item(response)
 
 
@@ -179,16 +309,28 @@ class SpotifyChannel(Channel):
     operation in this API, to avoid any irrevesible mistake (deleting a playlist
     you've been building for 10 years... can you imagine the heart sink?).
 
+    Parameters
+    ----------
+    columnar : bool, default=False
+        See base class docstring.
+    max_memory : int, optional
+        See base class docstring.
+
     """
     backend = 'spotify'
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, columnar=False, max_memory=None):
+        super().__init__(columnar=columnar, max_memory=max_memory)
         self.api = api.get_or_create_spotify_api()
+        self.user_id = api.get_spotify_user_id()
+
+    def _get_index_name(self):
+        return self.user_id or super()._get_index_name()
 
     def _get_playlists(self):
         """
-        Spotipy specific way of retrieving all playlists of a channel.
+        Spotipy specific way of retrieving all playlists of a channel. Pages
+        are requested concurrently, see bes.pagination.
 
         Returns
         -------
@@ -196,12 +338,10 @@ class SpotifyChannel(Channel):
             List of playlists.
 
         """
-        playlists = []
-        for item in self.api.user_playlists(api.SPOTIFY_USER_ID)['items']:
-            playlists.append(SpotifyPlaylist.from_item(item))
-        return playlists
+        fetch = functools.partial(self.api.user_playlists, self.user_id)
+        return [SpotifyPlaylist.from_item(item) for item in paginate(fetch, limit=50)]
 
-    def add_playlist(self, name):
+    def _create_playlist(self, name):
         """
         Spotipy specific way of adding / creating new playlist (by name).
 
@@ -217,7 +357,7 @@ class SpotifyChannel(Channel):
 
         """
         response = self.api.user_playlist_create(
-            user=api.SPOTIFY_USER_ID,
+            user=self.user_id,
             name=name,
             public=True,
         )
@@ -240,4 +380,6 @@ class SpotifyChannel(Channel):
             backend.
 
         """
-        return SpotifySavedTracks()
+        playlist = SpotifySavedTracks()
+        playlist.columnar = self.columnar
+        return playlist
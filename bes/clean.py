@@ -5,6 +5,8 @@ from track name.
 """
 import re
 
+from bes.tracing import traced
+
 TITLE_SEPARATORS = [' ~ ', ' - ', ' – ', ' -- ', '–', '--', '~', '-', '  ', ' ', ]
 ARTIST_SEPARATORS = [' & ', ' x ', ]
 
@@ -62,6 +64,7 @@ def clean_parentheses(string):
     return string
 
 
+@traced
 def clean(string):
     """Call all clean functions in sequence"""
     for function in [clean_tracklisting, clean_label_or_catalog_number,
@@ -70,6 +73,7 @@ def clean(string):
     return string.strip()
 
 
+@traced
 def split_artists_from_title(youtube_track):
     """
     Split track artists from title from a YouTube video name.
@@ -111,6 +115,7 @@ def split_artists_from_title(youtube_track):
     return split_artists(artists), title
 
 
+@traced
 def split_artists(artists):
     """
     Split artists string into list of artists.
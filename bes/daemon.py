@@ -0,0 +1,206 @@
+"""
+Long running sync daemon. Running a sync script from scratch pays for OAuth,
+client construction and fetching every playlist, just to sync a couple of new
+tracks. The daemon instead keeps clients, playlists (and their tracks) and
+match tables in memory, and runs incremental passes on an interval: each pass
+only lists the playlists of the channels (one request per 50 playlists) and
+only touches the pairs whose source or target changed since the last pass.
+
+Changes are detected from the number of tracks reported by the playlist
+metadata, i.e. tracks added or removed; reordering a playlist or replacing a
+track by another one is not noticed until the sizes change.
+
+A small status endpoint is served on localhost (GET /status for the state of
+the daemon and of each pair, GET /metrics for bes.metrics).
+
+Example
+-------
+daemon = SyncDaemon(mapping, channels=[youtube_channel, spotify_channel])
+daemon.serve_status(port=8765)
+daemon.run_forever(interval=60)
+
+"""
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bes.metrics import METRICS
+from bes.pagination import MAX_WORKERS
+from bes.sync import fetch_playlists
+
+logger = logging.getLogger(__name__)
+
+
+def _key(playlist):
+    return (playlist.backend, playlist.id)
+
+
+class SyncDaemon(object):
+    """
+    Keep pairs of playlists in sync, see module docstring.
+
+    Parameters
+    ----------
+    mapping : iterable of (bes.playlist.PlayList, bes.playlist.PlayList)
+        Pairs of source and target playlists, tracks of each source are added
+        to its target.
+    channels : list of bes.channel.Channel
+        Channels listing the playlists of the mapping, used to poll their
+        sizes. Playlists not listed by any channel are synced on every pass.
+    max_workers : int, default=MAX_WORKERS
+        Maximum number of playlists fetched at the same time.
+
+    Attributes
+    ----------
+    matches : dict
+        Target backend -> match table shared by all passes, see
+        bes.playlist.PlayList.add_tracks.
+    passes : int
+        Number of passes run.
+
+    """
+    def __init__(self, mapping, channels, max_workers=MAX_WORKERS):
+        self.mapping = list(mapping)
+        self.channels = list(channels)
+        self.max_workers = max_workers
+        self.matches = {}
+        self.passes = 0
+        # playlist key -> size reported by the metadata when last synced
+        self._sizes = {}
+        self._status = {'started': time.time(), 'last pass': None, 'last error': None}
+        self._pairs = [{'source': str(source), 'target': str(target), 'synced': None,
+                        'tracks added': 0} for source, target in self.mapping]
+        self._stopped = threading.Event()
+        self._server = None
+
+    def _poll_sizes(self):
+        """Current size of the playlists of the channels, by playlist key."""
+        sizes = {}
+        for channel in self.channels:
+            channel.refresh()
+            for playlist in channel.playlists:
+                sizes[_key(playlist)] = playlist.size
+        return sizes
+
+    def _is_changed(self, playlist, sizes):
+        """
+        Whether playlist changed since last pass, if so update its size and
+        drop its cached tracks (which are fetched again).
+
+        """
+        size = sizes.get(_key(playlist))
+        if size is not None and size == self._sizes.get(_key(playlist)):
+            return False
+        playlist.size = size
+        playlist._tracks = None
+        playlist._pages = None
+        return True
+
+    def run_once(self):
+        """
+        Run one incremental pass: sync the pairs whose source or target
+        changed since the previous pass.
+
+        Returns
+        -------
+        summary : dict
+            Number of pairs synced and tracks added.
+
+        """
+        start = time.time()
+        sizes = self._poll_sizes()
+        changed = []
+        for i, (source, target) in enumerate(self.mapping):
+            # check both, to reload the target if it was modified elsewhere
+            source_changed = self._is_changed(source, sizes)
+            target_changed = self._is_changed(target, sizes)
+            if source_changed or target_changed:
+                changed.append(i)
+        fetch_playlists([playlist for i in changed for playlist in self.mapping[i]],
+                        max_workers=self.max_workers)
+
+        n_added = 0
+        for i in changed:
+            source, target = self.mapping[i]
+            ids_added = target.add_tracks(source, matches=self.matches.setdefault(target.backend, {}))
+            n_added += len(ids_added)
+            self._sizes[_key(source)] = sizes.get(_key(source))
+            target_size = sizes.get(_key(target))
+            self._sizes[_key(target)] = None if target_size is None else target_size + len(ids_added)
+            self._pairs[i]['synced'] = time.time()
+            self._pairs[i]['tracks added'] += len(ids_added)
+
+        self.passes += 1
+        summary = {'pairs synced': len(changed), 'tracks added': n_added}
+        self._status['last pass'] = {'start': start, 'duration': time.time() - start, **summary}
+        METRICS.increment('daemon_passes')
+        METRICS.set('daemon_pass_seconds', time.time() - start)
+        logger.info('pass %d: %d of %d pairs changed, %d tracks added',
+                    self.passes, len(changed), len(self.mapping), n_added)
+        METRICS.flush()
+        return summary
+
+    def run_forever(self, interval=60):
+        """
+        Run passes every `interval` seconds until stopped (see `stop`) or
+        interrupted. Errors of a pass (e.g. network error, quota exceeded)
+        are logged and the next pass runs as planned.
+
+        """
+        try:
+            while not self._stopped.is_set():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.exception('pass failed: %r', e)
+                    self._status['last error'] = {'time': time.time(), 'error': repr(e)}
+                    METRICS.increment('daemon_errors')
+                self._stopped.wait(interval)
+        except KeyboardInterrupt:
+            logger.info('interrupted, stopping')
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Stop running passes and serving status."""
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def status(self):
+        """State of the daemon and of each pair, as a JSON serializable dict."""
+        return {**self._status, 'passes': self.passes, 'pairs': self._pairs,
+                'matches': {backend: len(table) for backend, table in self.matches.items()}}
+
+    def serve_status(self, port=8765, host='127.0.0.1'):
+        """Serve status (GET /status) and metrics (GET /metrics) in a background thread."""
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/status':
+                    response = daemon.status()
+                elif self.path == '/metrics':
+                    response = METRICS.snapshot()
+                else:
+                    self.send_error(404)
+                    return
+                payload = json.dumps(response).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logger.info('serving status on http://%s:%d/status', host, self._server.server_address[1])
+        return self._server.server_address[1]
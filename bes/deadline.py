@@ -0,0 +1,189 @@
+"""
+Deadline-aware syncs. A scheduler giving each sync job a fixed time slot can
+pass a time budget to bes.playlist.PlayList.add_tracks (`deadline`): the
+budget is spread over matching and writing, so that the job stops searching
+new tracks early enough to insert the tracks already matched, and returns a
+partial result (see AddedTracks) listing the remaining work instead of being
+killed with its matches unwritten. The job journal is kept, so calling
+add_tracks again resumes where it stopped (see bes.journal).
+
+The time left is estimated from the latencies observed during the job
+(exponentially weighted averages of searches and writes), and each request
+made within the job gets a timeout derived from the time left (see
+`requests_until`): a request still in flight past it is abandoned and
+DeadlineExceeded is raised. Requests abandoned are recorded in bes.metrics
+('request_timeouts' counter).
+
+Example
+-------
+ids_added = spotify_playlist.add_tracks(youtube_playlist, deadline=60)
+if not ids_added.complete:
+    print(ids_added.to_dict())
+
+"""
+import contextlib
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from bes.metrics import METRICS
+
+# absolute time (time.monotonic) by which requests of the current context must complete
+_REQUEST_DEADLINE = contextvars.ContextVar('request_deadline', default=None)
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+# maximum number of requests in flight under a deadline, abandoned ones included
+MAX_WORKERS = 32
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request cannot complete before the deadline."""
+
+
+class Deadline(object):
+    """
+    Time budget of a job, with running estimates of the duration of its
+    requests.
+
+    Parameters
+    ----------
+    seconds : float
+        Time budget in seconds, from now.
+    estimates : dict, optional
+        Initial estimate of the duration in seconds of each kind of request
+        ('search', 'write'), before any is observed. Defaults to 0.2 seconds,
+        the estimates adapt after a few requests.
+    smoothing : float, default=0.3
+        Weight of the last observation in the running estimates.
+
+    """
+    def __init__(self, seconds, estimates=None, smoothing=0.3):
+        self.seconds = seconds
+        self.at = time.monotonic() + seconds
+        self.smoothing = smoothing
+        self._estimates = {'search': 0.2, 'write': 0.2}
+        self._estimates.update(estimates or {})
+
+    def remaining(self):
+        """Seconds left, negative once the deadline passed."""
+        return self.at - time.monotonic()
+
+    def elapsed(self):
+        """Seconds since the budget started."""
+        return self.seconds - self.remaining()
+
+    def estimate(self, kind):
+        """Estimated duration in seconds of one request of kind `kind`."""
+        return self._estimates[kind]
+
+    def observe(self, kind, seconds):
+        """Record the duration of one request of kind `kind`."""
+        self._estimates[kind] += self.smoothing * (seconds - self._estimates[kind])
+
+    @contextlib.contextmanager
+    def measure(self, kind):
+        """Context observing the duration of the requests it wraps."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(kind, time.monotonic() - start)
+
+
+class AddedTracks(list):
+    """
+    IDs of tracks added by add_tracks (a plain list), with the searches made
+    and the work left if the job stopped at its deadline.
+
+    Parameters
+    ----------
+    ids : list of str
+        IDs of tracks added.
+    remaining : list of str, optional
+        IDs of source tracks not matched yet.
+    pending : list of str, optional
+        IDs of tracks matched but not inserted yet.
+    elapsed : float, optional
+        Duration of the job in seconds.
+    n_searched : int, default=0
+        Number of source tracks searched (see _match_track).
+    n_reused : int, default=0
+        Number of distinct source tracks found in the match table passed to
+        add_tracks, i.e. searches saved by sharing it.
+
+    Attributes
+    ----------
+    complete : bool
+        Whether the job completed, i.e. no work is left.
+
+    """
+    def __init__(self, ids=(), remaining=(), pending=(), elapsed=None, n_searched=0, n_reused=0):
+        super().__init__(ids)
+        self.remaining = list(remaining)
+        self.pending = list(pending)
+        self.elapsed = elapsed
+        self.n_searched = n_searched
+        self.n_reused = n_reused
+
+    @property
+    def complete(self):
+        return not self.remaining and not self.pending
+
+    def to_dict(self):
+        """Summary of the job, e.g. for logs or a scheduler."""
+        return {'complete': self.complete, 'added': list(self), 'remaining': self.remaining,
+                'pending': self.pending, 'elapsed': self.elapsed, 'searched': self.n_searched,
+                'reused': self.n_reused}
+
+
+@contextlib.contextmanager
+def requests_until(at):
+    """
+    Context in which requests (see `call`) must complete by `at` (absolute
+    time.monotonic), None for no deadline.
+
+    """
+    token = _REQUEST_DEADLINE.set(at)
+    try:
+        yield
+    finally:
+        _REQUEST_DEADLINE.reset(token)
+
+
+def _get_executor():
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='deadline')
+        return _EXECUTOR
+
+
+def _call_without_deadline(function):
+    with requests_until(None):
+        return function()
+
+
+def call(function):
+    """
+    Call `function` (no arguments), with a timeout derived from the deadline
+    of the current context if any (see `requests_until`).
+
+    """
+    at = _REQUEST_DEADLINE.get()
+    if at is None:
+        return function()
+    timeout = at - time.monotonic()
+    if timeout <= 0:
+        raise DeadlineExceeded('no time left for request')
+    future = _get_executor().submit(contextvars.copy_context().run, _call_without_deadline, function)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        # the same class as the builtin TimeoutError only from Python 3.11
+        if future.done():
+            # the request itself timed out
+            raise
+        METRICS.increment('request_timeouts')
+        raise DeadlineExceeded(f'request did not complete within {timeout:.2f}s') from None
@@ -0,0 +1,166 @@
+"""
+Enrichment of Spotify tracks with audio features (tempo, energy, key, ...)
+and track metadata (duration, popularity, release date), for analytics. IDs
+are grouped in batches of the maximum size accepted by each endpoint (100 per
+audio features call, 50 per tracks call), batches are requested concurrently
+and results are cached persistently: enriching 20k tracks costs a couple of
+hundred calls once, and nothing afterwards.
+
+The cache is a JSON lines file per endpoint under CACHE_DIR/enrichment, one
+line per batch. Tracks unknown to the endpoint are cached as null, so that
+they are not requested again either.
+
+Example
+-------
+playlist = SpotifyChannel()['microhouse case']
+features = playlist.enrich()
+df = playlist.to_dataframe().join(pd.DataFrame.from_dict(features, orient='index'), on='id')
+
+"""
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from bes import CACHE_DIR, api
+from bes.journal import JsonLines
+from bes.metrics import METRICS
+from bes.pagination import MAX_WORKERS
+
+ENRICHMENT_DIR = CACHE_DIR / 'enrichment'
+# maximum number of IDs per request
+MAX_IDS = {
+    'audio_features': 100,
+    'tracks': 50,
+}
+# track metadata fields kept from the tracks endpoint
+METADATA_FIELDS = ('duration_ms', 'popularity', 'explicit', 'release_date')
+
+logger = logging.getLogger(__name__)
+
+
+class EnrichmentCache(object):
+    """
+    Persistent cache of the responses of one endpoint, by track ID.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path to the JSON lines file backing the cache.
+
+    Attributes
+    ----------
+    values : dict
+        Track ID -> cached value (None if unknown to the endpoint).
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.values = {}
+        self._file = JsonLines(path)
+        self._file.replay(self.values.update)
+
+    @classmethod
+    def open(cls, endpoint):
+        return cls(ENRICHMENT_DIR / f'{endpoint}.jsonl')
+
+    def update(self, values):
+        """Add values (track ID -> value) to the cache."""
+        self.values.update(values)
+        self._file.append(values)
+
+    def __contains__(self, id):
+        return id in self.values
+
+
+def _fetch_audio_features(client, ids):
+    response = client.audio_features(ids)
+    return dict(zip(ids, response or [None] * len(ids)))
+
+
+def _fetch_metadata(client, ids):
+    response = client.tracks(ids)
+    values = dict.fromkeys(ids)
+    for item in response['tracks']:
+        if item is None:
+            continue
+        metadata = {field: item.get(field) for field in METADATA_FIELDS}
+        metadata['release_date'] = (item.get('album') or {}).get('release_date')
+        values[item['id']] = metadata
+    return values
+
+
+FETCHERS = {
+    'audio_features': _fetch_audio_features,
+    'tracks': _fetch_metadata,
+}
+
+
+def fetch(ids, endpoint, max_workers=MAX_WORKERS, cache=None):
+    """
+    Fetch values of `endpoint` for track IDs, from the cache or in batches.
+
+    Parameters
+    ----------
+    ids : iterable of str
+        Spotify track IDs.
+    endpoint : str
+        'audio_features' or 'tracks' (metadata).
+    max_workers : int, default=MAX_WORKERS
+        Maximum number of batches requested at the same time.
+    cache : bes.enrich.EnrichmentCache, optional
+        Cache to use, the persistent cache of the endpoint by default.
+
+    Returns
+    -------
+    values : dict
+        Track ID -> value (None if unknown to the endpoint).
+
+    """
+    cache = EnrichmentCache.open(endpoint) if cache is None else cache
+    ids = list(dict.fromkeys(id for id in ids if id is not None))
+    missing = [id for id in ids if id not in cache]
+    METRICS.increment('enrichment_cache_hits', len(ids) - len(missing), endpoint=endpoint)
+    METRICS.increment('enrichment_cache_misses', len(missing), endpoint=endpoint)
+
+    size = MAX_IDS[endpoint]
+    batches = [missing[i:i + size] for i in range(0, len(missing), size)]
+    if batches:
+        logger.info('fetching %s of %d tracks in %d requests (%d cached)',
+                    endpoint, len(missing), len(batches), len(ids) - len(missing))
+    # resolved here, worker threads do not see the account in use (see bes.api.use_account)
+    fetch_batch = functools.partial(FETCHERS[endpoint], api.get_or_create_spotify_api())
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # cache each batch as soon as it is in, so an interrupted pass is not lost
+        for values in executor.map(fetch_batch, batches):
+            cache.update(values)
+    return {id: cache.values[id] for id in ids}
+
+
+def enrich(ids, metadata=False, max_workers=MAX_WORKERS):
+    """
+    Audio features (and optionally metadata) of Spotify tracks.
+
+    Parameters
+    ----------
+    ids : iterable of str
+        Spotify track IDs.
+    metadata : bool, default=False
+        Also fetch track metadata (see METADATA_FIELDS), only needed if the
+        tracks were not listed from Spotify (e.g. matched from YouTube).
+    max_workers : int, default=MAX_WORKERS
+        Maximum number of batches requested at the same time.
+
+    Returns
+    -------
+    features : dict
+        Track ID -> dict of audio features (and metadata), empty for tracks
+        unknown to Spotify.
+
+    """
+    ids = list(ids)
+    features = {id: dict(value or {}) for id, value in
+                fetch(ids, 'audio_features', max_workers=max_workers).items()}
+    if metadata:
+        for id, value in fetch(ids, 'tracks', max_workers=max_workers).items():
+            features[id].update(value or {})
+    return features
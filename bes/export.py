@@ -0,0 +1,182 @@
+"""
+Bulk export of playlists to tabular formats, for statistics about a library
+(see the notebooks). Tracks are streamed into columnar batches (a dict of
+column name -> list of values) of bounded size:
+  * tracks of playlists already loaded are read from memory, straight from
+    the columns if the playlist is columnar (see bes.store),
+  * playlists of channels with a memory budget are loaded (from the local
+    cache if they were evicted, see bes.cache), the budget bounding memory,
+  * other playlists are streamed page by page from the API without caching
+    their tracks, so the raw JSON of at most one page is held in memory.
+
+Batches can be gathered into a pandas DataFrame or written to Parquet or
+Arrow IPC files batch by batch. pandas and pyarrow are optional dependencies,
+only required by the respective functions.
+
+Example
+-------
+df = SpotifyChannel().to_dataframe()
+df.groupby('playlist')['popularity'].median()
+
+"""
+from bes.store import TrackStore, _get_numeric_fields
+
+COLUMNS = ('backend', 'playlist', 'playlist_id', 'id', 'title', 'artists',
+           'duration', 'popularity', 'release_year')
+NUMERIC_COLUMNS = ('duration', 'popularity', 'release_year')
+BATCH_SIZE = 10000
+
+
+def _iter_tracks(playlist):
+    """
+    Tracks of playlist in chunks: all of them if loaded (a TrackStore if the
+    playlist is columnar) or if memory is bounded (see bes.cache), page by
+    page from the API otherwise.
+
+    """
+    if playlist._tracks is not None or playlist._memory is not None:
+        yield playlist.tracks
+    else:
+        yield from playlist._iter_pages()
+
+
+def _to_columns(playlist, tracks):
+    """Columns of a chunk of tracks of playlist."""
+    if isinstance(tracks, TrackStore):
+        columns = {
+            'id': tracks.column('id'),
+            'title': tracks.column('title'),
+            'artists': tracks.column('artists'),
+        }
+        for name in NUMERIC_COLUMNS:
+            columns[name] = [None if value < 0 else value for value in tracks.column(name)]
+    else:
+        numeric = [_get_numeric_fields(track) for track in tracks]
+        columns = {
+            'id': [track.id for track in tracks],
+            'title': [track.title for track in tracks],
+            'artists': [list(track.artists) for track in tracks],
+        }
+        for i, name in enumerate(NUMERIC_COLUMNS):
+            columns[name] = [None if values[i] < 0 else values[i] for values in numeric]
+    n = len(columns['id'])
+    columns['backend'] = [playlist.backend] * n
+    columns['playlist'] = [playlist.name] * n
+    columns['playlist_id'] = [playlist.id] * n
+    return {name: columns[name] for name in COLUMNS}
+
+
+def iter_batches(playlists, batch_size=BATCH_SIZE):
+    """
+    Stream the tracks of playlists into columnar batches.
+
+    Parameters
+    ----------
+    playlists : iterable of bes.playlist.PlayList
+        Playlists to export.
+    batch_size : int, default=BATCH_SIZE
+        Maximum number of tracks per batch.
+
+    Yields
+    ------
+    batch : dict
+        Column name (see COLUMNS) -> list of values. Missing numeric values
+        (e.g. popularity of YouTube tracks) are None.
+
+    """
+    batch = {name: [] for name in COLUMNS}
+    size = 0
+    for playlist in playlists:
+        for tracks in _iter_tracks(playlist):
+            columns = _to_columns(playlist, tracks)
+            start, n = 0, len(columns['id'])
+            while start < n:
+                stop = min(n, start + batch_size - size)
+                for name in COLUMNS:
+                    batch[name].extend(columns[name][start:stop])
+                size += stop - start
+                start = stop
+                if size == batch_size:
+                    yield batch
+                    batch = {name: [] for name in COLUMNS}
+                    size = 0
+    if size:
+        yield batch
+
+
+def to_dataframe(playlists, batch_size=BATCH_SIZE):
+    """
+    Export tracks of playlists to a pandas DataFrame, one row per track and
+    playlist, see iter_batches for columns.
+
+    """
+    import pandas as pd
+    frames = [pd.DataFrame(batch) for batch in iter_batches(playlists, batch_size)]
+    if not frames:
+        return pd.DataFrame({name: [] for name in COLUMNS})
+    df = pd.concat(frames, ignore_index=True)
+    for name in NUMERIC_COLUMNS:
+        df[name] = df[name].astype('Int64')
+    for name in ('backend', 'playlist', 'playlist_id'):
+        df[name] = df[name].astype('category')
+    return df
+
+
+def _get_schema(dictionary=True):
+    import pyarrow as pa
+    # Arrow IPC files do not support dictionaries changing across batches
+    label = pa.dictionary(pa.int32(), pa.string()) if dictionary else pa.string()
+    return pa.schema([
+        ('backend', label),
+        ('playlist', label),
+        ('playlist_id', label),
+        ('id', pa.string()),
+        ('title', pa.string()),
+        ('artists', pa.list_(pa.string())),
+        ('duration', pa.int32()),
+        ('popularity', pa.int16()),
+        ('release_year', pa.int16()),
+    ])
+
+
+def write(playlists, path, format='parquet', batch_size=BATCH_SIZE):
+    """
+    Write tracks of playlists to a Parquet or Arrow IPC file, one batch at a
+    time, see iter_batches for columns.
+
+    Parameters
+    ----------
+    playlists : iterable of bes.playlist.PlayList
+        Playlists to export.
+    path : str or pathlib.Path
+        Path of file to write.
+    format : str, default='parquet'
+        'parquet' or 'arrow' (Arrow IPC file, a.k.a. Feather v2).
+    batch_size : int, default=BATCH_SIZE
+        Maximum number of tracks per batch (Parquet row group).
+
+    Returns
+    -------
+    n_rows : int
+        Number of rows written.
+
+    """
+    import pyarrow as pa
+    schema = _get_schema(dictionary=format == 'parquet')
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(str(path), schema)
+    elif format == 'arrow':
+        writer = pa.ipc.new_file(str(path), schema)
+    else:
+        raise ValueError(f'unknown format {format}, expected parquet or arrow')
+    n_rows = 0
+    with writer:
+        for batch in iter_batches(playlists, batch_size):
+            record_batch = pa.RecordBatch.from_pydict(batch, schema=schema)
+            if format == 'parquet':
+                writer.write_batch(record_batch)
+            else:
+                writer.write(record_batch)
+            n_rows += record_batch.num_rows
+    return n_rows
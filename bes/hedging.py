@@ -0,0 +1,182 @@
+"""
+Opt-in hedging of read requests, to cut tail latency. Searches and track
+lookups occasionally take seconds instead of milliseconds, and when a sync
+issues thousands of them those outliers dominate the wall time. When hedging
+is enabled, a lookup which has not answered by an adaptive deadline (a high
+percentile of the recent latencies of the endpoint) is issued a second time,
+and whichever response arrives first is used.
+
+Only idempotent reads listed in HEDGED_ENDPOINTS are hedged, and the number
+of extra requests is capped to a fraction (`budget`) of the calls of each
+endpoint. Note that on YouTube a hedged search costs quota like any other
+search (100 points), keep the budget low there. Hedges issued and won are
+recorded in bes.metrics ('hedges' and 'hedge_wins' counters).
+
+Example
+-------
+from bes import hedging
+hedging.enable(percentile=0.95, budget=0.05)
+spotify_playlist.add_tracks(youtube_playlist)
+hedging.HEDGER.stats()
+
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from bes.metrics import METRICS
+
+# idempotent read endpoints which may be hedged, per backend
+HEDGED_ENDPOINTS = {
+    'spotify': {'search', 'tracks'},
+    'youtube': {'search.list'},
+}
+
+HEDGER = None
+
+
+class Hedger(object):
+    """
+    Issue hedged requests for the endpoints in `endpoints`.
+
+    Parameters
+    ----------
+    percentile : float, default=0.95
+        Percentile of recent latencies after which a hedge is issued.
+    budget : float, default=0.05
+        Maximum number of hedges, as a fraction of the calls of an endpoint.
+    min_delay : float, default=0.05
+        Minimum deadline in seconds, so that fast endpoints are not hedged
+        on noise.
+    window : int, default=200
+        Number of recent latencies the deadline is computed from.
+    min_samples : int, default=20
+        Number of latencies to observe before hedging an endpoint.
+    max_workers : int, default=32
+        Maximum number of requests in flight through the hedger.
+    endpoints : dict, default=HEDGED_ENDPOINTS
+        Backend -> set of endpoints which may be hedged.
+
+    """
+    def __init__(self, percentile=0.95, budget=0.05, min_delay=0.05, window=200,
+                 min_samples=20, max_workers=32, endpoints=HEDGED_ENDPOINTS):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.endpoints = endpoints
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._calls = defaultdict(int)
+        self._hedges = defaultdict(int)
+        self._wins = defaultdict(int)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def deadline(self, backend, endpoint):
+        """Current hedging deadline of endpoint in seconds, None if unknown yet."""
+        with self._lock:
+            latencies = sorted(self._latencies[(backend, endpoint)])
+        if len(latencies) < self.min_samples:
+            return None
+        index = min(int(self.percentile * len(latencies)), len(latencies) - 1)
+        return max(latencies[index], self.min_delay)
+
+    def _observe(self, key, start, future):
+        if future.exception() is None:
+            with self._lock:
+                self._latencies[key].append(time.perf_counter() - start)
+
+    def _submit(self, key, function):
+        start = time.perf_counter()
+        future = self._executor.submit(function)
+        future.add_done_callback(lambda f: self._observe(key, start, f))
+        return future
+
+    def _can_hedge(self, key):
+        with self._lock:
+            if self._hedges[key] + 1 > self.budget * self._calls[key]:
+                return False
+            self._hedges[key] += 1
+            return True
+
+    def call(self, backend, endpoint, function):
+        """
+        Call `function` (taking no argument and issuing one request to
+        `endpoint`), hedged if the endpoint may be hedged.
+
+        """
+        if endpoint not in self.endpoints.get(backend, ()):
+            return function()
+        key = (backend, endpoint)
+        with self._lock:
+            self._calls[key] += 1
+        primary = self._submit(key, function)
+        deadline = self.deadline(backend, endpoint)
+        if deadline is None:
+            return primary.result()
+        done, _ = wait([primary], timeout=deadline)
+        if done or not self._can_hedge(key):
+            return primary.result()
+
+        METRICS.increment('hedges', backend=backend, endpoint=endpoint)
+        hedge = self._submit(key, function)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self._wins[key] += 1
+                        METRICS.increment('hedge_wins', backend=backend, endpoint=endpoint)
+                    return future.result()
+        # both failed, surface the error of the original request
+        return primary.result()
+
+    def stats(self):
+        """
+        Hedging statistics per endpoint.
+
+        Returns
+        -------
+        stats : dict
+            '<backend> <endpoint>' -> dict with number of calls, hedges
+            issued, hedges won (answered first) and current deadline.
+
+        """
+        return {
+            f'{backend} {endpoint}': {
+                'calls': self._calls[(backend, endpoint)],
+                'hedges': self._hedges[(backend, endpoint)],
+                'wins': self._wins[(backend, endpoint)],
+                'deadline': self.deadline(backend, endpoint),
+            }
+            for backend, endpoint in list(self._calls)
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def enable(**kwargs):
+    """Enable hedging, see Hedger for arguments."""
+    global HEDGER
+    disable()
+    HEDGER = Hedger(**kwargs)
+    return HEDGER
+
+
+def disable():
+    """Disable hedging."""
+    global HEDGER
+    if HEDGER is not None:
+        HEDGER.shutdown()
+    HEDGER = None
+
+
+def call(backend, endpoint, function):
+    """Call `function`, through the hedger if hedging is enabled."""
+    if HEDGER is None:
+        return function()
+    return HEDGER.call(backend, endpoint, function)
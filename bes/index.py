@@ -0,0 +1,124 @@
+"""
+Channel-wide reverse index of tracks: track ID -> IDs of the playlists of
+the channel containing it, to answer "which of my playlists already contain
+this track?" in O(1), without fetching every playlist.
+
+The index is built incrementally: each time a playlist of the channel is
+loaded, its tracks replace its previous entry, and tracks added by
+add_tracks are added to it. It is persisted as a JSON lines file per channel
+under CACHE_DIR/index (appended to, and compacted when mostly made of
+outdated lines), so that later sessions can answer queries before loading
+any playlist. Each entry records the size of the playlist when indexed, so
+that entries outdated by changes made elsewhere can be told apart (see
+bes.channel.Channel.refresh_index).
+
+Example
+-------
+channel = SpotifyChannel()
+channel.refresh_index()
+channel.get_playlists_containing(track_id)
+
+"""
+import re
+import threading
+
+from bes import CACHE_DIR
+from bes.journal import JsonLines
+
+INDEX_DIR = CACHE_DIR / 'index'
+
+
+class TrackIndex(object):
+    """
+    Reverse index of the tracks of a channel, see module docstring. Use
+    `TrackIndex.open` rather than instantiating it yourself.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path to the JSON lines file backing the index.
+
+    Attributes
+    ----------
+    sizes : dict
+        Playlist ID -> number of tracks when indexed.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.sizes = {}
+        # playlist ID -> set of track IDs, and the reverse
+        self._tracks = {}
+        self._playlists = {}
+        self._lock = threading.Lock()
+        self._file = JsonLines(path)
+        self._file.replay(self._apply)
+
+    @classmethod
+    def open(cls, backend, name):
+        """Open the index of channel `name` (e.g. user ID) on backend."""
+        name = re.sub(r'[^\w\-]', '_', f'{backend}-{name}')
+        return cls(INDEX_DIR / f'{name}.jsonl')
+
+    def _apply(self, entry):
+        playlist_id = entry['playlist']
+        if 'ids' in entry:
+            for id in self._tracks.pop(playlist_id, ()):
+                self._playlists[id].discard(playlist_id)
+                if not self._playlists[id]:
+                    del self._playlists[id]
+            self._tracks[playlist_id] = set()
+        tracks = self._tracks.setdefault(playlist_id, set())
+        for id in entry.get('ids', entry.get('added', ())):
+            tracks.add(id)
+            self._playlists.setdefault(id, set()).add(playlist_id)
+        self.sizes[playlist_id] = entry['size']
+
+    def _append(self, entry):
+        self._apply(entry)
+        self._file.append(entry)
+        if self._file.should_compact(len(self._tracks)):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the file with one line per playlist."""
+        self._file.rewrite({'playlist': playlist_id, 'size': self.sizes[playlist_id], 'ids': sorted(ids)}
+                           for playlist_id, ids in self._tracks.items())
+
+    def update(self, playlist_id, ids, size=None):
+        """
+        Replace the tracks of playlist by track IDs `ids` (all of them).
+        `size` is the number of tracks reported by the playlist metadata the
+        tracks were loaded against (see is_fresh), which may count items
+        without a track (e.g. deleted videos), `len(ids)` if unknown.
+
+        """
+        ids = list(ids)
+        size = len(ids) if size is None else size
+        with self._lock:
+            self._append({'playlist': playlist_id, 'size': size, 'ids': list(dict.fromkeys(ids))})
+
+    def add(self, playlist_id, ids):
+        """Add track IDs `ids` to the tracks of playlist."""
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock:
+            size = self.sizes.get(playlist_id, 0) + len(ids)
+            self._append({'playlist': playlist_id, 'size': size, 'added': ids})
+
+    def get(self, track_id):
+        """IDs of the playlists containing track, empty if none."""
+        return set(self._playlists.get(track_id, ()))
+
+    def is_fresh(self, playlist):
+        """Whether playlist was indexed with the size reported by its metadata."""
+        return playlist.id in self.sizes and playlist.size == self.sizes[playlist.id]
+
+    def __contains__(self, track_id):
+        """Whether any playlist contains track."""
+        return track_id in self._playlists
+
+    def __len__(self):
+        """Number of distinct tracks indexed."""
+        return len(self._playlists)
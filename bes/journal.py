@@ -0,0 +1,220 @@
+"""
+Durable journal of add_tracks jobs. Each job (adding the tracks of a source
+playlist to a target playlist) appends its progress to a JSON lines file:
+which source tracks were matched to which target IDs, which IDs are pending
+and which were inserted. If the job dies halfway (quota exceeded, network
+error), the next run replays the journal and resumes from where it stopped
+without searching the same tracks again nor inserting the same tracks twice.
+Journals of jobs run within bes.api.use_account are kept in a directory per
+account.
+
+The append-only JSON lines file backing journals (see JsonLines) also backs
+the other persistent stores of bes: the track index (bes.index), the
+enrichment cache (bes.enrich) and the candidate store (bes.candidates).
+
+"""
+import json
+import logging
+import os
+import re
+
+from bes import CACHE_DIR, api
+
+JOURNAL_DIR = CACHE_DIR / 'journals'
+
+logger = logging.getLogger(__name__)
+
+
+class JsonLines(object):
+    """
+    Append-only JSON lines file, one entry (dict) per line. Entries are
+    replayed in order to rebuild the state they describe, and the file can
+    be rewritten with the entries describing the current state only once
+    mostly made of outdated lines (see `should_compact`).
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path to the file.
+    fsync : bool, default=True
+        Whether to force each line written to disk. Caches may skip it: a
+        lost line only means requesting it again.
+
+    Attributes
+    ----------
+    n_lines : int
+        Number of lines of the file, as replayed and written so far.
+
+    """
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self.n_lines = 0
+
+    def replay(self, apply):
+        """Call `apply` on each entry of the file, in order, if it exists."""
+        if not self.path.exists():
+            return
+        with open(self.path, 'r') as handle:
+            for line in handle:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # last line may have been cut short by a crash
+                    break
+                apply(entry)
+                self.n_lines += 1
+
+    def _sync(self, handle):
+        if self.fsync:
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def append(self, entry):
+        """Append entry to the file."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a') as handle:
+            handle.write(json.dumps(entry) + '\n')
+            self._sync(handle)
+        self.n_lines += 1
+
+    def should_compact(self, n_entries):
+        """
+        Whether the file is mostly made of outdated lines, `n_entries` being
+        the number of entries describing the current state.
+
+        """
+        return self.n_lines > 2 * n_entries + 100
+
+    def rewrite(self, entries):
+        """Replace the content of the file by entries, atomically."""
+        entries = list(entries)
+        path = self.path.with_suffix('.tmp')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as handle:
+            for entry in entries:
+                handle.write(json.dumps(entry) + '\n')
+            self._sync(handle)
+        os.replace(path, self.path)
+        self.n_lines = len(entries)
+
+    def discard(self):
+        """Delete the file."""
+        if self.path.exists():
+            self.path.unlink()
+        self.n_lines = 0
+
+
+class Journal(object):
+    """
+    Journal of an add_tracks job. Use `Journal.open` rather than instantiating
+    it yourself.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path to the JSON lines file backing the journal.
+
+    Attributes
+    ----------
+    matched : dict
+        Source track ID -> matched target track ID, or None if no match was
+        found (so that we do not search for it again either).
+    pending : list of str
+        Target track IDs which remain to be inserted.
+    inserted : set of str
+        Target track IDs already inserted.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = JsonLines(path)
+        self.matched = {}
+        self.pending = []
+        self.inserted = set()
+
+    @classmethod
+    def open(cls, source, target, resume=True):
+        """
+        Open the journal of the job adding tracks of `source` to `target`.
+
+        Parameters
+        ----------
+        source : bes.playlist.PlayList
+            Playlist the tracks are added from.
+        target : bes.playlist.PlayList
+            Playlist the tracks are added to.
+        resume : bool, default=True
+            Replay the existing journal if any, otherwise start from scratch.
+
+        Returns
+        -------
+        journal : bes.journal.Journal
+
+        """
+        journal = cls(cls._get_path(source, target))
+        if resume and journal.path.exists():
+            journal._replay()
+            logger.info('resuming job from %s: %d tracks already matched, %d inserted',
+                        journal.path, len(journal.matched), len(journal.inserted))
+        else:
+            journal.discard()
+        return journal
+
+    @classmethod
+    def load(cls, source, target):
+        """
+        Read the journal of the job adding tracks of `source` to `target`,
+        without modifying it (empty journal if there is none).
+
+        """
+        journal = cls(cls._get_path(source, target))
+        if journal.path.exists():
+            journal._replay()
+        return journal
+
+    @staticmethod
+    def _get_path(source, target):
+        name = f'{source.backend}-{source.id or source.name}-to-' \
+               f'{target.backend}-{target.id or target.name}'
+        name = re.sub(r'[^\w\-]', '_', name)
+        account = api.get_account()
+        if account is not None:
+            # e.g. saved tracks have no ID, keep jobs of different users apart
+            return JOURNAL_DIR / re.sub(r'[^\w\-]', '_', account.name) / f'{name}.jsonl'
+        return JOURNAL_DIR / f'{name}.jsonl'
+
+    def _replay(self):
+        self._file.replay(self._apply)
+        self.pending = [id for id in self.pending if id not in self.inserted]
+
+    def _apply(self, entry):
+        if entry['event'] == 'matched':
+            self.matched[entry['source']] = entry['target']
+        elif entry['event'] == 'pending':
+            self.pending = entry['ids']
+        elif entry['event'] == 'inserted':
+            self.inserted.update(entry['ids'])
+
+    def _append(self, entry):
+        self._file.append(entry)
+
+    def record_matched(self, source_id, target_id):
+        """Record match (or absence of match if `target_id` is None)."""
+        self.matched[source_id] = target_id
+        self._append({'event': 'matched', 'source': source_id, 'target': target_id})
+
+    def record_pending(self, ids):
+        """Record the IDs which are about to be inserted."""
+        self.pending = list(ids)
+        self._append({'event': 'pending', 'ids': self.pending})
+
+    def record_inserted(self, ids):
+        """Record IDs which were successfully inserted."""
+        self.inserted.update(ids)
+        self.pending = [id for id in self.pending if id not in self.inserted]
+        self._append({'event': 'inserted', 'ids': list(ids)})
+
+    def discard(self):
+        """Delete journal, typically once the job completed."""
+        self._file.discard()
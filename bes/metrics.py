@@ -0,0 +1,185 @@
+"""
+Metrics of sync runs: API calls and latency per endpoint, YouTube quota
+spent, match cache hits, match rate, tracks per second, etc. Metrics are
+recorded in the module level registry METRICS (the same way bes.api keeps
+module level API endpoints), and written out through pluggable sinks:
+  * MemorySink: keeps snapshots in memory (handy in notebooks and tests).
+  * JsonLinesSink: appends one JSON snapshot per flush to a file.
+  * PrometheusSink: writes the Prometheus text exposition format to a file,
+    to be picked up by the node exporter textfile collector.
+
+Example
+-------
+from bes import metrics
+sink = metrics.MemorySink()
+metrics.METRICS.add_sink(sink)
+spotify_playlist.add_tracks(youtube_playlist)
+sink.snapshots[-1]['counters']
+
+"""
+import bisect
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+# latency histogram buckets, in seconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., math.inf)
+
+
+class Histogram(object):
+    """Cumulative histogram with fixed buckets, Prometheus style."""
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        cumulative, total = {}, 0
+        for bucket, count in zip(self.buckets, self.counts):
+            total += count
+            cumulative[str(bucket)] = total
+        return {'count': self.count, 'sum': self.sum, 'buckets': cumulative}
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def _format_key(key):
+    name, labels = key
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{label}="{value}"' for label, value in labels) + '}'
+
+
+class Metrics(object):
+    """
+    Registry of counters, gauges and histograms, identified by a name and
+    optional labels. Thread safe.
+
+    """
+    def __init__(self):
+        self.sinks = []
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget all recorded metrics (sinks are kept)."""
+        with self._lock:
+            self.counters = defaultdict(float)
+            self.gauges = {}
+            self.histograms = defaultdict(Histogram)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def increment(self, name, value=1, **labels):
+        """Increment counter."""
+        with self._lock:
+            self.counters[_key(name, labels)] += value
+
+    def set(self, name, value, **labels):
+        """Set gauge."""
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """Add observation to histogram."""
+        with self._lock:
+            self.histograms[_key(name, labels)].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Context manager observing the time spent in the block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def get(self, name, **labels):
+        """Get value of a counter (or gauge), 0 if never recorded."""
+        key = _key(name, labels)
+        with self._lock:
+            return self.gauges.get(key, self.counters.get(key, 0))
+
+    def snapshot(self):
+        """Current state of all metrics as a JSON serializable dict."""
+        with self._lock:
+            return {
+                'time': time.time(),
+                'counters': {_format_key(k): v for k, v in self.counters.items()},
+                'gauges': {_format_key(k): v for k, v in self.gauges.items()},
+                'histograms': {_format_key(k): h.to_dict() for k, h in self.histograms.items()},
+            }
+
+    def flush(self):
+        """Write current metrics to all sinks."""
+        if not self.sinks:
+            return
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink.write(snapshot)
+
+
+class MemorySink(object):
+    """Keep all snapshots in memory."""
+    def __init__(self):
+        self.snapshots = []
+
+    def write(self, snapshot):
+        self.snapshots.append(snapshot)
+
+
+class JsonLinesSink(object):
+    """Append snapshots to a JSON lines file."""
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, snapshot):
+        with open(self.path, 'a') as handle:
+            handle.write(json.dumps(snapshot) + '\n')
+
+
+class PrometheusSink(object):
+    """
+    Write latest snapshot to a file in Prometheus text exposition format.
+    The file is replaced atomically so that scrapers never read half of it.
+
+    """
+    def __init__(self, path, prefix='bes_'):
+        self.path = str(path)
+        self.prefix = prefix
+
+    def write(self, snapshot):
+        lines = []
+        for metrics in (snapshot['counters'], snapshot['gauges']):
+            for key, value in metrics.items():
+                lines.append(f'{self.prefix}{key} {value}')
+        for key, histogram in snapshot['histograms'].items():
+            name, _, labels = key.partition('{')
+            labels = labels.rstrip('}')
+            for bucket, count in histogram['buckets'].items():
+                le = '+Inf' if bucket == 'inf' else bucket
+                bucket_labels = ','.join(filter(None, [labels, f'le="{le}"']))
+                lines.append(f'{self.prefix}{name}_bucket{{{bucket_labels}}} {count}')
+            suffix = f'{{{labels}}}' if labels else ''
+            lines.append(f'{self.prefix}{name}_count{suffix} {histogram["count"]}')
+            lines.append(f'{self.prefix}{name}_sum{suffix} {histogram["sum"]}')
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as handle:
+            handle.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.path)
+
+
+METRICS = Metrics()
@@ -0,0 +1,71 @@
+"""
+Offset-based pagination. Spotify collections (playlist tracks, saved tracks,
+user playlists) are addressable by offset and the first page already tells
+us the total number of items, so once it is in we know every remaining offset
+and can request the pages concurrently instead of one after the other.
+
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# maximum number of page requests in flight at any given time
+MAX_WORKERS = 8
+
+
+def iter_pages(fetch, limit, max_workers=MAX_WORKERS):
+    """
+    Iterate over the pages of an offset-addressable collection, in order. The
+    first page is fetched on its own to learn the total, then the remaining
+    pages are requested concurrently with at most `max_workers` requests in
+    flight, and yielded in offset order as soon as they are available.
+
+    Parameters
+    ----------
+    fetch : callable
+        Function taking `limit` and `offset` keyword arguments and returning
+        the response JSON, i.e. a dict with 'items' and 'total' keys. Usually
+        a spotipy method with the other arguments bound with functools.partial.
+    limit : int
+        Number of items per page (the maximum allowed by the endpoint).
+    max_workers : int, default=MAX_WORKERS
+        Maximum number of page requests in flight.
+
+    Yields
+    ------
+    items : list of dict
+        Items of each page.
+
+    """
+    response = fetch(limit=limit, offset=0)
+    yield response['items']
+
+    offsets = iter(range(limit, response['total'], limit))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # keep a bounded window of pending pages, refilled as pages are consumed
+        window = deque()
+        for offset in offsets:
+            window.append(executor.submit(fetch, limit=limit, offset=offset))
+            if len(window) == max_workers:
+                break
+        while window:
+            response = window.popleft().result()
+            for offset in offsets:
+                window.append(executor.submit(fetch, limit=limit, offset=offset))
+                break
+            yield response['items']
+
+
+def paginate(fetch, limit, max_workers=MAX_WORKERS):
+    """
+    Fetch all items of an offset-addressable collection. See `iter_pages`.
+
+    Returns
+    -------
+    items : list of dict
+        All items of the collection, in order.
+
+    """
+    items = []
+    for page in iter_pages(fetch, limit, max_workers=max_workers):
+        items.extend(page)
+    return items
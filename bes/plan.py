@@ -0,0 +1,262 @@
+"""
+Dry-run planning of syncs. Before launching a big sync, estimate how many API
+calls it will take (per endpoint), how many YouTube quota points it will cost
+and how long it will take, from what we already know locally: the number of
+tracks reported by the playlist metadata (or the tracks themselves if already
+loaded), the journals of interrupted jobs and match tables. Planning never
+calls any API, let alone write endpoints.
+
+"""
+import heapq
+import json
+from collections import Counter
+
+from bes.api import YOUTUBE_QUOTA_COSTS
+from bes.journal import Journal
+from bes.pagination import MAX_WORKERS
+
+ENDPOINTS = {
+    'youtube': {
+        'list': 'playlistItems.list',
+        'search': 'search.list',
+        'insert': 'playlistItems.insert',
+        'create': 'playlists.insert',
+    },
+    'spotify': {
+        'list': 'user_playlist_tracks',
+        'search': 'search',
+        'insert': 'playlist_add_items',
+        'create': 'user_playlist_create',
+    },
+}
+# rough average latency of one request in seconds
+LATENCY = {
+    'youtube': 0.3,
+    'spotify': 0.2,
+}
+
+
+class Plan(object):
+    """
+    Plan of one or several add_tracks jobs.
+
+    Attributes
+    ----------
+    jobs : list of dict
+        Per job estimates.
+    calls : collections.Counter
+        Expected number of calls per endpoint ('<backend> <endpoint>').
+    quota : int
+        Projected YouTube quota points.
+    wall_time : float
+        Estimated wall time in seconds.
+    unknown_sizes : list of str
+        Playlists whose size is unknown (neither loaded nor reported by the
+        metadata), counted as empty: the plan underestimates them.
+
+    """
+    def __init__(self):
+        self.jobs = []
+        self.calls = Counter()
+        self.quota = 0
+        self.wall_time = 0.
+        self.unknown_sizes = []
+
+    def add_calls(self, backend, endpoint, count, rounds, latency=LATENCY):
+        """
+        Add `count` calls to `endpoint`, issued in `rounds` sequential rounds
+        (i.e. count / rounds calls in flight at a time).
+
+        """
+        if not count:
+            return
+        name = ENDPOINTS[backend][endpoint]
+        self.calls[f'{backend} {name}'] += count
+        if backend == 'youtube':
+            self.quota += count * YOUTUBE_QUOTA_COSTS[name]
+        self.wall_time += rounds * latency[backend]
+
+    @property
+    def tracks_to_search(self):
+        return sum(job['tracks to search'] for job in self.jobs)
+
+    @property
+    def tracks_to_add(self):
+        return sum(job['tracks to add'] for job in self.jobs)
+
+    def to_dict(self):
+        return {
+            'tracks to search': self.tracks_to_search,
+            'tracks to add': self.tracks_to_add,
+            'calls': dict(self.calls),
+            'quota': self.quota,
+            'wall time': round(self.wall_time, 1),
+            'unknown sizes': self.unknown_sizes,
+            'jobs': self.jobs,
+        }
+
+    def to_json(self, path=None):
+        """Export plan as JSON string, written to `path` if provided."""
+        string = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, 'w') as handle:
+                handle.write(string)
+        return string
+
+    def __str__(self):
+        calls = ''.join(f'\n\t\t- {count} {name}' for name, count in self.calls.items())
+        return (f'Plan:\n\t- {self.tracks_to_search} tracks to search'
+                f'\n\t- {self.tracks_to_add} tracks to add (at most)'
+                f'\n\t- calls:{calls}'
+                f'\n\t- {self.quota} YouTube quota points'
+                f'\n\t- {self.wall_time / 60:.1f} minutes')
+
+
+def _get_ids(playlist):
+    """IDs of the tracks of the playlist if loaded, None otherwise."""
+    return None if playlist._tracks is None else playlist.track_ids
+
+
+def _plan_reads(plan, playlist, max_workers, latency):
+    """Plan listing the tracks of a playlist, if not loaded yet."""
+    if playlist._tracks is not None or playlist.id is None:
+        return
+    if playlist.size is None:
+        plan.unknown_sizes.append(str(playlist))
+        return
+    pages = max(-(-playlist.size // playlist._MAX_TRACKS_PER_PAGE), 1)
+    if playlist.backend == 'spotify':
+        # first page then the remaining pages concurrently, see bes.pagination
+        rounds = 1 + -(-(pages - 1) // max_workers)
+    else:
+        # pages are chained by page token
+        rounds = pages
+    plan.add_calls(playlist.backend, 'list', pages, rounds, latency)
+
+
+def plan_add_tracks(source, target, resume=True, matches=None, match_rate=1.0,
+                    max_workers=MAX_WORKERS, latency=LATENCY, plan=None,
+                    searched=None):
+    """
+    Plan adding tracks of `source` to `target`, see
+    bes.playlist.PlayList.add_tracks. Makes no API call.
+
+    Parameters
+    ----------
+    source : bes.playlist.PlayList
+        Playlist to add tracks from.
+    target : bes.playlist.PlayList
+        Playlist to add tracks to. A playlist without ID does not exist yet,
+        it is planned to be created (empty), see bes.channel.Channel.get.
+    resume : bool, default=True
+        Take into account the journal of a previously interrupted job.
+    matches : dict, optional
+        Known matches, source track ID -> target track ID (or None).
+    match_rate : float, default=1.0
+        Expected fraction of searched tracks finding a match. The default
+        gives an upper bound of the number of tracks to add.
+    max_workers : int, default=MAX_WORKERS
+        Maximum number of concurrent requests when listing tracks.
+    latency : dict, default=LATENCY
+        Average request latency in seconds per backend.
+    plan : bes.plan.Plan, optional
+        Plan to add this job to, a new one by default.
+    searched : set, optional
+        Source track IDs already planned to be searched by previous jobs (see
+        plan_sync), updated in place.
+
+    Returns
+    -------
+    plan : bes.plan.Plan
+
+    """
+    plan = Plan() if plan is None else plan
+    searched = set() if searched is None else searched
+    journal = Journal.load(source, target) if resume else Journal(path=None)
+    known = dict(matches or {})
+    known.update(journal.matched)
+
+    _plan_reads(plan, source, max_workers, latency)
+    _plan_reads(plan, target, max_workers, latency)
+    if target.id is None:
+        plan.add_calls(target.backend, 'create', 1, 1, latency)
+
+    # ids_known are IDs of matches already known, n_unknown is the number of
+    # tracks still to be matched which would be added
+    source_ids = _get_ids(source)
+    if source.backend == target.backend:
+        # no search needed, tracks are added as is
+        n_search = 0
+        ids_known = set(source_ids or [])
+        n_unknown = 0 if source_ids is not None else (source.size or 0)
+    elif source_ids is not None:
+        ids_search = {id for id in source_ids if id not in known and id not in searched}
+        searched.update(ids_search)
+        n_search = len(ids_search)
+        ids_known = {known[id] for id in source_ids if known.get(id) is not None}
+        n_unknown = round(n_search * match_rate)
+    else:
+        n_search = max((source.size or 0) - len(journal.matched), 0)
+        ids_known = {id for id in journal.matched.values() if id is not None}
+        n_unknown = round(n_search * match_rate)
+
+    ids_known -= journal.inserted
+    if target._tracks is not None:
+        ids_known -= target.track_ids
+    n_add = len(ids_known) + n_unknown
+    n_insert = -(-n_add // target._MAX_TRACKS_PER_REQUEST)
+
+    # add_tracks searches and inserts one request at a time
+    plan.add_calls(target.backend, 'search', n_search, n_search, latency)
+    plan.add_calls(target.backend, 'insert', n_insert, n_insert, latency)
+    plan.jobs.append({
+        'source': str(source),
+        'target': str(target),
+        'tracks to search': n_search,
+        'tracks to add': n_add,
+        'insert requests': n_insert,
+    })
+    return plan
+
+
+def plan_sync(mapping, resume=True, match_rate=1.0, max_workers=MAX_WORKERS,
+              latency=LATENCY):
+    """
+    Plan syncing a whole mapping of playlists, see bes.sync.sync_playlists.
+    Tracks appearing in several loaded source playlists are only planned to
+    be searched once, like sync_playlists only searches them once. Like
+    sync_playlists, pairs sharing a target playlist are planned one after the
+    other, and groups of pairs concurrently on `max_workers` threads.
+
+    Parameters
+    ----------
+    mapping : iterable of (bes.playlist.PlayList, bes.playlist.PlayList)
+        Pairs of source and target playlists.
+    resume, match_rate, max_workers, latency
+        See plan_add_tracks.
+
+    Returns
+    -------
+    plan : bes.plan.Plan
+
+    """
+    plan = Plan()
+    searched = {}
+    groups = {}
+    for source, target in mapping:
+        groups.setdefault(id(target), []).append((source, target))
+
+    # time at which each worker is free, each group going to the first one
+    # free, in order, like the executor of sync_playlists
+    workers = [0.] * max_workers
+    for pairs in groups.values():
+        start = plan.wall_time
+        for source, target in pairs:
+            plan_add_tracks(
+                source, target, resume=resume, match_rate=match_rate,
+                max_workers=max_workers, latency=latency, plan=plan,
+                searched=searched.setdefault(target.backend, set()),
+            )
+        heapq.heapreplace(workers, workers[0] + plan.wall_time - start)
+    plan.wall_time = max(workers)
+    return plan
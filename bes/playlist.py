@@ -1,6 +1,22 @@
-from bes import api
+import contextlib
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bes import api, cache, enrich, export
+from bes.deadline import AddedTracks, Deadline, DeadlineExceeded, requests_until
+from bes.journal import Journal
+from bes.metrics import METRICS
+from bes.pagination import MAX_WORKERS, iter_pages
+from bes.plan import plan_add_tracks
+from bes.reorder import apply_move, get_desired_order, plan_moves
+from bes.store import TrackStore
+from bes.tracing import span
 from bes.track import SpotifyTrack, YouTubeTrack
 
+logger = logging.getLogger(__name__)
+
 
 class PlayList(object):
     """
@@ -9,28 +25,405 @@ class PlayList(object):
     tracks to it.
 
     """
+    backend = None
     name = None
     id = None
+    # number of tracks according to the playlist metadata, if known
+    size = None
+    # identifier of the contents of the playlist according to its metadata
+    # (e.g. Spotify snapshot ID), if known, see bes.cache
+    version = None
     _tracks = None
+    _track_ids = None
+    # maximum number of tracks added per API request
+    _MAX_TRACKS_PER_REQUEST = 1
+    # maximum number of tracks retrieved per page when listing tracks
+    _MAX_TRACKS_PER_PAGE = 50
+    # where new tracks are inserted: None to append, 0 to prepend
+    _INSERT_POSITION = None
+    # store tracks in a bes.store.TrackStore rather than a list
+    columnar = False
+    # reverse index of the channel listing this playlist, see bes.index
+    _track_index = None
+    # memory budget of the channel listing this playlist, see bes.cache
+    _memory = None
+    # track class of the backend
+    _TRACK_CLASS = None
+    # tracks of the pages fetched on their own (see __getitem__), by page index
+    _pages = None
+    # whether pages can be fetched in any order (offset based pagination)
+    _RANDOM_ACCESS_PAGES = False
 
     @property
     def tracks(self):
         """
         Property which contains the list of all tracks existing in this
         playlist. It is a "lazy" attribute, until you access it for the first
-        time, the query to retrieve the tracks will not be performed.
+        time, the query to retrieve the tracks will not be performed. If the
+        playlist is columnar, tracks are held in a bes.store.TrackStore, which
+        behaves like a list but uses much less memory for large playlists.
 
         """
         if self._tracks is None:
-            self._tracks = self._get_tracks()
+            tracks = None if self._memory is None else cache.load(self, self._TRACK_CLASS)
+            if tracks is None:
+                with span('get_tracks', backend=self.backend, playlist=self.name):
+                    tracks = self._get_tracks()
+                if self._memory is not None and self.columnar:
+                    # the JSON of tracks is not kept in columnar format, save it now
+                    cache.save(self, tracks)
+                if self._track_index is not None:
+                    self._track_index.update(self.id, (track.id for track in tracks), size=self.size)
+            else:
+                METRICS.increment('playlist_cache_hits', backend=self.backend)
+            self._tracks = TrackStore(tracks) if self.columnar else tracks
+            self._track_ids = None
+            self._pages = None
+        if self._memory is not None:
+            self._memory.touch(self)
         return self._tracks
 
-    def add_tracks(self, playlist):
-        """Add tracks in provided playlist which are not yet in this playlist."""
+    def evict(self):
+        """
+        Drop tracks from memory, saving them to the local cache first so that
+        they are reloaded without requests, see bes.cache.
+
+        """
+        if self._tracks is None:
+            return
+        if not self.columnar:
+            cache.save(self, self._tracks)
+        self._tracks = None
+        self._track_ids = None
+
+    @property
+    def track_ids(self):
+        """
+        Set of IDs of tracks in this playlist, for O(1) membership checks. It
+        is kept up to date by add_tracks.
+
+        """
+        if self._track_ids is None or self._tracks is None:
+            tracks = self.tracks
+            ids = tracks.column('id') if isinstance(tracks, TrackStore) else \
+                [track.id for track in tracks]
+            self._track_ids = set(ids)
+        return self._track_ids
+
+    def add_tracks(self, playlist, resume=True, matches=None, order=False, deadline=None):
+        """
+        Add tracks from other playlist, specifically:
+        1. will match each track of the input playlist on the backend of this
+           playlist (see _match_track), and skip tracks for which no match
+           was found.
+        2. will compare the IDs of matched tracks with existing IDs in the
+           playlist.
+        3. will remove tracks for which already exist in the playlist
+        4. will add remaining tracks to the playlist.
+
+        Each step is written to a journal (see bes.journal), so that if the
+        job is interrupted, calling add_tracks again resumes where it stopped:
+        tracks already matched are not searched again, and tracks already
+        inserted are not inserted twice.
+
+        Parameters
+        ----------
+        playlist : bes.playlist.PlayList
+            Other playlist to add tracks from.
+        resume : bool, default=True
+            Resume previously interrupted job if any. If False, start over.
+        matches : dict, optional
+            Match table shared between several calls (see bes.sync), mapping
+            source track IDs to matched track IDs on the backend of this
+            playlist (None if no match). Tracks found in it are not searched
+            again, and new matches are added to it.
+        order : bool, default=False
+            Once tracks are added, reorder the playlist to follow the order
+            of the other playlist, see sync_order.
+        deadline : float, optional
+            Time budget in seconds, spread over matching and writing (see
+            bes.deadline). Close to it, no new track is searched, the tracks
+            already matched are inserted, and the job stops with a partial
+            result, resumed by the next call. Requests time out with it.
+
+        Returns
+        -------
+        ids_added : bes.deadline.AddedTracks
+            IDs of tracks added to the playlist (a list), the number of
+            searches made and saved by the match table, and the work left if
+            the job stopped at its deadline.
+
+        """
+        matches = {} if matches is None else matches
+        matched_tracks = {}
+        budget = None if deadline is None else Deadline(deadline)
+        journal = Journal.open(source=playlist, target=self, resume=resume)
+        debug = logger.isEnabledFor(logging.DEBUG)
+        start = time.perf_counter()
+        n_searched = 0
+        # source tracks searched by this call, and the others found in the match table
+        ids_searched = set()
+        ids_reused = set()
+        ids_existing = self.track_ids
+        # source tracks left to search, and new matches to write, once out of time
+        remaining = []
+        ids_new = set()
+        for i, track in enumerate(playlist):
+            if track.id in journal.matched:
+                METRICS.increment('match_cache_hits', cache='journal')
+                matches.setdefault(track.id, journal.matched[track.id])
+                continue
+            if track.id in matches:
+                METRICS.increment('match_cache_hits', cache='table')
+                if track.id not in ids_searched:
+                    ids_reused.add(track.id)
+            elif remaining or (budget is not None and not self._has_time_to_match(budget, len(ids_new))):
+                remaining.append(track.id)
+                continue
+            else:
+                METRICS.increment('match_cache_misses')
+                if debug:
+                    logger.debug('%03d searching track on %s: %s - %s', i + 1, self.backend,
+                                 ' & '.join(track.artists), track.title)
+                n_searched += 1
+                ids_searched.add(track.id)
+                try:
+                    with span('match_track', id=track.id), self._within(budget, 'search', len(ids_new)):
+                        match = self._match_track(track)
+                    matches[track.id] = match.id
+                    matched_tracks[match.id] = match
+                    METRICS.increment('tracks_matched', backend=self.backend)
+                except DeadlineExceeded as e:
+                    logger.debug(e)
+                    remaining.append(track.id)
+                    continue
+                except ValueError as e:
+                    logger.debug(e)
+                    matches[track.id] = None
+                    METRICS.increment('tracks_unmatched', backend=self.backend)
+            journal.record_matched(track.id, matches[track.id])
+            if matches[track.id] is not None and matches[track.id] not in ids_existing:
+                ids_new.add(matches[track.id])
+        elapsed = time.perf_counter() - start
+        if n_searched:
+            METRICS.set('tracks_per_second', n_searched / elapsed, backend=self.backend)
+
+        ids_matched = [journal.matched.get(track.id) for track in playlist]
+        ids_matched = [id for id in ids_matched if id is not None]
+
+        # keep the order of the other playlist, inserting in reverse order
+        # when tracks are inserted on top so that they end up in that order
+        ids_to_add = [id for id in dict.fromkeys(ids_matched)
+                      if id not in ids_existing and id not in journal.inserted]
+        if self._INSERT_POSITION == 0:
+            ids_to_add.reverse()
+        logger.info('There are:\n\t- %d tracks matched from %s'
+                    '\n\t- %d tracks existing in %s playlist'
+                    '\n\t- %d new tracks to add',
+                    len(ids_matched), playlist.backend, len(ids_existing), self.backend, len(ids_to_add))
+        if len(playlist):
+            METRICS.set('match_rate', len(ids_matched) / len(playlist), backend=self.backend)
+
+        journal.record_pending(ids_to_add)
+        tracks_added = []
+        pending = []
+        try:
+            for offset in range(0, len(ids_to_add), self._MAX_TRACKS_PER_REQUEST):
+                ids = ids_to_add[offset:offset + self._MAX_TRACKS_PER_REQUEST]
+                if budget is not None and budget.remaining() < budget.estimate('write'):
+                    pending = ids_to_add[offset:]
+                    break
+                try:
+                    with span('insert_tracks', backend=self.backend, count=len(ids)), \
+                            self._within(budget, 'write'):
+                        tracks_added.extend(self._insert_tracks(ids, matched_tracks))
+                except DeadlineExceeded as e:
+                    # the request may still go through, fetch the tracks again next time
+                    # (not from the local cache, see bes.cache.load)
+                    logger.debug(e)
+                    pending = ids_to_add[offset:]
+                    self._tracks = self._track_ids = self._pages = None
+                    self.size = self.version = None
+                    break
+                journal.record_inserted(ids)
+                self.track_ids.update(ids)
+                if self.size is not None:
+                    self.size += len(ids)
+                # not the version of the metadata anymore
+                self.version = None
+                if self._track_index is not None:
+                    self._track_index.add(self.id, ids)
+        finally:
+            # keep tracks in sync without fetching the playlist again
+            self._cache_tracks(tracks_added)
+        ids_added = AddedTracks([id for id in ids_to_add if id not in pending], remaining=remaining,
+                                pending=pending, elapsed=time.perf_counter() - start,
+                                n_searched=n_searched, n_reused=len(ids_reused))
+        METRICS.increment('tracks_added', len(ids_added), backend=self.backend)
+        if not ids_added.complete:
+            # keep the journal, the next call resumes where this one stopped
+            METRICS.increment('deadline_stops', backend=self.backend)
+            METRICS.flush()
+            logger.warning('%d tracks added to %s playlist %s before the deadline, '
+                           '%d tracks left to match and %d to insert',
+                           len(ids_added), self.backend, self.name, len(remaining), len(pending))
+            return ids_added
+        journal.discard()
+        METRICS.flush()
+        logger.info('%d tracks added to %s playlist %s!', len(ids_added), self.backend, self.name)
+        if order:
+            self.sync_order(playlist, matches=matches)
+        return ids_added
+
+    def _has_time_to_match(self, budget, n_new):
+        """Whether there is time left to search one more track, then write `n_new` + 1 tracks."""
+        return budget.remaining() > budget.estimate('search') + self._get_write_reserve(budget, n_new + 1)
+
+    def _get_write_reserve(self, budget, n_tracks):
+        """Estimated time to insert `n_tracks` tracks."""
+        n_requests = -(-n_tracks // self._MAX_TRACKS_PER_REQUEST)
+        return n_requests * budget.estimate('write')
+
+    @contextlib.contextmanager
+    def _within(self, budget, kind, n_new=0):
+        """
+        Context timing requests of kind `kind` against budget, searches
+        having to complete early enough to write `n_new` + 1 tracks.
+
+        """
+        if budget is None:
+            yield
+            return
+        at = budget.at
+        if kind == 'search':
+            at -= self._get_write_reserve(budget, n_new + 1)
+        with requests_until(at), budget.measure(kind):
+            yield
+
+    def sync_order(self, playlist, matches=None):
+        """
+        Reorder tracks to follow the order of other playlist, with as few
+        requests as possible (see bes.reorder). Tracks without a match in the
+        other playlist are moved after the others, keeping their order.
+
+        Parameters
+        ----------
+        playlist : bes.playlist.PlayList
+            Other playlist to follow the order of.
+        matches : dict, optional
+            Track IDs of other playlist -> matched IDs on the backend of this
+            playlist, typically the match table filled by add_tracks. Only
+            required if the other playlist is on another backend.
+
+        Returns
+        -------
+        moves : list of (int, int, int)
+            Moves applied, as (range_start, range_length, insert_before).
+
+        """
+        if matches is None and playlist.backend != self.backend:
+            raise ValueError('matches are required to follow the order of a playlist '
+                             'on another backend, see add_tracks')
+        tracks = self._get_tracks_to_reorder()
+        current, desired = get_desired_order(
+            [track.id for track in playlist], [track.id for track in tracks], matches)
+        moves = plan_moves(current, desired)
+        with span('sync_order', backend=self.backend, moves=len(moves)):
+            for move in moves:
+                self._move_tracks(tracks, move)
+                apply_move(tracks, move)
+                self.version = None
+                METRICS.increment('tracks_moved', move[1], backend=self.backend)
+        self._tracks = TrackStore(tracks) if self.columnar else tracks
+        logger.info('%d tracks moved in %d moves in %s playlist %s',
+                    sum(move[1] for move in moves), len(moves), self.backend, self.name)
+        return moves
+
+    def _get_tracks_to_reorder(self):
+        """Tracks in their current order, with what _move_tracks needs."""
+        return list(self.tracks)
+
+    def _move_tracks(self, tracks, move):
+        """
+        Backend specific way of moving a range of tracks, see
+        bes.reorder.apply_move for `move`. `tracks` are the tracks in their
+        order before the move.
+
+        """
+        raise NotImplementedError
+
+    def plan_add_tracks(self, playlist, resume=True, matches=None, **kwargs):
+        """
+        Plan adding tracks from other playlist without making any API call,
+        see bes.plan.plan_add_tracks for parameters.
+
+        Returns
+        -------
+        plan : bes.plan.Plan
+
+        """
+        return plan_add_tracks(playlist, self, resume=resume, matches=matches, **kwargs)
+
+    def to_dataframe(self, batch_size=export.BATCH_SIZE):
+        """
+        Export tracks to a pandas DataFrame (one row per track with title,
+        artists, duration, popularity, release year and IDs), see
+        bes.export. Tracks are streamed from the API if not loaded yet.
+
+        """
+        return export.to_dataframe([self], batch_size=batch_size)
+
+    def to_file(self, path, format='parquet', batch_size=export.BATCH_SIZE):
+        """
+        Write tracks to a Parquet or Arrow file batch by batch, see
+        bes.export.write. Returns the number of rows written.
+
+        """
+        return export.write([self], path, format=format, batch_size=batch_size)
+
+    def _match_track(self, track):
+        """
+        Backend specific way of matching a track from any backend. Raises
+        ValueError if no match was found.
+
+        """
+        raise NotImplementedError
+
+    def _insert_tracks(self, ids, tracks, build=True):
+        """
+        Backend specific way of adding tracks (by ID) to playlist. Returns the
+        inserted tracks, built from the insert responses or from `tracks`, a
+        dict of already known tracks by ID, or None if `build` is False (no
+        request is made to build them).
+
+        """
         raise NotImplementedError
 
+    def _cache_tracks(self, tracks):
+        """Add freshly inserted tracks to the tracks in memory, if loaded."""
+        if len(tracks):
+            # positions changed
+            self._pages = None
+        if self._tracks is None or not len(tracks):
+            return
+        if self._INSERT_POSITION == 0:
+            # each track was inserted on top of the previous one
+            tracks = tracks[::-1] + list(self._tracks)
+            self._tracks = TrackStore(tracks) if self.columnar else tracks
+        else:
+            self._tracks.extend(tracks)
+        self.track_ids.update(track.id for track in tracks)
+        if self._memory is not None:
+            # estimate its size again
+            self._memory.discard(self)
+            self._memory.touch(self)
+
     def _get_tracks(self):
-        """Backend specific way of retrieving tracks in playlist"""
+        """Retrieve all tracks in playlist."""
+        return [track for tracks in self._iter_pages() for track in tracks]
+
+    def _iter_pages(self):
+        """Backend specific way of retrieving tracks in playlist, page by page"""
         raise NotImplementedError
 
     @classmethod
@@ -38,8 +431,91 @@ class PlayList(object):
         """Create PlayList object from the REST API JSON."""
         raise NotImplementedError
 
+    def _fetch_page(self, page):
+        """
+        Backend specific way of fetching a page of tracks on its own.
+
+        Returns
+        -------
+        pages : dict
+            Page index -> (tracks, number of items, total number of items or
+            None) of the page, and of the other pages fetched along the way
+            if any.
+
+        """
+        raise NotImplementedError
+
+    def _load_pages(self, pages):
+        """
+        Fetch the pages (by index) which are not cached yet, concurrently if
+        the backend allows it. Returns False if the playlist turned out not
+        to be addressable by page, i.e. some items of a page were not tracks
+        (e.g. deleted videos), so that positions in pages are not positions
+        in the playlist.
+
+        """
+        if self._pages is None:
+            self._pages = {}
+        missing = [page for page in dict.fromkeys(pages) if page not in self._pages]
+        if self._RANDOM_ACCESS_PAGES and len(missing) > 1:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                fetched = list(executor.map(self._fetch_page, missing))
+        else:
+            # fetched lazily, each page being cached before checking the next
+            # one: pages fetched along the way may include the next missing ones
+            fetched = (self._fetch_page(page) for page in missing if page not in self._pages)
+        n_fetched = 0
+        for pages_fetched in fetched:
+            n_fetched += len(pages_fetched)
+            for page, (tracks, n_items, total) in pages_fetched.items():
+                if len(tracks) != n_items:
+                    self._pages = None
+                    METRICS.increment('pages_fetched', n_fetched, backend=self.backend)
+                    return False
+                if total is not None:
+                    self.size = total
+                self._pages[page] = tracks
+        METRICS.increment('pages_fetched', n_fetched, backend=self.backend)
+        return True
+
+    def _get_item(self, index):
+        """Track or list of tracks at index (int or slice) from pages, see __getitem__."""
+        if self.size is None and (not self._load_pages([0]) or self.size is None):
+            return self.tracks[index]
+        if isinstance(index, slice):
+            indices = range(*index.indices(self.size))
+        else:
+            position = index + self.size if index < 0 else index
+            if not 0 <= position < self.size:
+                raise IndexError('track index out of range')
+            indices = [position]
+        size = self._MAX_TRACKS_PER_PAGE
+        if not self._load_pages([i // size for i in indices]):
+            return self.tracks[index]
+        # pages may be short if the size reported by the metadata was outdated
+        tracks = [self._pages[i // size][i % size] for i in indices
+                  if i // size in self._pages and i % size < len(self._pages[i // size])]
+        if isinstance(index, slice):
+            return tracks
+        if not tracks:
+            raise IndexError('track index out of range')
+        return tracks[0]
+
     def __len__(self):
-        """Length of playlists (i.e. how many tracks)"""
+        """
+        Length of playlists (i.e. how many tracks). If tracks are not loaded
+        yet, it is the size reported by the playlist metadata (or by the
+        first page of tracks if unknown), so that no track is fetched.
+
+        """
+        if self._tracks is None:
+            if self.size is None:
+                try:
+                    self._load_pages([0])
+                except NotImplementedError:
+                    pass
+            if self.size is not None:
+                return self.size
         return len(self.tracks)
 
     def __iter__(self):
@@ -77,12 +553,26 @@ class PlayList(object):
             # assume string
             return (self.name == other) or (self.id == other)
 
+    def __contains__(self, track):
+        """Check if track (or track ID) is in playlist, in O(1)."""
+        return getattr(track, 'id', track) in self.track_ids
+
     def __getitem__(self, index):
         """
-        Get track by index.
+        Get track (or list of tracks for a slice) by index. If tracks are not
+        loaded yet, only the pages holding the requested tracks are fetched
+        (and cached), so that sampling or inspecting a huge playlist is
+        cheap. Offset-paginated backends (Spotify) fetch any page directly,
+        YouTube pages are chained, so reaching page k fetches the pages
+        before it once.
 
         """
-        return self.tracks[index]
+        if self._tracks is not None:
+            return self._tracks[index]
+        try:
+            return self._get_item(index)
+        except NotImplementedError:
+            return self.tracks[index]
 
     def __str__(self):
         return f'{self.__class__.__name__}(name={self.name}, id={self.id})'
@@ -100,60 +590,101 @@ class YouTubePlayList(PlayList):
         Playlist ID.
     name : str
         Playlist name.
+    size : int, optional
+        Number of tracks, as reported by the playlist metadata.
 
     """
-    def __init__(self, id, name):
+    backend = 'youtube'
+    _TRACK_CLASS = YouTubeTrack
+    # page index -> page token, as discovered by _fetch_page
+    _page_tokens = None
+    # item IDs by position while reordering, see _get_tracks_to_reorder
+    _layout = None
+    # videos are inserted on top of the playlist
+    _INSERT_POSITION = 0
+
+    def __init__(self, id, name, size=None):
         self.api = api.get_or_create_youtube_api()
         self.id = id
         self.name = name
+        self.size = size
         self._tracks = None
 
-    def _get_tracks(self):
+    def _iter_pages(self):
         """
-        YouTube specific way of retrieving all tracks of a playlist.
+        YouTube specific way of retrieving the tracks of a playlist, page by
+        page (pages are chained by page token).
 
-        Returns
-        -------
+        Yields
+        ------
         tracks : list of bes.track.YouTubeTrack
-            List of tracks.
+            Tracks of each page.
 
         """
         nextPageToken = None
-        tracks = []
 
         while True:
             request = self.api.playlistItems().list(
                 part=["contentDetails", "snippet"],
                 playlistId=self.id,
-                maxResults=50,
+                maxResults=self._MAX_TRACKS_PER_PAGE,
                 pageToken=nextPageToken,
             )
-            response = request.execute()
-
-            # expand track list
-            for item in response['items']:
-                try:
-                    track = YouTubeTrack.from_item(item)
-                    tracks.append(track)
-                except ValueError as e:
-                    print(f'Could not add track because of original error {e}.')
-                    continue
+            response = api.execute(request)
+            yield self._get_tracks_from_items(response['items'])
 
             if 'nextPageToken' in response:
                 nextPageToken = response['nextPageToken']
             else:
                 break
+
+    @staticmethod
+    def _get_tracks_from_items(items):
+        tracks = []
+        for item in items:
+            try:
+                track = YouTubeTrack.from_item(item)
+                tracks.append(track)
+            except ValueError as e:
+                logger.info('Could not add track because of original error %s.', e)
+                continue
         return tracks
 
-    def add_tracks(self, playlist):
+    def _fetch_page(self, page):
         """
-        Add tracks from other playlist, specifically:
-        1. will cast input playlist to YouTube (call .to_youtube) to retrieve
-           only the tracks for which there are matches on YouTube.
-        2. will compare the IDs of matched tracks with existing IDs in the
-           playlist.
-        3. will remove tracks for which already exist in the playlist
-        4. will add remaining tracks to the playlist.
+        YouTube specific way of fetching a page of tracks. Pages are chained
+        by page token: pages are fetched from the closest page before it
+        whose token is known, see base class docstring.
+
+        """
+        if self._page_tokens is None:
+            self._page_tokens = {0: None}
+        pages = {}
+        start = max(known for known in self._page_tokens if known <= page)
+        for current in range(start, page + 1):
+            request = self.api.playlistItems().list(
+                part=["contentDetails", "snippet"],
+                playlistId=self.id,
+                maxResults=self._MAX_TRACKS_PER_PAGE,
+                pageToken=self._page_tokens[current],
+            )
+            response = api.execute(request)
+            total = (response.get('pageInfo') or {}).get('totalResults')
+            pages[current] = (self._get_tracks_from_items(response['items']), len(response['items']), total)
+            if 'nextPageToken' not in response:
+                break
+            self._page_tokens[current + 1] = response['nextPageToken']
+        return pages
+
+    def _match_track(self, track):
+        """Match track on YouTube, see bes.track.YouTubeTrack.from_spotify"""
+        if isinstance(track, YouTubeTrack):
+            return track
+        return YouTubeTrack.from_spotify(track)
+
+    def _insert_tracks(self, ids, tracks, build=True):
+        """
+        Insert videos at the top of the playlist, one request per video.
 
         Notes
         -----
@@ -162,26 +693,28 @@ class YouTubePlayList(PlayList):
         search is 100 points. By default, you have 20,000 points to
         spend per day. Quick math: that means you can only add 130 tracks per
         day. In practice even less as retrieving the tracks from the playlist
-        already cost you points (although only 10 points per 25 tracks).
+        already cost you points (although only 10 points per 25 tracks). This
+        is where resuming interrupted jobs (see bes.journal) comes in handy.
 
         Parameters
         ----------
-        playlist : bes.playlist.PlayList
-            Other playlist to add tracks from.
+        ids : list of str
+            Video IDs.
+        tracks : dict
+            Unused, tracks are built from the insert responses.
+        build : bool, default=True
+            Whether to build the inserted tracks.
 
-        """
-        ids_existing = [track.id for track in self]
-        ids_spotify = [track.id for track in playlist.to_youtube()]
-
-        ids_to_add = list(set(ids_spotify) - set(ids_existing))
-        print(f'There are:\n\t- {len(ids_spotify)} tracks matched from Spotify'
-              f'\n\t- {len(ids_existing)} tracks existing in Youtube playlist'
-              f'\n\t- {len(ids_to_add)} new tracks to add'
-             )
+        Returns
+        -------
+        tracks : list of bes.track.YouTubeTrack or None
+            Inserted tracks, None if not built.
 
-        for video_id in ids_to_add:
+        """
+        inserted = []
+        for video_id in ids:
             request = self.api.playlistItems().insert(
-                part="snippet",
+                part="snippet,contentDetails",
                 body={
                     "snippet": {
                         "playlistId": self.id,
@@ -192,9 +725,83 @@ class YouTubePlayList(PlayList):
                             }
                         }
             })
-            request.execute()
-        # TODO: add the tracks to _tracks?
-        print(f'{len(ids_to_add)} tracks added to youtube playlist {self.name}!')
+            response = api.execute(request)
+            if not build:
+                continue
+            try:
+                inserted.append(YouTubeTrack.from_item(response))
+            except ValueError as e:
+                logger.info('Could not cache inserted track because of original error %s.', e)
+        return inserted if build else None
+
+    def _get_tracks_to_reorder(self):
+        """
+        Tracks in their current order. Moving a video requires the ID of its
+        playlist item and its position: tracks without them (e.g. from a
+        columnar store) or with outdated positions are listed again.
+
+        Items which could not be parsed (e.g. deleted or private videos)
+        still hold a position in the playlist, so when there are some, the
+        layout of the playlist (item IDs by position, None for those items)
+        is kept for _move_tracks.
+
+        """
+        tracks = list(self.tracks)
+        if not self._has_positions(tracks):
+            tracks = self._get_tracks()
+        positions = [track.item['snippet']['position'] for track in tracks]
+        self._layout = None
+        if positions != list(range(len(tracks))):
+            self._layout = [None] * (positions[-1] + 1)
+            for track, position in zip(tracks, positions):
+                self._layout[position] = track.item['id']
+        return tracks
+
+    @staticmethod
+    def _has_positions(tracks):
+        """Whether tracks have item IDs and positions, in increasing order."""
+        positions = []
+        for track in tracks:
+            item = track.item or {}
+            position = item.get('snippet', {}).get('position')
+            if not isinstance(item.get('id'), str) or not isinstance(position, int):
+                return False
+            positions.append(position)
+        return all(previous < position for previous, position in zip(positions, positions[1:]))
+
+    def _move_tracks(self, tracks, move):
+        """Move videos one request per video, as there are no range moves."""
+        start, length, before = move
+        for k in range(length):
+            track = tracks[start + k]
+            if self._layout is None:
+                # moving down, each video goes right before the range's destination
+                # (pushing previous ones up), moving up, videos go one after the other
+                position = before - 1 if before > start else before + k
+            else:
+                # videos go one after the other, right before the track at
+                # `before` (or after the last track), skipping unparsed items
+                self._layout.remove(track.item['id'])
+                if before < len(tracks):
+                    position = self._layout.index(tracks[before].item['id'])
+                else:
+                    previous = tracks[-1] if k == 0 else tracks[start + k - 1]
+                    position = self._layout.index(previous.item['id']) + 1
+                self._layout.insert(position, track.item['id'])
+            request = self.api.playlistItems().update(
+                part="snippet",
+                body={
+                    "id": track.item['id'],
+                    "snippet": {
+                        "playlistId": self.id,
+                        "position": position,
+                        "resourceId": {
+                            "kind": "youtube#video",
+                            "videoId": track.id,
+                        }
+                    }
+            })
+            api.execute(request)
 
     @classmethod
     def from_item(cls, item):
@@ -202,6 +809,7 @@ class YouTubePlayList(PlayList):
         return cls(
             id=item['id'],
             name=item['snippet']['localized']['title'],
+            size=item.get('contentDetails', {}).get('itemCount'),
         )
 
     def to_youtube(self):
@@ -222,14 +830,16 @@ class YouTubePlayList(PlayList):
 
         """
         matched_tracks = []
+        debug = logger.isEnabledFor(logging.DEBUG)
         for i, track in enumerate(self):
-            print(f'{i + 1:03} searching track on spotify: '
-                  f'{" & ".join(track.artists)} - {track.title}')
+            if debug:
+                logger.debug('%03d searching track on spotify: %s - %s',
+                             i + 1, ' & '.join(track.artists), track.title)
             try:
                 matched_track = SpotifyTrack.from_youtube(track)
                 matched_tracks.append(matched_track)
             except ValueError as e:
-                print(e)
+                logger.debug(e)
                 continue
         return matched_tracks
 
@@ -240,53 +850,75 @@ class SpotifyPlaylist(PlayList):
     a Spotify playlist yourself. Use the SpotifyChannel instance to retrieve
     existing playlists.
 
+    Parameters
+    ----------
+    id : str
+        Playlist ID.
+    name : str
+        Playlist name.
+    size : int, optional
+        Number of tracks, as reported by the playlist metadata.
+    snapshot_id : str, optional
+        Version of the playlist, as reported by the playlist metadata.
+
     """
+    backend = 'spotify'
+    _TRACK_CLASS = SpotifyTrack
+    _RANDOM_ACCESS_PAGES = True
     # spotipy / spotify allow adding up to 100 tracks per API request
     # in contrast, YouTube / Google API requires to add track by track
     _MAX_TRACKS_PER_REQUEST = 100
+    # maximum number of tracks retrieved per lookup (by ID) request
+    _MAX_TRACKS_PER_LOOKUP = 50
+    _MAX_TRACKS_PER_PAGE = 100
 
-    def __init__(self, id, name):
+    def __init__(self, id, name, size=None, snapshot_id=None):
         self.api = api.get_or_create_spotify_api()
+        self.user_id = api.get_spotify_user_id()
         self.id = id
         self.name = name
+        self.size = size
+        self.version = snapshot_id
         self._tracks = None
 
-    def _get_tracks(self):
+    def _iter_pages(self):
         """
-        Spotipy specific way of retrieving all tracks of a playlist.
+        Spotipy specific way of retrieving the tracks of a playlist, page by
+        page. Pages are requested concurrently, see bes.pagination.
 
-        Returns
-        -------
-        tracks : list of bes.track.YouTubeTrack
-            List of tracks.
+        Yields
+        ------
+        tracks : list of bes.track.SpotifyTrack
+            Tracks of each page.
 
         """
-        offset = 0
-        tracks = []
+        for items in iter_pages(self._get_fetch(), limit=self._MAX_TRACKS_PER_PAGE):
+            yield [SpotifyTrack.from_item(item) for item in items]
+
+    def _get_fetch(self):
+        """Function fetching a page of tracks, given `limit` and `offset`."""
+        return functools.partial(
+            self.api.user_playlist_tracks,
+            user=self.user_id,
+            playlist_id=self.id,
+        )
 
-        while True:
-            response = self.api.user_playlist_tracks(
-                user=api.SPOTIFY_USER_ID,
-                playlist_id=self.id,
-                limit=self._MAX_TRACKS_PER_REQUEST,
-                offset=offset,
-            )
-            for item in response['items']:
-                tracks.append(SpotifyTrack.from_item(item))
-            offset = len(tracks)
-            if len(tracks) == response['total']:
-                break
-        return tracks
+    def _fetch_page(self, page):
+        """Spotify specific way of fetching a page of tracks, by offset, see base class docstring."""
+        response = self._get_fetch()(limit=self._MAX_TRACKS_PER_PAGE,
+                                     offset=page * self._MAX_TRACKS_PER_PAGE)
+        tracks = [SpotifyTrack.from_item(item) for item in response['items']]
+        return {page: (tracks, len(response['items']), response.get('total'))}
+
+    def _match_track(self, track):
+        """Match track on Spotify, see bes.track.SpotifyTrack.from_youtube"""
+        if isinstance(track, SpotifyTrack):
+            return track
+        return SpotifyTrack.from_youtube(track)
 
-    def add_tracks(self, playlist):
+    def _insert_tracks(self, ids, tracks, build=True):
         """
-        Add tracks from other playlist, specifically:
-        1. will cast input playlist to Spotify (call .to_spotify) to retrieve
-           only the tracks for which there are matches on Spotify.
-        2. will compare the IDs of matched tracks with existing IDs in the
-           playlist.
-        3. will remove tracks for which already exist in the playlist
-        4. will add remaining tracks to the playlist.
+        Append tracks at the end of the playlist.
 
         Notes
         -----
@@ -296,26 +928,61 @@ class SpotifyPlaylist(PlayList):
 
         Parameters
         ----------
-        playlist : bes.playlist.PlayList
-            Other playlist to add tracks from.
+        ids : list of str
+            Track IDs, at most _MAX_TRACKS_PER_REQUEST.
+        tracks : dict
+            Known tracks by ID (typically matched from search results). The
+            response to adding tracks only contains a snapshot ID, so unknown
+            tracks are retrieved in batches.
+        build : bool, default=True
+            Whether to build the inserted tracks, i.e. retrieve the unknown
+            ones.
+
+        Returns
+        -------
+        tracks : list of bes.track.SpotifyTrack or None
+            Inserted tracks, None if not built.
+
+        """
+        self.api.playlist_add_items(
+            playlist_id=self.id,
+            items=ids,
+            position=None,
+        )
+        if not build:
+            return None
+        missing = [id for id in ids if id not in tracks]
+        tracks = dict(tracks)
+        for offset in range(0, len(missing), self._MAX_TRACKS_PER_LOOKUP):
+            response = self.api.tracks(missing[offset:offset + self._MAX_TRACKS_PER_LOOKUP])
+            for item in response['tracks']:
+                tracks[item['id']] = SpotifyTrack.from_item(item)
+        return [tracks[id] for id in ids if id in tracks]
+
+    def _move_tracks(self, tracks, move):
+        """Move a range of tracks in a single request."""
+        start, length, before = move
+        self.api.playlist_reorder_items(
+            playlist_id=self.id,
+            range_start=start,
+            insert_before=before,
+            range_length=length,
+        )
 
+    def enrich(self, metadata=False, max_workers=MAX_WORKERS):
         """
-        ids_existing = [track.id for track in self]
-        ids_youtube = [track.id for track in playlist.to_spotify()]
+        Audio features (tempo, energy, key, ...) of the tracks, fetched in
+        batches and cached persistently, see bes.enrich.enrich.
 
-        ids_to_add = list(set(ids_youtube) - set(ids_existing))
-        print(f'There are:\n\t- {len(ids_youtube)} tracks matched from YouTube'
-              f'\n\t- {len(ids_existing)} tracks existing in Spotify playlist'
-              f'\n\t- {len(ids_to_add)} new tracks to add'
-             )
+        Returns
+        -------
+        features : dict
+            Track ID -> dict of audio features (and metadata if requested).
 
-        for offset in range(0, len(ids_to_add), self._MAX_TRACKS_PER_REQUEST):
-            self.api.playlist_add_items(
-                playlist_id=self.id,
-                items=ids_to_add[offset:offset + self._MAX_TRACKS_PER_REQUEST],
-                position=None,
-            )
-        print(f'{len(ids_to_add)} tracks added to spotify playlist {self.name}!')
+        """
+        tracks = self.tracks
+        ids = tracks.column('id') if isinstance(tracks, TrackStore) else [track.id for track in tracks]
+        return enrich.enrich(ids, metadata=metadata, max_workers=max_workers)
 
     @classmethod
     def from_item(cls, item):
@@ -323,6 +990,8 @@ class SpotifyPlaylist(PlayList):
         return cls(
             id=item['id'],
             name=item['name'],
+            size=(item.get('tracks') or {}).get('total'),
+            snapshot_id=item.get('snapshot_id'),
         )
 
     def to_youtube(self):
@@ -339,14 +1008,16 @@ class SpotifyPlaylist(PlayList):
 
         """
         matched_tracks = []
+        debug = logger.isEnabledFor(logging.DEBUG)
         for i, track in enumerate(self):
-            print(f'{i + 1:03} searching track on spotify: '
-                  f'{" & ".join(track.artists)} - {track.title}')
+            if debug:
+                logger.debug('%03d searching track on youtube: %s - %s',
+                             i + 1, ' & '.join(track.artists), track.title)
             try:
                 matched_track = YouTubeTrack.from_spotify(track)
                 matched_tracks.append(matched_track)
             except ValueError as e:
-                print(e)
+                logger.debug(e)
                 continue
         return matched_tracks
 
@@ -361,6 +1032,8 @@ class SpotifySavedTracks(SpotifyPlaylist):
     Spotify, so this is not strictly a playlist but more a list of tracks.
 
     """
+    _MAX_TRACKS_PER_PAGE = 50
+
     def __init__(self):
         super().__init__(id=None, name='spotify likes')
 
@@ -368,19 +1041,9 @@ class SpotifySavedTracks(SpotifyPlaylist):
     def from_item(cls, item):
         raise NotImplementedError
 
-    def _get_tracks(self):
-        """Spotifpy specific way of getting liked tracks."""
-        offset = 0
-        tracks = []
+    def _move_tracks(self, tracks, move):
+        raise NotImplementedError('saved tracks are ordered by date added, they cannot be reordered')
 
-        while True:
-            response = self.api.current_user_saved_tracks(
-                limit=50,
-                offset=offset,
-            )
-            for item in response['items']:
-                tracks.append(SpotifyTrack.from_item(item))
-            offset = len(tracks)
-            if len(tracks) == response['total']:
-                break
-        return tracks
+    def _get_fetch(self):
+        """Spotipy specific way of getting a page of liked tracks."""
+        return self.api.current_user_saved_tracks
@@ -0,0 +1,146 @@
+"""
+Minimal-move reordering of playlists. To make a target playlist follow the
+order of its source, moving every track to its position would cost one
+request per track. Instead, the tracks which are already in the right
+relative order are left in place: they form the longest increasing
+subsequence (LIS) of their positions in the desired order. Only the other
+tracks are moved, each right after its predecessor in the desired order, and
+tracks which are consecutive both in the desired order and in the playlist
+are moved together as one range.
+
+On Spotify a range is moved in a single request (playlist_reorder_items), on
+YouTube each track of the range is moved with one playlistItems.update.
+Either way, reordering a playlist which only has a few tracks out of place
+takes a few requests, however long the playlist.
+
+"""
+from bisect import bisect_left
+
+
+def longest_increasing_subsequence(sequence):
+    """
+    Indices of one longest strictly increasing subsequence of `sequence`, in
+    O(n log n) (patience sorting).
+
+    """
+    # tails[k] is the index of the smallest tail of increasing subsequences of length k + 1
+    tails = []
+    tail_values = []
+    previous = [None] * len(sequence)
+    for i, value in enumerate(sequence):
+        k = bisect_left(tail_values, value)
+        previous[i] = tails[k - 1] if k else None
+        if k == len(tails):
+            tails.append(i)
+            tail_values.append(value)
+        else:
+            tails[k] = i
+            tail_values[k] = value
+    indices = []
+    i = tails[-1] if tails else None
+    while i is not None:
+        indices.append(i)
+        i = previous[i]
+    return indices[::-1]
+
+
+def apply_move(sequence, move):
+    """
+    Apply move (range_start, range_length, insert_before) to a list in place,
+    with the semantics of Spotify's reorder endpoint: insert_before is the
+    position before the move.
+
+    """
+    start, length, before = move
+    block = sequence[start:start + length]
+    del sequence[start:start + length]
+    position = before - length if before > start else before
+    sequence[position:position] = block
+
+
+def plan_moves(current, desired):
+    """
+    Moves turning `current` into `desired`.
+
+    Parameters
+    ----------
+    current : list
+        Current order of (hashable, distinct) keys.
+    desired : list
+        Desired order of the same keys.
+
+    Returns
+    -------
+    moves : list of (int, int, int)
+        Moves (range_start, range_length, insert_before) to apply in order,
+        see apply_move.
+
+    """
+    if len(current) != len(desired) or set(current) != set(desired):
+        raise ValueError('current and desired orders must have the same keys')
+    rank = {key: i for i, key in enumerate(desired)}
+    placed = {current[i] for i in longest_increasing_subsequence([rank[key] for key in current])}
+
+    state = list(current)
+    moves = []
+    i = 0
+    while i < len(desired):
+        if desired[i] in placed:
+            i += 1
+            continue
+        start = state.index(desired[i])
+        # extend the range with the next keys if they follow in the playlist too
+        j = i + 1
+        while (j < len(desired) and desired[j] not in placed and start + j - i < len(state)
+               and state[start + j - i] == desired[j]):
+            j += 1
+        before = 0 if i == 0 else state.index(desired[i - 1]) + 1
+        if before != start:
+            move = (start, j - i, before)
+            apply_move(state, move)
+            moves.append(move)
+        placed.update(desired[i:j])
+        i = j
+    return moves
+
+
+def get_desired_order(source_ids, target_ids, matches=None):
+    """
+    Desired order of the tracks of a target playlist, following the order of
+    its source. Target tracks matching no source track keep their relative
+    order, after the others. Duplicated IDs are told apart by occurrence.
+
+    Parameters
+    ----------
+    source_ids : list of str
+        IDs of the tracks of the source playlist, in order.
+    target_ids : list of str
+        IDs of the tracks of the target playlist, in order.
+    matches : dict, optional
+        Source track ID -> target track ID (or None), see
+        bes.playlist.PlayList.add_tracks. Source IDs are used as is if None
+        (same backend).
+
+    Returns
+    -------
+    current, desired : list of (str, int)
+        Current and desired order of the target tracks, as (ID, occurrence)
+        keys.
+
+    """
+    occurrences = {}
+    current = []
+    for id in target_ids:
+        occurrences[id] = occurrences.get(id, 0) + 1
+        current.append((id, occurrences[id] - 1))
+
+    used = {}
+    desired = []
+    for id in source_ids:
+        id = id if matches is None else matches.get(id)
+        if id is not None and used.get(id, 0) < occurrences.get(id, 0):
+            desired.append((id, used.get(id, 0)))
+            used[id] = used.get(id, 0) + 1
+    in_desired = set(desired)
+    desired += [key for key in current if key not in in_desired]
+    return current, desired
@@ -1,3 +1,7 @@
+from bes.tracing import traced
+
+
+@traced
 def get_risk_score(track, other):
     """
     Get "risk" score between a track an another track. The "risk" evaluates
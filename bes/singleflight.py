@@ -0,0 +1,131 @@
+"""
+Coalescing of identical in-flight read requests ("singleflight"). When
+several threads convert overlapping playlists, the same search or the same
+playlist page is often requested by several of them at the same time: only
+the first one (the leader) issues the request, the others wait for its
+response, which saves calls and, for YouTube searches, 100 quota points
+each.
+
+Requests are identical if they go to the same endpoint, through the same
+client, with the same normalised parameters (see bes.api). Only idempotent
+reads listed in COALESCED_ENDPOINTS are coalesced. Followers get a copy of
+the response, or the error of the leader. Coalesced requests are recorded in
+bes.metrics ('coalesced_requests' counter).
+
+Coalescing is enabled by default, it only ever removes requests.
+
+Example
+-------
+from bes import singleflight
+fetch_playlists(playlists)
+singleflight.GROUP.stats()
+
+"""
+import copy
+import threading
+from collections import defaultdict
+
+from bes.metrics import METRICS
+
+# idempotent read endpoints which may be coalesced, per backend
+COALESCED_ENDPOINTS = {
+    'spotify': {'search', 'tracks', 'audio_features', 'playlist', 'playlist_items',
+                'user_playlist_tracks', 'user_playlists', 'current_user_playlists',
+                'current_user_saved_tracks'},
+    'youtube': {'search.list', 'playlists.list', 'playlistItems.list'},
+}
+
+GROUP = None
+
+
+class _Call(object):
+    """Request in flight, waited for by followers."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class Group(object):
+    """
+    Group of in-flight requests, by key.
+
+    Parameters
+    ----------
+    endpoints : dict, default=COALESCED_ENDPOINTS
+        Backend -> set of endpoints which may be coalesced.
+
+    """
+    def __init__(self, endpoints=COALESCED_ENDPOINTS):
+        self.endpoints = endpoints
+        self._calls = {}
+        self._coalesced = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, backend, endpoint, key, function):
+        """
+        Call `function` (no arguments), unless a call with the same key is
+        in flight, in which case wait for its response.
+
+        """
+        if endpoint not in self.endpoints.get(backend, ()):
+            return function()
+        key = (backend, endpoint, key)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self._coalesced[(backend, endpoint)] += 1
+        if not leader:
+            METRICS.increment('coalesced_requests', backend=backend, endpoint=endpoint)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # followers may modify their response, keep the leader's intact
+            return copy.deepcopy(call.response)
+        try:
+            call.response = function()
+            return call.response
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """Number of coalesced requests per backend and endpoint."""
+        with self._lock:
+            return {f'{backend} {endpoint}': n for (backend, endpoint), n in self._coalesced.items()}
+
+
+def enable(**kwargs):
+    """Enable coalescing, see Group for arguments."""
+    global GROUP
+    GROUP = Group(**kwargs)
+    return GROUP
+
+
+def disable():
+    """Disable coalescing."""
+    global GROUP
+    GROUP = None
+
+
+def is_coalesced(backend, endpoint):
+    """Whether calls to endpoint are coalesced."""
+    group = GROUP
+    return group is not None and endpoint in group.endpoints.get(backend, ())
+
+
+def call(backend, endpoint, key, function):
+    """Call `function`, coalesced with identical in-flight calls if enabled."""
+    if GROUP is None:
+        return function()
+    return GROUP.call(backend, endpoint, key, function)
+
+
+enable()
@@ -0,0 +1,206 @@
+"""
+Columnar in-memory storage of tracks. Holding a list of Track objects (plus
+the original REST API JSON of each) costs hundreds of bytes per track, which
+adds up for libraries of 100k+ tracks. A TrackStore instead keeps one column
+per field:
+  * IDs are ASCII encoded into a single buffer, with an array of offsets.
+  * titles, names, channels and artists are dictionary-encoded: each distinct
+    string is stored once, and each track only holds integer codes.
+  * numeric fields (duration, popularity, release year) are typed arrays,
+    with -1 for missing values.
+
+The store behaves like the list of tracks it replaces: iterating or indexing
+it builds Track objects on the fly (without the `item` JSON), while bulk
+scans can work directly on the columns, see `TrackStore.column` and
+`TrackStore.codes`.
+
+"""
+from array import array
+
+NUMERIC_FIELDS = ('duration', 'popularity', 'release_year')
+
+
+class _StringColumn(object):
+    """Dictionary-encoded column of strings (or None)."""
+    def __init__(self):
+        self.values = []
+        self.codes = array('i')
+        self._index = {}
+
+    def encode(self, value):
+        if value is None:
+            return -1
+        if value not in self._index:
+            self._index[value] = len(self.values)
+            self.values.append(value)
+        return self._index[value]
+
+    def append(self, value):
+        self.codes.append(self.encode(value))
+
+    def __getitem__(self, index):
+        code = self.codes[index]
+        return None if code < 0 else self.values[code]
+
+
+class _ListColumn(_StringColumn):
+    """Dictionary-encoded column of lists of strings (e.g. artists)."""
+    def __init__(self):
+        super().__init__()
+        self.offsets = array('I', [0])
+
+    def append(self, values):
+        self.codes.extend(self.encode(value) for value in values)
+        self.offsets.append(len(self.codes))
+
+    def __getitem__(self, index):
+        start, stop = self.offsets[index], self.offsets[index + 1]
+        return [self.values[code] for code in self.codes[start:stop]]
+
+
+class _IdColumn(object):
+    """Column of ASCII IDs (or None) stored in a single buffer."""
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offsets = array('Q', [0])
+        self.missing = set()
+
+    def append(self, value):
+        if value is None:
+            self.missing.add(len(self.offsets) - 1)
+        else:
+            self.buffer.extend(value.encode('ascii'))
+        self.offsets.append(len(self.buffer))
+
+    def __getitem__(self, index):
+        if index in self.missing:
+            return None
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]].decode('ascii')
+
+
+def _get_numeric_fields(track):
+    """Extract numeric fields from track JSON if any (Spotify only)."""
+    item = getattr(track, 'item', None) or {}
+    release_date = (item.get('album') or {}).get('release_date') or ''
+    return (
+        item.get('duration_ms', -1),
+        item.get('popularity', -1),
+        int(release_date[:4]) if release_date[:4].isdigit() else -1,
+    )
+
+
+class TrackStore(object):
+    """
+    Columnar store of tracks of a single type, see module docstring.
+
+    Parameters
+    ----------
+    tracks : iterable of bes.track.Track, optional
+        Tracks to store.
+    track_cls : type, optional
+        Track class of the stored tracks, defaults to the class of the first
+        track added.
+
+    Example
+    -------
+    store = TrackStore(playlist.tracks)
+    durations = store.column('duration')
+    codes, artists = store.codes('artists')
+
+    """
+    def __init__(self, tracks=(), track_cls=None):
+        self.track_cls = track_cls
+        self._ids = _IdColumn()
+        self._titles = _StringColumn()
+        self._names = _StringColumn()
+        self._channels = _StringColumn()
+        self._artists = _ListColumn()
+        self._numeric = {
+            'duration': array('i'),
+            'popularity': array('h'),
+            'release_year': array('h'),
+        }
+        self.extend(tracks)
+
+    def append(self, track):
+        """Add track to the store. Its `item` JSON is not kept."""
+        if self.track_cls is None:
+            self.track_cls = track.__class__
+        self._ids.append(track.id)
+        self._titles.append(track.title)
+        self._names.append(track.name)
+        self._channels.append(getattr(track, 'channel', None))
+        self._artists.append(track.artists)
+        for field, value in zip(NUMERIC_FIELDS, _get_numeric_fields(track)):
+            self._numeric[field].append(value)
+
+    def extend(self, tracks):
+        for track in tracks:
+            self.append(track)
+
+    def column(self, name):
+        """
+        Get column by name: 'id', 'title', 'name', 'channel' and 'artists'
+        return decoded lists, numeric columns ('duration', 'popularity',
+        'release_year') return the underlying array.array, which can be
+        wrapped without copy by numpy.frombuffer for instance.
+
+        """
+        if name in self._numeric:
+            return self._numeric[name]
+        if name == 'id':
+            return [self._ids[i] for i in range(len(self))]
+        column = self._get_string_column(name)
+        return [column[i] for i in range(len(self))]
+
+    def codes(self, name):
+        """
+        Get dictionary-encoded column by name ('title', 'name', 'channel' or
+        'artists'), as a tuple of integer codes (array.array) and distinct
+        values (list). Code -1 stands for missing value. For 'artists', codes
+        are flattened over all tracks.
+
+        """
+        column = self._get_string_column(name)
+        return column.codes, column.values
+
+    def _get_string_column(self, name):
+        columns = {
+            'title': self._titles,
+            'name': self._names,
+            'channel': self._channels,
+            'artists': self._artists,
+        }
+        if name not in columns:
+            raise KeyError(f'unknown column {name}')
+        return columns[name]
+
+    def _get_track(self, index):
+        """Build track object from columns (without calling __init__)."""
+        track = object.__new__(self.track_cls)
+        track.id = self._ids[index]
+        track.title = self._titles[index]
+        track.name = self._names[index]
+        track.artists = self._artists[index]
+        track.item = None
+        channel = self._channels[index]
+        if channel is not None:
+            track.channel = channel
+        track.search_string = ' '.join(track.artists) + ' ' + track.title
+        return track
+
+    def __len__(self):
+        return len(self._titles.codes)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._get_track(index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get_track(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('track index out of range')
+        return self._get_track(index)
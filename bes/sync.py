@@ -0,0 +1,150 @@
+"""
+Sync several playlists in one go. Typical use case is mirroring a whole
+mapping of YouTube playlists to Spotify playlists (see
+run/from_youtube_to_spotify.py), where the same track often appears in
+several playlists: it only needs to be searched once.
+
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from bes.metrics import METRICS
+from bes.pagination import MAX_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_playlists(playlists, max_workers=MAX_WORKERS):
+    """
+    Retrieve the tracks of several playlists concurrently.
+
+    Parameters
+    ----------
+    playlists : list of bes.playlist.PlayList
+        Playlists to fetch. Playlists already fetched are left untouched.
+    max_workers : int, default=MAX_WORKERS
+        Maximum number of playlists fetched at the same time.
+
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda playlist: playlist.tracks, playlists))
+
+
+def sync_playlists(mapping, resume=True, max_workers=MAX_WORKERS):
+    """
+    Add the tracks of each source playlist to its target playlist, see
+    bes.playlist.PlayList.add_tracks. All playlists are fetched concurrently
+    first, then each distinct source track is matched only once across all
+    playlists thanks to a match table shared by all add_tracks calls (one per
+    target backend), and new tracks are added to each target in batches.
+    Pairs are synced concurrently, except pairs sharing a target playlist,
+    which are synced one after the other.
+
+    Parameters
+    ----------
+    mapping : iterable of (bes.playlist.PlayList, bes.playlist.PlayList)
+        Pairs of source and target playlists. Note that playlists cannot be
+        used as dict keys, so pass e.g. a list of tuples.
+    resume : bool, default=True
+        Resume previously interrupted jobs if any, see bes.journal.
+    max_workers : int, default=MAX_WORKERS
+        Maximum number of playlists fetched, and of pairs synced, at the same
+        time.
+
+    Returns
+    -------
+    summary : dict
+        Number of playlists synced, source tracks, distinct source tracks
+        matched, searches made, searches saved by the shared match table
+        compared to syncing playlists one by one, tracks added and write
+        requests issued.
+
+    """
+    mapping = list(mapping)
+    playlists = {id(playlist): playlist for pair in mapping for playlist in pair}
+    fetch_playlists(list(playlists.values()), max_workers=max_workers)
+
+    matches = {target.backend: {} for _, target in mapping}
+    groups = {}
+    for source, target in mapping:
+        groups.setdefault(id(target), []).append((source, target))
+
+    def sync_group(pairs):
+        return [(target, target.add_tracks(source, resume=resume, matches=matches[target.backend]))
+                for source, target in pairs]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = [result for results in executor.map(sync_group, groups.values()) for result in results]
+
+    n_tracks = sum(len(source) for source, _ in mapping)
+    n_added = 0
+    n_writes = 0
+    n_searched = 0
+    n_reused = 0
+    for target, ids_added in results:
+        n_added += len(ids_added)
+        n_searched += ids_added.n_searched
+        n_reused += ids_added.n_reused
+        n_writes += -(-len(ids_added) // target._MAX_TRACKS_PER_REQUEST)
+
+    # tracks without match are kept in the tables too, so as not to search them again
+    n_matched = sum(1 for table in matches.values() for match in table.values() if match is not None)
+    summary = {
+        'playlists': len(mapping),
+        'source tracks': n_tracks,
+        'distinct tracks matched': n_matched,
+        'searches': n_searched,
+        'searches saved': n_reused,
+        'tracks added': n_added,
+        'write requests': n_writes,
+    }
+    logger.info('Sync summary:\n%s', '\n'.join(f'\t- {value} {key}' for key, value in summary.items()))
+    METRICS.flush()
+    return summary
+
+
+def sync_bidirectional(playlist, other, resume=True):
+    """
+    Mirror two playlists (typically a YouTube and a Spotify playlist) in a
+    single pass, instead of two one-way syncs each fetching and matching
+    both playlists. Both playlists are fetched once (concurrently), tracks of
+    `playlist` are matched on the backend of `other` and added to it, then
+    the match table is reversed so that tracks of `other` which were already
+    paired with a track of `playlist` (including the ones just added) need no
+    search: only the remaining ones are matched and added to `playlist`.
+
+    Parameters
+    ----------
+    playlist : bes.playlist.PlayList
+        First playlist.
+    other : bes.playlist.PlayList
+        Second playlist.
+    resume : bool, default=True
+        Resume previously interrupted jobs if any, see bes.journal.
+
+    Returns
+    -------
+    summary : dict
+        Number of tracks added in each direction, searches performed and
+        searches saved by reversing the match table.
+
+    """
+    fetch_playlists([playlist, other])
+
+    forward = {}
+    ids_added = other.add_tracks(playlist, resume=resume, matches=forward)
+    backward = {
+        match_id: track_id for track_id, match_id in forward.items()
+        if match_id is not None
+    }
+    ids_added_back = playlist.add_tracks(other, resume=resume, matches=backward)
+
+    summary = {
+        f'tracks added to {other.backend} playlist {other.name}': len(ids_added),
+        f'tracks added to {playlist.backend} playlist {playlist.name}': len(ids_added_back),
+        'searches': ids_added.n_searched + ids_added_back.n_searched,
+        'searches saved': ids_added_back.n_reused,
+    }
+    logger.info('Sync summary:\n%s', '\n'.join(f'\t- {value} {key}' for key, value in summary.items()))
+    METRICS.flush()
+    return summary
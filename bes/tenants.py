@@ -0,0 +1,200 @@
+"""
+Sync the playlists of many accounts in one process. Each tenant has its own
+credentials and API endpoints (a bes.api.Account), its channels and
+playlists are created within bes.api.use_account and its job journals are
+keyed by its own playlist IDs, so no per-user state is shared. What is
+shared is what does not depend on the user: the catalog caches (match
+tables and search responses, see bes.catalog) and the worker threads.
+
+Jobs (one pair of playlists each) are scheduled fairly: workers are handed
+jobs round-robin across tenants, and a tenant never runs more than
+`max_workers_per_tenant` jobs at a time, so one account with a hundred
+playlists does not starve an account with two.
+
+Example
+-------
+def get_mapping():
+    channel = SpotifyChannel()
+    return [(YouTubePlayList(id=id, name=name), channel.get(name)) for name, id in MAPPING.items()]
+
+runner = TenantRunner([Tenant(Account('alice', spotify_user_id='alice'), get_mapping), ...])
+runner.run()
+
+"""
+import logging
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from bes import catalog
+from bes.api import use_account
+from bes.metrics import METRICS
+from bes.pagination import MAX_WORKERS
+from bes.sync import fetch_playlists
+
+logger = logging.getLogger(__name__)
+
+
+class Tenant(object):
+    """
+    One user of the runner.
+
+    Parameters
+    ----------
+    account : bes.api.Account
+        Credentials and API endpoints of the user.
+    get_mapping : callable
+        Called without arguments within the account context, returns the
+        pairs of source and target playlists of the user (list of
+        (bes.playlist.PlayList, bes.playlist.PlayList)).
+    resume : bool, default=True
+        Resume previously interrupted jobs if any, see bes.journal.
+
+    Attributes
+    ----------
+    mapping : list of (bes.playlist.PlayList, bes.playlist.PlayList)
+        Pairs of playlists, once resolved by the runner.
+
+    """
+    def __init__(self, account, get_mapping, resume=True):
+        self.account = account
+        self.get_mapping = get_mapping
+        self.resume = resume
+        self.mapping = None
+
+    @property
+    def name(self):
+        return self.account.name
+
+    def __repr__(self):
+        return f'Tenant({self.name})'
+
+
+class TenantRunner(object):
+    """
+    Sync the playlists of several tenants, see module docstring.
+
+    Parameters
+    ----------
+    tenants : list of bes.tenants.Tenant
+        Tenants to sync, with distinct account names.
+    max_workers : int, default=MAX_WORKERS
+        Maximum number of jobs running at the same time, all tenants
+        included.
+    max_workers_per_tenant : int, default=1
+        Maximum number of jobs of one tenant running at the same time.
+    max_searches : int, default=100000
+        Maximum number of search responses shared across tenants, see
+        bes.catalog.Catalog. The catalog already enabled is used if any.
+
+    """
+    def __init__(self, tenants, max_workers=MAX_WORKERS, max_workers_per_tenant=1,
+                 max_searches=100000):
+        self.tenants = list(tenants)
+        if len({tenant.name for tenant in self.tenants}) != len(self.tenants):
+            raise ValueError('tenants must have distinct account names')
+        self.max_workers = max_workers
+        self.max_workers_per_tenant = max_workers_per_tenant
+        self.catalog = catalog.CATALOG or catalog.enable(max_searches=max_searches)
+
+    def _resolve(self, tenant):
+        """Job resolving the mapping of tenant (channels listing, playlist creation)."""
+        with use_account(tenant.account):
+            tenant.mapping = list(tenant.get_mapping())
+
+    def _sync(self, tenant, source, target):
+        """Job syncing one pair of playlists of tenant."""
+        with use_account(tenant.account):
+            # fetch both at once, add_tracks would fetch them one after the other
+            fetch_playlists([source, target], max_workers=2)
+            return target.add_tracks(source, resume=tenant.resume,
+                                     matches=self.catalog.get_matches(target.backend))
+
+    def _schedule(self, jobs):
+        """
+        Run jobs fairly, see module docstring.
+
+        Parameters
+        ----------
+        jobs : dict
+            Tenant name -> deque of (function, args) jobs of the tenant.
+
+        Yields
+        ------
+        tenant_name, result, error : str, object, Exception or None
+            Outcome of each job, as jobs complete.
+
+        """
+        turn = deque(name for name in jobs if jobs[name])
+        running = {}
+        n_running = dict.fromkeys(jobs, 0)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while turn or running:
+                # hand free workers to tenants in turn, skipping tenants at their limit
+                skipped = []
+                while turn and len(running) < self.max_workers:
+                    name = turn.popleft()
+                    if n_running[name] >= self.max_workers_per_tenant:
+                        skipped.append(name)
+                        continue
+                    function, args = jobs[name].popleft()
+                    running[executor.submit(function, *args)] = name
+                    n_running[name] += 1
+                    if jobs[name]:
+                        turn.append(name)
+                turn.extendleft(reversed(skipped))
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    n_running[name] -= 1
+                    error = future.exception()
+                    yield name, None if error else future.result(), error
+
+    def run(self):
+        """
+        Sync the playlists of all tenants once. A failing job (e.g. expired
+        credentials, quota exceeded) is logged and recorded in the summary of
+        its tenant, the other jobs run as planned.
+
+        Returns
+        -------
+        summary : dict
+            Tenant name -> number of pairs synced, tracks added, errors and
+            duration in seconds.
+
+        """
+        start = time.time()
+        summary = {tenant.name: {'pairs synced': 0, 'tracks added': 0, 'errors': [],
+                                 'duration': None} for tenant in self.tenants}
+        tenants = {tenant.name: tenant for tenant in self.tenants}
+
+        # resolving mappings lists channels, fairly scheduled like any other job
+        pending = {name: deque() for name in tenants}
+        for tenant in self.tenants:
+            if tenant.mapping is None:
+                pending[tenant.name].append((self._resolve, (tenant,)))
+        self._collect(self._schedule(pending), summary, start)
+
+        jobs = {name: deque((self._sync, (tenant, source, target)) for source, target in tenant.mapping or [])
+                for name, tenant in tenants.items()}
+        self._collect(self._schedule(jobs), summary, start)
+
+        METRICS.flush()
+        logger.info('%d tenants synced in %.1fs, catalog: %s',
+                    len(self.tenants), time.time() - start, self.catalog.stats())
+        return summary
+
+    def _collect(self, outcomes, summary, start):
+        """Record job outcomes in the summary of their tenant."""
+        for name, ids_added, error in outcomes:
+            tenant_summary = summary[name]
+            tenant_summary['duration'] = time.time() - start
+            if error is not None:
+                logger.error('tenant %s: job failed: %r', name, error)
+                tenant_summary['errors'].append(repr(error))
+                METRICS.increment('tenant_errors', tenant=name)
+            elif ids_added is not None:
+                tenant_summary['pairs synced'] += 1
+                tenant_summary['tracks added'] += len(ids_added)
+                METRICS.increment('tenant_tracks_added', len(ids_added), tenant=name)
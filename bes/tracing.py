@@ -0,0 +1,159 @@
+"""
+Opt-in tracing of sync runs, to find out where the time goes: listing
+playlists, parsing titles, searching, scoring or inserting. Stages of
+bes.playlist, bes.track, bes.clean and bes.score are wrapped in (nested)
+spans, which are recorded only when tracing is enabled; when disabled a span
+is a shared no-op context manager, so hooks cost close to nothing.
+
+Recorded spans can be exported as a Chrome trace event file (open it in
+chrome://tracing or https://ui.perfetto.dev) and summarised per stage (wall
+time and CPU time).
+
+Example
+-------
+from bes import tracing
+with tracing.trace('sync.trace.json'):
+    spotify_playlist.add_tracks(youtube_playlist)
+print(tracing.format_summary())
+
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+_ENABLED = False
+_EVENTS = []
+_ORIGIN = time.perf_counter()
+
+
+class _NullSpan(object):
+    """Span used when tracing is disabled: does nothing."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    """Span recording wall time and CPU time (of the current thread)."""
+    __slots__ = ('name', 'args', 'start', 'cpu_start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        _EVENTS.append({
+            'name': self.name,
+            'ph': 'X',
+            'ts': (self.start - _ORIGIN) * 1e6,
+            'dur': (end - self.start) * 1e6,
+            'tdur': (time.thread_time() - self.cpu_start) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': self.args,
+        })
+        return False
+
+
+def span(name, **args):
+    """
+    Context manager tracing the enclosed block as a span named `name`, with
+    optional `args` shown in the trace viewer.
+
+    """
+    if not _ENABLED:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def traced(function):
+    """Decorator tracing each call of the function as a span."""
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _ENABLED:
+            return function(*args, **kwargs)
+        with _Span(name, {}):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def enable():
+    """Enable tracing and forget previously recorded spans."""
+    global _ENABLED, _ORIGIN
+    _EVENTS.clear()
+    _ORIGIN = time.perf_counter()
+    _ENABLED = True
+
+
+def disable():
+    """Disable tracing, recorded spans are kept until next enable."""
+    global _ENABLED
+    _ENABLED = False
+
+
+def export_chrome_trace(path):
+    """Write recorded spans to `path` in Chrome trace event format."""
+    with open(path, 'w') as handle:
+        json.dump({'traceEvents': list(_EVENTS), 'displayTimeUnit': 'ms'}, handle)
+
+
+def summary():
+    """
+    Summary per stage (span name) of recorded spans.
+
+    Returns
+    -------
+    summary : dict
+        Span name -> dict with number of calls, total wall time and total
+        CPU time in seconds (inclusive of nested spans).
+
+    """
+    stages = defaultdict(lambda: {'calls': 0, 'wall': 0., 'cpu': 0.})
+    for event in list(_EVENTS):
+        stage = stages[event['name']]
+        stage['calls'] += 1
+        stage['wall'] += event['dur'] / 1e6
+        stage['cpu'] += event['tdur'] / 1e6
+    return dict(stages)
+
+
+def format_summary():
+    """Summary as a table, stages sorted by decreasing wall time."""
+    stages = sorted(summary().items(), key=lambda item: -item[1]['wall'])
+    lines = [f'{"stage":40} {"calls":>8} {"wall (s)":>10} {"cpu (s)":>10}']
+    for name, stage in stages:
+        lines.append(f'{name:40} {stage["calls"]:8} {stage["wall"]:10.3f} {stage["cpu"]:10.3f}')
+    return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def trace(path=None):
+    """
+    Enable tracing for the enclosed block, then export the Chrome trace to
+    `path` if provided.
+
+    """
+    enable()
+    try:
+        yield
+    finally:
+        disable()
+        if path is not None:
+            export_chrome_trace(path)
@@ -1,6 +1,13 @@
-from bes.api import get_or_create_spotify_api, get_or_create_youtube_api
+import functools
+import logging
+
+from bes import candidates, catalog
+from bes.api import execute, get_or_create_spotify_api, get_or_create_youtube_api
 from bes.clean import split_artists_from_title
 from bes.score import get_risk_score
+from bes.tracing import span
+
+logger = logging.getLogger(__name__)
 
 
 class Track(object):
@@ -136,7 +143,8 @@ class YouTubeTrack(Track):
             q=track.search_string,
             type="video",
         )
-        response = request.execute()
+        with span('search', backend='youtube'):
+            response = catalog.search('youtube', track.search_string, functools.partial(execute, request))
         # convert items to YouTube track
         matches = []
         for i, item in enumerate(response['items']):
@@ -144,22 +152,27 @@ class YouTubeTrack(Track):
                 match = cls.from_item(item)
                 matches.append(match)
             except ValueError as e:
-                print(f'Could not add YouTube match {i+1} because of original error {e}.')
+                logger.debug('Could not add YouTube match %d because of original error %s.', i + 1, e)
                 continue
 
         # score each match if any, pick lowest scoring track if below threshold
         match = None
+        scores = []
         if len(matches):
             risks = []
-            for i, match in enumerate(matches):
-                risk, missing_artists, mismatch = get_risk_score(track, match)
+            debug = logger.isEnabledFor(logging.DEBUG)
+            for i, candidate in enumerate(matches):
+                risk, missing_artists, mismatch = get_risk_score(track, candidate)
                 risks.append(risk)
-                print(f'\t- match {i}:\n\t\t- risk {risk}'
-                      f'\n\t\t- missing artists {" & ".join(missing_artists)}'
-                      f'\n\t\t- mismatch in name: {mismatch}')
+                scores.append((risk, missing_artists, mismatch))
+                if debug:
+                    logger.debug('\t- match %d:\n\t\t- risk %s\n\t\t- missing artists %s'
+                                 '\n\t\t- mismatch in name: %s',
+                                 i, risk, ' & '.join(missing_artists), mismatch)
             if any(risk < threshold for risk in risks):
                 match = matches[risks.index(min(risks))]
-                print(f'matched and added track ID with risk score of {min(risks)}.')
+                logger.debug('matched and added track ID with risk score of %s.', min(risks))
+        candidates.record('youtube', track.id, matches, scores)
         if match is None:
             raise ValueError(f'no match found on youtube for this track: name '
                              f'{track.name} / search string {track.search_string}')
@@ -210,20 +223,27 @@ class SpotifyTrack(Track):
     def from_youtube(cls, track, threshold=1.0):
         """See base class docstring."""
         api = get_or_create_spotify_api()
-        result = api.search(track.search_string)
+        with span('search', backend='spotify'):
+            result = catalog.search('spotify', track.search_string,
+                                    functools.partial(api.search, track.search_string))
         matches = [cls.from_item(item) for item in result['tracks']['items']]
         match = None
+        scores = []
         if len(matches):
             risks = []
-            for i, match in enumerate(matches):
-                risk, missing_artists, mismatch = get_risk_score(track, match)
+            debug = logger.isEnabledFor(logging.DEBUG)
+            for i, candidate in enumerate(matches):
+                risk, missing_artists, mismatch = get_risk_score(track, candidate)
                 risks.append(risk)
-                print(f'\t- match {i}:\n\t\t- risk {risk}'
-                      f'\n\t\t- missing artists {" & ".join(missing_artists)}'
-                      f'\n\t\t- mismatch in name: {mismatch}')
+                scores.append((risk, missing_artists, mismatch))
+                if debug:
+                    logger.debug('\t- match %d:\n\t\t- risk %s\n\t\t- missing artists %s'
+                                 '\n\t\t- mismatch in name: %s',
+                                 i, risk, ' & '.join(missing_artists), mismatch)
             if any(risk < threshold for risk in risks):
                 match = matches[risks.index(min(risks))]
-                print(f'matched and added track ID with risk score of {min(risks)}.')
+                logger.debug('matched and added track ID with risk score of %s.', min(risks))
+        candidates.record('spotify', track.id, matches, scores)
         if match is None:
             raise ValueError(f'no match found on spotify for this track: name '
                              f'{track.name} / search string {track.search_string}')
@@ -0,0 +1,536 @@
+"""
+Durable work queue, to spread a large sync over several worker processes and
+survive crashes. Instead of one process matching 50k tracks one after the
+other, the sync is split into tasks stored in a SQLite database:
+  * one 'match' task per distinct source track and target backend, whose
+    result (matched ID or None) is kept and reused by later syncs,
+  * one 'insert' task per pair of playlists, which waits for the matches of
+    its tracks and adds the new ones to the target in batches.
+
+Workers lease tasks for a limited time (`lease_seconds`), extend their lease
+while working (heartbeat) and complete or fail them. The lease of a worker
+which died expires and the task is leased again by another worker, up to
+`max_attempts` times. Updates of a task are only accepted from the worker
+holding its lease, so a worker whose lease expired cannot complete a task
+someone else took over.
+
+Inserting tracks is not idempotent, so insert tasks check the target
+playlist on every attempt and record their progress after each batch: a
+batch which was sent but not recorded before a crash is found in the target
+and not inserted again. Workers heartbeat before each batch, and stop if
+their lease was lost.
+
+The database uses SQLite's write-ahead log (WAL), so that workers read while
+another one writes. Note that WAL requires all processes to be on the same
+host (it relies on shared memory); to share a queue between hosts, use
+`wal=False` on a filesystem with working POSIX locks.
+
+Example
+-------
+queue = WorkQueue()
+enqueue_add_tracks(queue, youtube_playlist, spotify_playlist)
+# then in as many processes as needed
+work(queue, threads=8)
+
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bes import CACHE_DIR
+from bes.metrics import METRICS
+from bes.pagination import MAX_WORKERS
+from bes.playlist import SpotifyPlaylist, YouTubePlayList
+from bes.track import SpotifyTrack, YouTubeTrack
+
+QUEUE_PATH = CACHE_DIR / 'queue.sqlite'
+PLAYLISTS = {
+    'youtube': YouTubePlayList,
+    'spotify': SpotifyPlaylist,
+}
+TRACKS = {
+    'youtube': YouTubeTrack,
+    'spotify': SpotifyTrack,
+}
+# target backend -> function matching a track of the other backend
+MATCHERS = {
+    'youtube': YouTubeTrack.from_spotify,
+    'spotify': SpotifyTrack.from_youtube,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key TEXT UNIQUE,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    -- end of lease if leased, time before which not to lease it if pending
+    lease_until REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_by_state ON tasks (state, lease_until);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """The lease of a task expired and the task may be run by another worker."""
+
+
+class Task(object):
+    """
+    Task leased from a WorkQueue.
+
+    Attributes
+    ----------
+    id : int
+        Task ID.
+    kind : str
+        'match' or 'insert'.
+    key : str or None
+        Unique key of the task, if any.
+    payload : dict
+        Task arguments (and progress).
+    attempts : int
+        Number of times the task was leased, this one included.
+    owner : str
+        Worker holding the lease.
+
+    """
+    def __init__(self, id, kind, key, payload, attempts, owner):
+        self.id = id
+        self.kind = kind
+        self.key = key
+        self.payload = payload
+        self.attempts = attempts
+        self.owner = owner
+
+    def __repr__(self):
+        return f'Task({self.id}, {self.kind}, {self.key})'
+
+
+class WorkQueue(object):
+    """
+    Durable queue of tasks with leases, backed by SQLite.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path, default=QUEUE_PATH
+        Path of the database, created if it does not exist.
+    lease_seconds : float, default=300
+        Duration of a lease, renewed by heartbeats.
+    max_attempts : int, default=5
+        Number of times a task is leased before being marked as failed.
+    wal : bool, default=True
+        Use write-ahead logging, see module docstring.
+
+    """
+    def __init__(self, path=QUEUE_PATH, lease_seconds=300, max_attempts=5, wal=True):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.wal = wal
+        # sqlite3 connections cannot be shared between threads
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # autocommit, transactions are explicit
+            connection = sqlite3.connect(str(self.path), timeout=60, isolation_level=None)
+            if self.wal:
+                connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def _write(self, query, args=()):
+        """Run one write statement, returns the number of rows changed."""
+        return self._connect().execute(query, args).rowcount
+
+    def put(self, kind, payload, key=None, replace_finished=False):
+        """
+        Add a task, unless a task with the same key exists.
+
+        Parameters
+        ----------
+        kind : str
+            Task kind.
+        payload : dict
+            Task arguments, JSON serializable.
+        key : str, optional
+            Unique key of the task.
+        replace_finished : bool, default=False
+            If a task with the same key exists and is done or failed, run it
+            again with this payload instead of keeping it.
+
+        Returns
+        -------
+        added : bool
+            Whether the task was added (or replaced).
+
+        """
+        now = time.time()
+        payload = json.dumps(payload)
+        if self._write('INSERT OR IGNORE INTO tasks (kind, key, payload, updated) VALUES (?, ?, ?, ?)',
+                       (kind, key, payload, now)):
+            return True
+        if not replace_finished:
+            return False
+        return bool(self._write(
+            "UPDATE tasks SET payload = ?, state = 'pending', owner = NULL, lease_until = 0, "
+            "attempts = 0, result = NULL, error = NULL, updated = ? "
+            "WHERE key = ? AND state IN ('done', 'failed')", (payload, now, key)))
+
+    def lease(self, owner, kinds=None):
+        """
+        Lease the oldest task ready to run: pending, or leased by a worker
+        whose lease expired.
+
+        Parameters
+        ----------
+        owner : str
+            Name of the worker, unique across processes and hosts.
+        kinds : list of str, optional
+            Only lease tasks of these kinds.
+
+        Returns
+        -------
+        task : bes.workqueue.Task or None
+            Leased task, None if no task is ready.
+
+        """
+        now = time.time()
+        condition = "state IN ('pending', 'leased') AND lease_until <= ?"
+        args = [now]
+        if kinds:
+            condition += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            args += list(kinds)
+        connection = self._connect()
+        # lock the database for writing right away, so that two workers cannot lease the same task
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            n_failed = connection.execute(
+                "UPDATE tasks SET state = 'failed', owner = NULL, error = 'lease expired too many times', "
+                f"updated = ? WHERE {condition} AND state = 'leased' AND attempts >= ?",
+                [now] + args + [self.max_attempts]).rowcount
+            row = connection.execute(
+                f'SELECT id, kind, key, payload, attempts, state FROM tasks WHERE {condition} '
+                'ORDER BY id LIMIT 1', args).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE tasks SET state = 'leased', owner = ?, lease_until = ?, "
+                    "attempts = attempts + 1, updated = ? WHERE id = ?",
+                    (owner, now + self.lease_seconds, now, row[0]))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        if n_failed:
+            METRICS.increment('queue_tasks_failed', n_failed)
+        if row is None:
+            return None
+        id, kind, key, payload, attempts, state = row
+        if state == 'leased':
+            logger.info('lease of task %s expired, retrying it', id)
+            METRICS.increment('queue_lease_expirations', kind=kind)
+        return Task(id, kind, key, json.loads(payload), attempts + 1, owner)
+
+    def heartbeat(self, task):
+        """Extend the lease of task, raises LeaseLost if it was lost."""
+        if not self._write(
+                "UPDATE tasks SET lease_until = ?, updated = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (time.time() + self.lease_seconds, time.time(), task.id, task.owner)):
+            raise LeaseLost(f'lease of task {task.id} lost by {task.owner}')
+
+    def checkpoint(self, task):
+        """Save the payload of task (e.g. progress), raises LeaseLost if the lease was lost."""
+        if not self._write(
+                "UPDATE tasks SET payload = ?, lease_until = ?, updated = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (json.dumps(task.payload), time.time() + self.lease_seconds, time.time(),
+                 task.id, task.owner)):
+            raise LeaseLost(f'lease of task {task.id} lost by {task.owner}')
+
+    def complete(self, task, result=None):
+        """Mark task as done with a result (JSON serializable), returns False if the lease was lost."""
+        done = bool(self._write(
+            "UPDATE tasks SET state = 'done', owner = NULL, result = ?, updated = ? "
+            "WHERE id = ? AND owner = ? AND state = 'leased'",
+            (json.dumps(result), time.time(), task.id, task.owner)))
+        if done:
+            METRICS.increment('queue_tasks_done', kind=task.kind)
+        return done
+
+    def fail(self, task, error, retry_in=0.):
+        """
+        Release task after an error: it is retried after `retry_in` seconds,
+        or marked as failed if it was attempted max_attempts times already.
+
+        """
+        state = 'failed' if task.attempts >= self.max_attempts else 'pending'
+        if state == 'failed':
+            METRICS.increment('queue_tasks_failed')
+        return bool(self._write(
+            "UPDATE tasks SET state = ?, owner = NULL, lease_until = ?, error = ?, updated = ? "
+            "WHERE id = ? AND owner = ? AND state = 'leased'",
+            (state, time.time() + retry_in, str(error), time.time(), task.id, task.owner)))
+
+    def defer(self, task, delay):
+        """Release task without counting an attempt, to run it again in `delay` seconds."""
+        return bool(self._write(
+            "UPDATE tasks SET state = 'pending', owner = NULL, lease_until = ?, "
+            "attempts = attempts - 1, updated = ? "
+            "WHERE id = ? AND owner = ? AND state = 'leased'",
+            (time.time() + delay, time.time(), task.id, task.owner)))
+
+    def get_results(self, keys):
+        """
+        State and result of tasks by key.
+
+        Returns
+        -------
+        tasks : dict
+            Key -> (state, result), for the keys found.
+
+        """
+        tasks = {}
+        keys = list(keys)
+        connection = self._connect()
+        # stay below SQLite's limit on the number of query parameters
+        for offset in range(0, len(keys), 500):
+            chunk = keys[offset:offset + 500]
+            rows = connection.execute(
+                f"SELECT key, state, result FROM tasks WHERE key IN ({', '.join('?' * len(chunk))})",
+                chunk)
+            for key, state, result in rows:
+                tasks[key] = (state, None if result is None else json.loads(result))
+        return tasks
+
+    def counts(self):
+        """Number of tasks by kind and state."""
+        counts = {}
+        for kind, state, n in self._connect().execute(
+                'SELECT kind, state, COUNT(*) FROM tasks GROUP BY kind, state'):
+            counts.setdefault(kind, {})[state] = n
+        return counts
+
+    def is_finished(self):
+        """Whether no task is pending or leased."""
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM tasks WHERE state IN ('pending', 'leased')").fetchone()[0] == 0
+
+
+def _get_spec(playlist):
+    return {'backend': playlist.backend, 'id': playlist.id, 'name': playlist.name}
+
+
+def _get_match_key(source_backend, id, backend):
+    return f'match/{source_backend}/{id}/to/{backend}'
+
+
+def enqueue_add_tracks(queue, source, target):
+    """
+    Enqueue the tasks adding the tracks of `source` to `target`, the queued
+    equivalent of target.add_tracks(source). Tracks already matched by an
+    earlier sync (done match tasks) are not matched again.
+
+    Parameters
+    ----------
+    queue : bes.workqueue.WorkQueue
+        Queue to add the tasks to.
+    source : bes.playlist.PlayList
+        Playlist the tracks are added from, fetched if not loaded yet.
+    target : bes.playlist.PlayList
+        Playlist the tracks are added to, must exist (have an ID).
+
+    Returns
+    -------
+    n_tasks : int
+        Number of tasks added.
+
+    """
+    if target.id is None:
+        raise ValueError(f'target playlist {target.name} must have an ID')
+    n_tasks = 0
+    track_keys = []
+    for track in source:
+        key = _get_match_key(source.backend, track.id, target.backend)
+        track_keys.append(key)
+        n_tasks += queue.put('match', {'backend': target.backend, 'source_backend': source.backend,
+                                       'track': _dump_track(track)}, key=key)
+    payload = {'source': _get_spec(source), 'target': _get_spec(target), 'tracks': track_keys,
+               'inserted': []}
+    n_tasks += queue.put('insert', payload, replace_finished=True,
+                         key=f'insert/{source.backend}/{source.id}/to/{target.backend}/{target.id}')
+    logger.info('%d tasks enqueued to add tracks of %s to %s', n_tasks, source, target)
+    return n_tasks
+
+
+def _dump_track(track):
+    """
+    What matching needs of a track, so that tracks without their JSON (e.g.
+    of columnar playlists, see bes.store) can be matched too.
+
+    """
+    return {'id': track.id, 'title': track.title, 'name': track.name,
+            'artists': list(track.artists), 'channel': getattr(track, 'channel', None)}
+
+
+def _load_track(track_cls, fields):
+    """Track of class `track_cls` from _dump_track fields, the way bes.store builds tracks."""
+    track = object.__new__(track_cls)
+    for name, value in fields.items():
+        if value is not None:
+            setattr(track, name, value)
+    track.item = None
+    track.search_string = ' '.join(track.artists) + ' ' + track.title
+    return track
+
+
+def _run_match(task):
+    """Match one track, result is the matched ID or None."""
+    track_cls = TRACKS[task.payload['source_backend']]
+    if 'item' in task.payload:
+        # enqueued by an earlier version
+        track = track_cls.from_item(task.payload['item'])
+    else:
+        track = _load_track(track_cls, task.payload['track'])
+    try:
+        return MATCHERS[task.payload['backend']](track).id
+    except ValueError as e:
+        logger.debug(e)
+        return None
+
+
+def _run_insert(queue, task, poll_interval):
+    """
+    Insert the new matched tracks in the target, returns the number of
+    tracks inserted or defers the task if some tracks are not matched yet.
+
+    """
+    results = queue.get_results(task.payload['tracks'])
+    waiting = sum(1 for state, _ in results.values() if state in ('pending', 'leased'))
+    if waiting:
+        logger.debug('task %s waiting for %d matches', task.id, waiting)
+        queue.defer(task, poll_interval)
+        return None
+
+    spec = task.payload['target']
+    target = PLAYLISTS[spec['backend']](id=spec['id'], name=spec['name'])
+    inserted = set(task.payload['inserted'])
+    # fetched on every attempt: tracks inserted by a previous attempt are found here
+    ids_existing = target.track_ids
+    ids_matched = [results.get(key, (None, None))[1] for key in task.payload['tracks']]
+    ids_to_add = [id for id in dict.fromkeys(ids_matched)
+                  if id is not None and id not in ids_existing and id not in inserted]
+    if target._INSERT_POSITION == 0:
+        ids_to_add.reverse()
+    for offset in range(0, len(ids_to_add), target._MAX_TRACKS_PER_REQUEST):
+        ids = ids_to_add[offset:offset + target._MAX_TRACKS_PER_REQUEST]
+        queue.heartbeat(task)
+        target._insert_tracks(ids, {}, build=False)
+        task.payload['inserted'].extend(ids)
+        queue.checkpoint(task)
+    METRICS.increment('tracks_added', len(ids_to_add), backend=target.backend)
+    logger.info('%d tracks added to %s playlist %s!', len(ids_to_add), target.backend, target.name)
+    return len(ids_to_add)
+
+
+class Worker(object):
+    """
+    Worker running tasks of a WorkQueue.
+
+    Parameters
+    ----------
+    queue : bes.workqueue.WorkQueue
+        Queue to lease tasks from.
+    name : str, optional
+        Name of the worker, unique across processes and hosts. Host name,
+        process ID and thread ID by default.
+    kinds : list of str, optional
+        Only run tasks of these kinds.
+    poll_interval : float, default=1.
+        Seconds to wait when no task is ready, and before running again an
+        insert task whose tracks are not all matched.
+    retry_in : float, default=10.
+        Seconds to wait before retrying a failed task.
+
+    """
+    def __init__(self, queue, name=None, kinds=None, poll_interval=1., retry_in=10.):
+        self.queue = queue
+        self.name = name or f'{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}'
+        self.kinds = kinds
+        self.poll_interval = poll_interval
+        self.retry_in = retry_in
+
+    def run_task(self, task):
+        """Run a leased task and complete, defer or fail it."""
+        try:
+            if task.kind == 'match':
+                result = _run_match(task)
+            elif task.kind == 'insert':
+                result = _run_insert(self.queue, task, self.poll_interval)
+                if result is None:
+                    return
+            else:
+                raise ValueError(f'unknown task kind {task.kind}')
+        except LeaseLost as e:
+            logger.warning('%s, dropping it', e)
+            return
+        except Exception as e:
+            logger.exception('task %s failed: %r', task.id, e)
+            self.queue.fail(task, repr(e), retry_in=self.retry_in)
+            return
+        if not self.queue.complete(task, result):
+            logger.warning('lease of task %s lost by %s before completion', task.id, self.name)
+
+    def run(self, max_tasks=None, exit_when_idle=True):
+        """
+        Run tasks until the queue is finished (if exit_when_idle) or
+        max_tasks tasks were run.
+
+        Returns
+        -------
+        n_tasks : int
+            Number of tasks run.
+
+        """
+        n_tasks = 0
+        while max_tasks is None or n_tasks < max_tasks:
+            task = self.queue.lease(self.name, kinds=self.kinds)
+            if task is None:
+                if exit_when_idle and self.queue.is_finished():
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            self.run_task(task)
+            n_tasks += 1
+        return n_tasks
+
+
+def work(queue, threads=MAX_WORKERS, **kwargs):
+    """
+    Run `threads` workers in this process until the queue is finished, see
+    Worker for arguments. Returns the number of tasks run.
+
+    """
+    def run_worker(i):
+        return Worker(queue, **kwargs).run()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        n_tasks = sum(executor.map(run_worker, range(threads)))
+    METRICS.flush()
+    return n_tasks
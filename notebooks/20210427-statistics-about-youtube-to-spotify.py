@@ -14,7 +14,6 @@
 
 # +
 import datetime
-from collections import defaultdict
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
@@ -36,7 +35,8 @@ for font_file in font_files_roboto:
 plt.rcParams['font.family'] = 'Roboto'
 # -
 
-channel = SpotifyChannel()
+# keep at most ~200 MiB of tracks in memory, see bes.cache
+channel = SpotifyChannel(max_memory=200 * 2 ** 20)
 
 for i, playlist in enumerate(channel):
     print(i, playlist.name)
@@ -51,18 +51,9 @@ track.item['album']
 
 track.item['album'].keys()
 
-df_data = defaultdict(list)
-for playlist in channel:
-    if 'case' not in playlist.name:
-        continue
-    for track in playlist:
-        df_data['playlist'].append(playlist.name)
-        df_data['title'].append(track.title)
-        df_data['artists'].append(track.artists)
-        df_data['duration'].append(track.item['duration_ms'])
-        df_data['popularity'].append(track.item['popularity'])
-        df_data['release_date'].append(int(track.item['album']['release_date'][:4]))
-df = pd.DataFrame.from_dict(df_data)
+df = channel.to_dataframe(names=[name for name, _ in channel.items() if 'case' in name])
+df = df.rename(columns={'release_year': 'release_date'})
+df['playlist'] = df['playlist'].astype(str)
 # clean up playlist name
 df['playlist'] = df['playlist'].str.replace(' case', '')
 # drop playlist with too low count
@@ -1,9 +1,22 @@
 import fire
 
+from bes import set_verbosity, tracing
 from bes.channel import SpotifyChannel, YouTubeChannel
+from bes.metrics import METRICS, JsonLinesSink
 
 
-def main():
+def main(verbosity='INFO', metrics_file=None, trace_file=None):
+    """
+    Add liked Spotify tracks to the 'spotify likes' YouTube playlist.
+    Metrics are appended to metrics_file (JSON lines) if provided. If
+    trace_file is provided, the sync is traced (see bes.tracing) and exported
+    to it.
+
+    """
+    set_verbosity(verbosity)
+    if metrics_file is not None:
+        METRICS.add_sink(JsonLinesSink(metrics_file))
+
     youtube_channel = YouTubeChannel(readonly=False)
     youtube_playlist = youtube_channel.get('spotify likes')
 
@@ -12,7 +25,12 @@ def main():
     spotify_playlist = spotify_channel.get_saved_tracks_playlist()
 
     # add tracks
-    youtube_playlist.add_tracks(spotify_playlist)
+    if trace_file is None:
+        youtube_playlist.add_tracks(spotify_playlist)
+    else:
+        with tracing.trace(trace_file):
+            youtube_playlist.add_tracks(spotify_playlist)
+        print(tracing.format_summary())
 
 
 
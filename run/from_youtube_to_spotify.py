@@ -1,7 +1,11 @@
 import fire
 
-from bes.channel import SpotifyChannel
-from bes.playlist import YouTubePlayList
+from bes import set_verbosity, tracing
+from bes.channel import SpotifyChannel, YouTubeChannel
+from bes.metrics import METRICS, JsonLinesSink
+from bes.plan import plan_sync
+from bes.playlist import SpotifyPlaylist, YouTubePlayList
+from bes.sync import sync_playlists
 
 
 MAPPING = {
@@ -20,16 +24,46 @@ MAPPING = {
 }
 
 
-def main(playlist_name):
-    youtube_playlist_id = MAPPING[playlist_name]
-    youtube_playlist = YouTubePlayList(id=youtube_playlist_id, name=playlist_name)
+def main(playlist_name=None, dry_run=False, verbosity='INFO', metrics_file=None,
+         trace_file=None):
+    """
+    Sync one playlist of MAPPING, or all of them if no name is given. With
+    dry_run, only print the plan of the sync (calls, quota, time), writing
+    nothing: playlists are listed, missing ones are not created. Metrics
+    are appended to metrics_file (JSON lines) if provided. If trace_file is
+    provided, the sync is traced (see bes.tracing) and exported to it.
 
-    # get or create spotify channel
+    """
+    set_verbosity(verbosity)
+    if metrics_file is not None:
+        METRICS.add_sink(JsonLinesSink(metrics_file))
     spotify_channel = SpotifyChannel()
-    spotify_playlist = spotify_channel.get(playlist_name)
+    youtube_channel = YouTubeChannel()
+    playlist_names = list(MAPPING) if playlist_name is None else [playlist_name]
+
+    # youtube playlists from the channel listing, which reports their size
+    youtube_playlists = [youtube_channel[MAPPING[name]] if MAPPING[name] in youtube_channel
+                         else YouTubePlayList(id=MAPPING[name], name=name) for name in playlist_names]
+
+    if dry_run:
+        # plan missing spotify playlists as created, without creating them
+        mapping = [(youtube_playlist, spotify_channel[name] if name in spotify_channel
+                    else SpotifyPlaylist(id=None, name=name, size=0))
+                   for name, youtube_playlist in zip(playlist_names, youtube_playlists)]
+        print(plan_sync(mapping))
+        return
+
+    # get or create spotify playlists
+    mapping = [(youtube_playlist, spotify_channel.get(name))
+               for name, youtube_playlist in zip(playlist_names, youtube_playlists)]
 
     # add tracks
-    spotify_playlist.add_tracks(youtube_playlist)
+    if trace_file is None:
+        sync_playlists(mapping)
+    else:
+        with tracing.trace(trace_file):
+            sync_playlists(mapping)
+        print(tracing.format_summary())
 
 
 
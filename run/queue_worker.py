@@ -0,0 +1,49 @@
+import fire
+
+from bes import set_verbosity
+from bes.channel import SpotifyChannel
+from bes.metrics import METRICS, JsonLinesSink
+from bes.pagination import MAX_WORKERS
+from bes.playlist import YouTubePlayList
+from bes.sync import fetch_playlists
+from bes.workqueue import QUEUE_PATH, WorkQueue, enqueue_add_tracks, work
+from run.from_youtube_to_spotify import MAPPING
+
+
+def enqueue(playlist_name=None, db=str(QUEUE_PATH), verbosity='INFO'):
+    """
+    Enqueue the sync of one playlist of MAPPING, or all of them if no name is
+    given, to be run by workers (see `work`).
+
+    """
+    set_verbosity(verbosity)
+    spotify_channel = SpotifyChannel()
+    playlist_names = list(MAPPING) if playlist_name is None else [playlist_name]
+    mapping = [(YouTubePlayList(id=MAPPING[name], name=name), spotify_channel.get(name))
+               for name in playlist_names]
+    fetch_playlists([source for source, _ in mapping])
+    queue = WorkQueue(db)
+    for source, target in mapping:
+        enqueue_add_tracks(queue, source, target)
+    print(queue.counts())
+
+
+def worker(db=str(QUEUE_PATH), threads=MAX_WORKERS, verbosity='INFO', metrics_file=None):
+    """
+    Run `threads` workers until the queue is finished. Start as many worker
+    processes as needed, on this host (or others, see bes.workqueue).
+
+    """
+    set_verbosity(verbosity)
+    if metrics_file is not None:
+        METRICS.add_sink(JsonLinesSink(metrics_file))
+    print(f'{work(WorkQueue(db), threads=threads)} tasks run')
+
+
+def status(db=str(QUEUE_PATH)):
+    """Number of tasks by kind and state."""
+    print(WorkQueue(db).counts())
+
+
+if __name__ == '__main__':
+    fire.Fire({'enqueue': enqueue, 'worker': worker, 'status': status})
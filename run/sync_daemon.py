@@ -0,0 +1,31 @@
+import fire
+
+from bes import set_verbosity
+from bes.channel import SpotifyChannel, YouTubeChannel
+from bes.daemon import SyncDaemon
+from bes.metrics import METRICS, PrometheusSink
+from run.from_youtube_to_spotify import MAPPING
+
+
+def main(interval=60, port=8765, verbosity='INFO', metrics_file=None):
+    """
+    Keep the YouTube playlists of MAPPING synced to Spotify, checking for
+    changes every `interval` seconds. Status is served on
+    http://localhost:<port>/status. Metrics are written to metrics_file
+    (Prometheus text format) after each pass if provided.
+
+    """
+    set_verbosity(verbosity)
+    if metrics_file is not None:
+        METRICS.add_sink(PrometheusSink(metrics_file))
+    youtube_channel = YouTubeChannel()
+    spotify_channel = SpotifyChannel()
+    mapping = [(youtube_channel[playlist_id], spotify_channel.get(name))
+               for name, playlist_id in MAPPING.items()]
+    daemon = SyncDaemon(mapping, channels=[youtube_channel, spotify_channel])
+    daemon.serve_status(port=port)
+    daemon.run_forever(interval=interval)
+
+
+if __name__ == '__main__':
+    fire.Fire(main)
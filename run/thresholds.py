@@ -0,0 +1,21 @@
+import fire
+
+from bes.candidates import CandidateStore
+
+
+def sweep(backend='spotify', start=0., stop=2., step=0.1):
+    """
+    Number of tracks matched on backend at each risk threshold, from the
+    candidates recorded while matching (see bes.candidates), without any
+    request.
+
+    """
+    store = CandidateStore.open(backend)
+    n_steps = int(round((stop - start) / step))
+    thresholds = [round(start + i * step, 6) for i in range(n_steps + 1)]
+    for threshold, n_matched in store.sweep(thresholds).items():
+        print(f'{threshold:.2f}\t{n_matched}/{len(store)}')
+
+
+if __name__ == '__main__':
+    fire.Fire(sweep)